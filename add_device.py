@@ -1,107 +1,415 @@
+"""
+Provision (or clean up) the SIM devices used by the simulators.
+
+Creation is a pipeline: a fixed pool of workers pulls names from a lazy
+generator and POSTs them, while an AIMD limit on in-flight requests grows as
+long as the server answers quickly and is cut back on errors or slow
+responses. Progress is printed at most every --progress-every seconds and a
+JSON checkpoint is written with it, so an interrupted run resumes where it
+stopped without re-downloading the device list. --cleanup deletes devices by
+uniqueId prefix through the same pipeline.
+
+Examples:
+  python3 add_device.py --limit 100100
+  python3 add_device.py --cleanup --prefix SIMU --yes
+"""
+
 import aiohttp
 import asyncio
+import itertools
+import json
 import os
 import time
+from collections import defaultdict
 from datetime import datetime, timezone
+from functools import partial
 from dotenv import load_dotenv
 import argparse
 import requests
 
-def create_device_async(api_key, missing):
-    base_url = os.getenv("TRACCAR_BASE_URL")
-    api_hdrs = {
+import device_registry
+from json_stream import CHUNK_SIZE, iter_items
+
+NAME_PREFIX = "SIMU"
+NAME_CHARS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+NAME_LENGTH = 5
+MAX_ATTEMPTS = 3
+REGISTRY_FLUSH = 5000
+
+
+class AdaptiveConcurrency:
+    """AIMD limit on in-flight requests driven by observed latency and errors.
+
+    Every fast success adds 1/limit (about +1 per round trip of the whole
+    window); an error or a response slower than target_ms multiplies the
+    limit by `backoff`, at most once per `cooldown` seconds.
+    """
+
+    def __init__(self, start, lo, hi, target_ms, backoff=0.7, cooldown=1.0):
+        self.limit = float(max(lo, min(start, hi)))
+        self.lo = lo
+        self.hi = hi
+        self.target_ms = target_ms
+        self.backoff = backoff
+        self.cooldown = cooldown
+        self.active = 0
+        self._last_cut = 0.0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.active < int(self.limit))
+            self.active += 1
+
+    async def release(self):
+        async with self._cond:
+            self.active -= 1
+            self._cond.notify_all()
+
+    def observe(self, latency_ms, ok):
+        if ok and latency_ms <= self.target_ms:
+            self.limit = min(self.hi, self.limit + 1.0 / self.limit)
+            return
+        now = time.monotonic()
+        if now - self._last_cut >= self.cooldown:
+            self.limit = max(self.lo, self.limit * self.backoff)
+            self._last_cut = now
+
+
+def api_headers(api_key):
+    return {
         "Content-Type": "application/json",
         "Accept": "application/json",
         "Authorization": f"Bearer {api_key}"
     }
-    create_url = f"{base_url}/api/devices"
 
-    async def create_all():
-        timeout = aiohttp.ClientTimeout(total=15)
-        sem = asyncio.Semaphore(1000)  # limit burst concurrency
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            async def create_one(name):
-                payload = {
-                    "name": name,
-                    "uniqueId": name,
-                    "status": "online",
-                    "lastUpdate": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
-                }
-                for attempt in range(3):
-                    try:
-                        async with sem:
-                            async with session.post(create_url, headers=api_hdrs, json=payload) as resp:
-                                if resp.status in (200, 201):
-                                    print(f"[{resp.status}] {name} created")
-                                    return True
-                                txt = await resp.text()
-                                print(f"[{resp.status}] {name} attempt {attempt+1}: {txt[:100]}")
-                    except Exception as e:
-                        print(f"[EXC] {name} attempt {attempt+1}: {e}")
-                        await asyncio.sleep(0.5 * (attempt + 1))
-                return False
-
-            started = time.time()
-            results = await asyncio.gather(*(asyncio.create_task(create_one(n)) for n in missing))
-            ok = sum(results)
-            print(f"Created {ok}/{len(missing)} devices in {time.time() - started:.1f}s")
-
-    asyncio.run(create_all())
+
+def iter_alphanumeric_names(start=0, skip=frozenset()):
+    """Yield (index, name) for SIMU + 5 alphanumeric chars (0-9, A-Z), from position `start`.
+
+    Same order as indexing chars[(i // 36**j) % 36] for j in 0..4 (first char
+    varies fastest), but built incrementally by itertools.product.
+    """
+    combos = itertools.product(NAME_CHARS, repeat=NAME_LENGTH)
+    for index, combo in enumerate(itertools.islice(combos, start, None), start):
+        name = NAME_PREFIX + "".join(reversed(combo))
+        if name not in skip:
+            yield index, name
+
+
+def name_index(name):
+    """Position of a generated name in iter_alphanumeric_names order."""
+    index = 0
+    for c in reversed(name[len(NAME_PREFIX):]):
+        index = index * len(NAME_CHARS) + NAME_CHARS.index(c)
+    return index
+
 
 def get_existing_device_names(api_key):
     base_url = os.getenv("TRACCAR_BASE_URL")
-    api_hdrs = {
-        "Content-Type": "application/json",
-        "Accept": "application/json",
-        "Authorization": f"Bearer {api_key}"
-    }
     url = f"{base_url.rstrip('/')}/api/devices"
     try:
-        resp = requests.get(url, headers=api_hdrs, timeout=10)
-        resp.raise_for_status()
-        devices = resp.json()
-        names = {d["name"] for d in devices if "name" in d}
+        with requests.get(url, headers=api_headers(api_key), timeout=10, stream=True) as resp:
+            resp.raise_for_status()
+            names = {d["name"] for d in iter_items(resp.iter_content(CHUNK_SIZE)) if "name" in d}
         return names
     except Exception as e:
         print(f"Error fetching existing devices: {e}")
         return set()
 
 
-def generate_alphanumeric_names(range_length:int, existing_names:list[str]) -> set:
+def get_devices_by_prefix(base_url, api_key, prefix):
+    """Return [(id, uniqueId)] of the devices whose uniqueId starts with prefix."""
+    with requests.get(f"{base_url.rstrip('/')}/api/devices", headers=api_headers(api_key),
+                      timeout=60, stream=True) as resp:
+        resp.raise_for_status()
+        return [(d["id"], d["uniqueId"]) for d in iter_items(resp.iter_content(CHUNK_SIZE))
+                if d.get("uniqueId", "").startswith(prefix)]
+
+
+def load_checkpoint(path, base_url):
+    if not path or not os.path.exists(path):
+        return None
+    with open(path) as f:
+        checkpoint = json.load(f)
+    return checkpoint if checkpoint.get("base_url") == base_url.rstrip("/") else None
+
+
+def save_checkpoint(path, checkpoint):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp, path)
+
+
+async def timed_request(session, limiter, method, url, **kwargs):
+    """Issue one request and feed its latency/outcome to the limiter; returns (status, body text)."""
+    t0 = time.perf_counter()
+    try:
+        async with session.request(method, url, **kwargs) as resp:
+            body = await resp.text()
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        limiter.observe((time.perf_counter() - t0) * 1000.0, False)
+        raise
+    limiter.observe((time.perf_counter() - t0) * 1000.0, resp.status < 500 and resp.status != 429)
+    return resp.status, body
+
+
+async def run_pipeline(jobs, handle, limiter, workers, progress_every, on_progress):
+    """Run handle(job) for every job on `workers` tasks gated by the adaptive limiter.
+
+    handle returns an outcome name; the returned dict counts jobs per outcome.
+    on_progress(counts, elapsed) is called every progress_every seconds and once at the end.
     """
-    Generate 6 alphanumeric character combinations (0-9, A-Z).
+    counts = defaultdict(int)
+    started = time.monotonic()
+
+    async def worker():
+        while True:
+            # Take the job only once a slot is free, so jobs start in generator order
+            await limiter.acquire()
+            try:
+                job = next(jobs, None)
+                if job is None:
+                    return
+                counts[await handle(job)] += 1
+            finally:
+                await limiter.release()
+
+    async def progress():
+        while True:
+            await asyncio.sleep(progress_every)
+            on_progress(counts, time.monotonic() - started)
+
+    reporter = asyncio.create_task(progress())
+    try:
+        await asyncio.gather(*(worker() for _ in range(workers)))
+    finally:
+        reporter.cancel()
+        on_progress(counts, time.monotonic() - started)
+    return counts
+
+
+def create_devices(base_url, api_key, checkpoint, args, skip=frozenset()):
+    """Create the devices still missing according to `checkpoint`, saving it as the run progresses.
+
+    checkpoint: target (devices this campaign creates), done_count, next_index
+    (every name before it is handled), done (names at or after next_index that
+    are already handled) and retry (names that failed in an earlier run).
     """
-    chars = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
-    names = set()
-    i = 1
-    for i in range(36**6):
-        name = f"SIMU{''.join([chars[(i // (36**j)) % 36] for j in range(5)])}"
-        if name not in existing_names:
-            names.add(name)
-        if len(names) >= range_length:
-            break
-    return names
-    
+    create_url = f"{base_url.rstrip('/')}/api/devices"
+    hdrs = api_headers(api_key)
+    limiter = AdaptiveConcurrency(args.start_workers, args.min_workers, args.workers, args.target_latency_ms)
+    total = checkpoint["target"] - checkpoint["done_count"]
+    retries = list(checkpoint["retry"])
+    skip = set(skip) | set(checkpoint["done"])
+    fresh = itertools.islice(iter_alphanumeric_names(checkpoint["next_index"], skip), max(0, total - len(retries)))
+    jobs = itertools.chain(((None, name) for name in retries), fresh)
+
+    inflight = set()
+    handled = {}  # index -> name handled in this run, pruned to those past the resume mark
+    failed = []
+    pending_registry = []
+    state = {"issued": checkpoint["next_index"], "retries_started": 0}
+
+    async def create_one(session, job):
+        index, name = job
+        if index is None:
+            state["retries_started"] += 1
+        else:
+            inflight.add(index)
+            state["issued"] = index + 1
+        payload = {
+            "name": name,
+            "uniqueId": name,
+            "status": "online",
+            "lastUpdate": datetime.now(timezone.utc).isoformat().replace("+00:00", "Z")
+        }
+        # A cancelled (interrupted) job stays in `inflight`, so the checkpoint resumes at it
+        outcome = await post_device(session, name, payload)
+        if index is not None:
+            inflight.discard(index)
+            handled[index] = name
+        return outcome
+
+    async def post_device(session, name, payload):
+        for attempt in range(MAX_ATTEMPTS):
+            try:
+                status, body = await timed_request(session, limiter, "POST", create_url, headers=hdrs, json=payload)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = f"{type(e).__name__}: {e}"
+            else:
+                if status in (200, 201):
+                    device = json.loads(body)
+                    pending_registry.append((device["id"], device["uniqueId"]))
+                    return "created"
+                if status == 400 and await device_exists(session, name):
+                    return "exists"  # created by an interrupted run after its last checkpoint
+                error = f"[{status}] {body[:100]}"
+            await asyncio.sleep(0.5 * (attempt + 1))
+        print(f"[FAIL] {name} after {MAX_ATTEMPTS} attempts: {error}")
+        failed.append(name)
+        return "failed"
+
+    async def device_exists(session, name):
+        """Whether uniqueId `name` is registered; the duplicate error text differs per database."""
+        try:
+            status, body = await timed_request(session, limiter, "GET", create_url, headers=hdrs,
+                                               params={"uniqueId": name})
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return False
+        return status == 200 and any(d.get("uniqueId") == name for d in json.loads(body))
+
+    def on_progress(counts, elapsed):
+        done = sum(counts.values())
+        rate = done / elapsed if elapsed > 0 else 0.0
+        eta = (total - done) / rate if rate > 0 else float("nan")
+        print(f"[{time.strftime('%H:%M:%S')}] {done}/{total} created={counts['created']} "
+              f"exists={counts['exists']} failed={counts['failed']} rate={rate:.0f}/s "
+              f"limit={int(limiter.limit)} eta={eta:.0f}s")
+        if len(pending_registry) >= REGISTRY_FLUSH:
+            device_registry.add_devices(base_url, pending_registry)
+            pending_registry.clear()
+        if not args.checkpoint:
+            return
+        mark = min(inflight) if inflight else state["issued"]
+        for index in [i for i in handled if i < mark]:
+            del handled[index]
+        save_checkpoint(args.checkpoint, {
+            "base_url": base_url.rstrip("/"),
+            "target": checkpoint["target"],
+            "done_count": checkpoint["done_count"] + counts["created"] + counts["exists"],
+            "next_index": mark,
+            "done": sorted(list(handled.values()) + [n for n in checkpoint["done"] if name_index(n) >= mark]),
+            "retry": retries[state["retries_started"]:] + failed,
+        })
+
+    async def create_all():
+        timeout = aiohttp.ClientTimeout(total=15)
+        connector = aiohttp.TCPConnector(limit=args.workers)
+        async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+            return await run_pipeline(jobs, partial(create_one, session), limiter, args.workers, args.progress_every, on_progress)
+
+    try:
+        counts = asyncio.run(create_all())
+    finally:
+        if pending_registry:
+            device_registry.add_devices(base_url, pending_registry)
+    if counts["exists"]:
+        # Their ids are unknown here, so the cache can no longer be complete
+        device_registry.invalidate()
+    return total, counts
+
+
+def delete_devices(base_url, api_key, devices, args):
+    """Delete every (id, uniqueId) in `devices` through the adaptive pipeline."""
+    hdrs = api_headers(api_key)
+    limiter = AdaptiveConcurrency(args.start_workers, args.min_workers, args.workers, args.target_latency_ms)
+    removed = []
+
+    async def delete_one(session, device):
+        device_id, unique_id = device
+        url = f"{base_url.rstrip('/')}/api/devices/{device_id}"
+        for attempt in range(MAX_ATTEMPTS):
+            try:
+                status, body = await timed_request(session, limiter, "DELETE", url, headers=hdrs)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                error = f"{type(e).__name__}: {e}"
+            else:
+                if status in (200, 204, 404):
+                    removed.append(device_id)
+                    return "missing" if status == 404 else "deleted"
+                error = f"[{status}] {body[:100]}"
+            await asyncio.sleep(0.5 * (attempt + 1))
+        print(f"[FAIL] delete {unique_id} (id {device_id}): {error}")
+        return "failed"
+
+    def on_progress(counts, elapsed):
+        done = sum(counts.values())
+        rate = done / elapsed if elapsed > 0 else 0.0
+        print(f"[{time.strftime('%H:%M:%S')}] {done}/{len(devices)} deleted={counts['deleted']} "
+              f"missing={counts['missing']} failed={counts['failed']} rate={rate:.0f}/s limit={int(limiter.limit)}")
+
+    async def delete_all():
+        timeout = aiohttp.ClientTimeout(total=15)
+        connector = aiohttp.TCPConnector(limit=args.workers)
+        async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+            return await run_pipeline(iter(devices), partial(delete_one, session), limiter, args.workers,
+                                      args.progress_every, on_progress)
+
+    counts = asyncio.run(delete_all())
+    device_registry.remove_devices(base_url, removed)
+    return counts
+
+
+def parse_args():
+    ap = argparse.ArgumentParser(description="Provision or clean up SIM devices in Traccar")
+    ap.add_argument("--limit", type=int, default=100100, help="Total devices the server should end up with")
+    ap.add_argument("--workers", type=int, default=256, help="Upper bound on concurrent requests")
+    ap.add_argument("--min-workers", type=int, default=4, help="Lower bound for the adaptive concurrency limit")
+    ap.add_argument("--start-workers", type=int, default=32, help="Initial adaptive concurrency limit")
+    ap.add_argument("--target-latency-ms", type=float, default=250.0,
+                    help="Responses slower than this shrink the concurrency limit")
+    ap.add_argument("--progress-every", type=float, default=5.0, help="Seconds between progress lines/checkpoints")
+    ap.add_argument("--checkpoint", default="add_device.checkpoint.json",
+                    help="Resume file for interrupted provisioning ('' to disable)")
+    ap.add_argument("--fresh", action="store_true", help="Ignore an existing checkpoint")
+    ap.add_argument("--cleanup", action="store_true", help="Delete devices whose uniqueId starts with --prefix")
+    ap.add_argument("--prefix", default=NAME_PREFIX, help="uniqueId prefix for --cleanup")
+    ap.add_argument("--yes", action="store_true", help="Actually delete in --cleanup mode (otherwise only count)")
+    ap.add_argument("--refresh-device-cache", action="store_true",
+                    help="Only re-download the SIM device list into the simulators' device cache")
+    return ap.parse_args()
+
 
 if __name__ == "__main__":
     load_dotenv()  # load environment variables from .env file if present
 
+    args = parse_args()
     api_key = os.getenv("TRACCAR_API_KEY")
+    base_url = os.getenv("TRACCAR_BASE_URL")
 
-    device_limit = 100100  # max devices to create
+    if args.refresh_device_cache:
+        devices = device_registry.fetch_sim_devices(base_url, api_key)
+        device_registry.store(base_url, devices)
+        print(f"Stored {len(devices)} SIM devices in {device_registry.cache_path()}")
+        exit(0)
 
-    device_names = get_existing_device_names(api_key)
-    total_existing = len(device_names)
-    if total_existing >= device_limit:
-        print(f"Device limit reached ({total_existing}/{device_limit}). No new devices will be created.")
+    if args.cleanup:
+        devices = get_devices_by_prefix(base_url, api_key, args.prefix)
+        print(f"Found {len(devices)} devices with uniqueId prefix {args.prefix!r}")
+        if not args.yes:
+            print("Dry run; pass --yes to delete them.")
+            exit(0)
+        started = time.time()
+        counts = delete_devices(base_url, api_key, devices, args)
+        print(f"Deleted {counts['deleted']}/{len(devices)} devices in {time.time() - started:.1f}s "
+              f"({counts['missing']} already gone, {counts['failed']} failed)")
         exit(0)
-    to_be_created = device_limit - total_existing
-    print(f"Total existing devices: {len(device_names)}")
-    print(f"Existing device names sample: {list(device_names)[:5]} ... {list(device_names)[-5:]}")
 
-    # Generate expected device names
-    expected_device_names = {i for i in generate_alphanumeric_names(to_be_created, device_names)}
-    print(f"Generated {len(expected_device_names)} expected device names")
-    print(f"Sample names: {list(expected_device_names)[:5]} ... {list(expected_device_names)[-5:]}")
+    checkpoint = None if args.fresh else load_checkpoint(args.checkpoint, base_url)
+    existing = set()
+    if checkpoint:
+        print(f"Resuming from {args.checkpoint}: {checkpoint['done_count']}/{checkpoint['target']} done, "
+              f"{len(checkpoint['retry'])} to retry, continuing at name #{checkpoint['next_index']}")
+    else:
+        existing = get_existing_device_names(api_key)
+        total_existing = len(existing)
+        if total_existing >= args.limit:
+            print(f"Device limit reached ({total_existing}/{args.limit}). No new devices will be created.")
+            exit(0)
+        print(f"Total existing devices: {total_existing}")
+        checkpoint = {"target": args.limit - total_existing, "done_count": 0, "next_index": 0, "done": [], "retry": []}
 
-    create_device_async(api_key, expected_device_names)
\ No newline at end of file
+    started = time.time()
+    try:
+        total, counts = create_devices(base_url, api_key, checkpoint, args, skip=existing)
+    except KeyboardInterrupt:
+        print(f"Interrupted; re-run to resume from {args.checkpoint}" if args.checkpoint else "Interrupted")
+        exit(1)
+    print(f"Created {counts['created']}/{total} devices in {time.time() - started:.1f}s "
+          f"({counts['exists']} already existed, {counts['failed']} failed)")
+    if counts["failed"]:
+        print(f"Re-run to retry the failed devices (checkpoint {args.checkpoint})")
+    elif args.checkpoint and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
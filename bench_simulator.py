@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Self-benchmarks for the simulator tooling.
+
+Measures the generator's hot paths (fleet stepping, send scheduling, OsmAnd
+URL and raw request rendering, latency histogram record/percentile, tier analysis) and an
+end-to-end loopback run against fake_traccar_server.py at fixed device
+counts, once per OsmAnd HTTP transport (aiohttp, raw_http.py) so their
+requests per second per generator core can be compared. Results are compared with bench_baseline.json; any metric that is
+worse than its baseline by more than --tolerance fails the run, so generator
+changes cannot quietly shift the capacity numbers we publish.
+
+Metrics ending in _per_sec are higher-is-better; all others (times, CPU per
+request, RSS) are lower-is-better. transport_<name>_core_req_per_sec is
+requests completed per CPU-second of the generator process, i.e. the rate
+one fully busy core would sustain with that transport.
+
+Usage:
+  python3 bench_simulator.py                     # compare with the baseline
+  python3 bench_simulator.py --update-baseline   # record a new baseline on this machine
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import resource
+import socket
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(HERE, "bench_baseline.json")
+E2E_DEVICE_COUNTS = (2000, 5000)
+E2E_DURATION = 6
+E2E_INTERVAL = 1
+TRANSPORT_DEVICES = 5000
+TRANSPORTS = ("aiohttp", "raw")
+
+
+def timed(fn, min_time=0.5):
+    """Call fn() repeatedly for at least min_time seconds; returns seconds per call."""
+    fn()  # warm up
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        fn()
+        calls += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return elapsed / calls
+
+
+def bench_fleet_advance():
+    from fleet_state import FleetState
+    fleet = FleetState(range(1, 100001), 42)
+    cohort = list(range(0, 100000, 100))  # 1000 devices due in one tick
+    per_call = timed(lambda: fleet.advance(cohort, 30))
+    return {"fleet_advance_slots_per_sec": len(cohort) / per_call}
+
+
+def bench_scheduler():
+    from send_scheduler import SendScheduler
+    slots = list(range(10000))
+
+    def cycle():
+        sched = SendScheduler(send=None, workers=1, interval=30, stop_time=float("inf"))
+        now = time.monotonic()
+        for slot in slots:
+            sched.add(slot, now)
+        sched._dispatch(sched._collect(sched._next_tick + 1))
+
+    per_call = timed(cycle)
+    return {"scheduler_slots_per_sec": len(slots) / per_call}
+
+
+def bench_osmand_url():
+    import osmand_request
+    import raw_http
+    n = 1000
+    args = [(i, 10.3 + i * 1e-5, 123.9 - i * 1e-5, 25.0, 180.0) for i in range(n)]
+    url_template = osmand_request.OsmandTemplate("http://127.0.0.1:5055/")
+    raw_template = osmand_request.OsmandTemplate("http://127.0.0.1:5055/",
+                                                 raw_http.RawHttpSession("http://127.0.0.1:5055/"))
+
+    def build(render):
+        def run():
+            for a in args:
+                render(osmand_request.values(*a))
+        return run
+
+    return {"osmand_url_per_sec": n / timed(build(url_template.url)),
+            "osmand_request_per_sec": n / timed(build(lambda vals: raw_template.request_format % vals))}
+
+
+def bench_histogram():
+    from latency_histogram import LatencyHistogram
+    rng = random.Random(1)
+    values = [rng.lognormvariate(3, 1) for _ in range(100000)]
+    hist = LatencyHistogram()
+
+    def record():
+        for v in values:
+            hist.record(v)
+
+    record_per_call = timed(record)
+    pct_per_call = timed(lambda: (hist.percentile(50), hist.percentile(90), hist.percentile(99)))
+    return {
+        "histogram_record_per_sec": len(values) / record_per_call,
+        "histogram_pct_us": pct_per_call / 3 * 1e6,
+    }
+
+
+def bench_analyze_tier():
+    try:
+        import generate_metrics_summary
+    except ImportError:
+        print("  (pandas not installed; skipping analyze_droplet_tier)")
+        return {}
+    import glob
+    tiers = sorted(glob.glob(os.path.join(HERE, "reports", "droplet_*_reports", "")))
+    if not tiers:
+        return {}
+
+    def analyze():
+        # analyze_droplet_tier warns about unreadable CSVs on every call
+        with contextlib.redirect_stdout(io.StringIO()):
+            for tier in tiers:
+                generate_metrics_summary.analyze_droplet_tier(tier)
+
+    return {"analyze_tier_ms": timed(analyze) / len(tiers) * 1000}
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def e2e_child(devices, port, transport="aiohttp"):
+    """Run one loopback level in this (fresh) process and print its measurements as JSON."""
+    import sim_traccar_osmand_ramp as sim
+    args = sim.parse_args(["--interval", str(E2E_INTERVAL), "--duration", str(E2E_DURATION),
+                           "--concurrency", "500", "--devices", str(devices), "--transport", transport])
+    base_url = f"http://127.0.0.1:{port}"
+    cpu0 = time.process_time()
+    wall0 = time.perf_counter()
+    stats = asyncio.run(sim.run_load(args, base_url, list(range(1, devices + 1))))
+    wall = time.perf_counter() - wall0
+    cpu = time.process_time() - cpu0
+    print(json.dumps({
+        "count": stats["count"], "ok": stats["ok"], "wall": wall, "cpu": cpu,
+        "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }))
+
+
+def _e2e_run(devices, port, transport="aiohttp"):
+    out = subprocess.run([sys.executable, os.path.abspath(__file__), "--e2e-child", str(devices), "--port", str(port),
+                          "--transport", transport],
+                         capture_output=True, text=True, check=True, cwd=HERE).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+@contextlib.contextmanager
+def _fake_server():
+    port = _free_port()
+    server = subprocess.Popen([sys.executable, os.path.join(HERE, "fake_traccar_server.py"), "--port", str(port)],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        time.sleep(1.0)
+        yield port
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def bench_e2e():
+    results = {}
+    with _fake_server() as port:
+        for devices in E2E_DEVICE_COUNTS:
+            run = _e2e_run(devices, port)
+            count = max(1, run["count"])
+            results[f"e2e_{devices}_ok_per_sec"] = run["ok"] / E2E_DURATION
+            results[f"e2e_{devices}_cpu_us_per_req"] = run["cpu"] / count * 1e6
+            results[f"e2e_{devices}_peak_rss_mb"] = run["rss_mb"]
+    return results
+
+
+def bench_transport():
+    results = {}
+    with _fake_server() as port:
+        for transport in TRANSPORTS:
+            run = _e2e_run(TRANSPORT_DEVICES, port, transport)
+            results[f"transport_{transport}_core_req_per_sec"] = run["count"] / max(run["cpu"], 1e-9)
+            results[f"transport_{transport}_ok_per_sec"] = run["ok"] / E2E_DURATION
+    base = results["transport_aiohttp_core_req_per_sec"]
+    print(f"  requests per generator core-second: "
+          + ", ".join(f"{t} {results[f'transport_{t}_core_req_per_sec']:.0f}" for t in TRANSPORTS)
+          + f" (raw/aiohttp {results['transport_raw_core_req_per_sec'] / base:.2f}x)")
+    return results
+
+
+BENCHMARKS = [
+    ("fleet_advance", bench_fleet_advance),
+    ("scheduler", bench_scheduler),
+    ("osmand_url", bench_osmand_url),
+    ("histogram", bench_histogram),
+    ("analyze_tier", bench_analyze_tier),
+    ("e2e_loopback", bench_e2e),
+    ("transport", bench_transport),
+]
+
+
+def compare(results, baseline, tolerance):
+    """Print a comparison table; return the names of regressed metrics."""
+    regressions = []
+    print(f"\n{'metric':36} {'baseline':>14} {'current':>14} {'change':>8}")
+    for name, value in sorted(results.items()):
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:36} {'-':>14} {value:14.2f} {'new':>8}")
+            continue
+        change = (value - base) / base if base else 0.0
+        higher_is_better = name.endswith("_per_sec")
+        worse = -change if higher_is_better else change
+        flag = ""
+        if worse > tolerance:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:36} {base:14.2f} {value:14.2f} {change:+8.1%}{flag}")
+    return regressions
+
+
+def parse_args():
+    ap = argparse.ArgumentParser(description="Benchmark the simulator hot paths against a tracked baseline")
+    ap.add_argument("--baseline", default=BASELINE_PATH, help="Baseline JSON file")
+    ap.add_argument("--update-baseline", action="store_true", help="Write the current results as the new baseline")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="Allowed fractional regression per metric")
+    ap.add_argument("--only", nargs="*", help="Run only these benchmarks")
+    ap.add_argument("--e2e-child", type=int, help=argparse.SUPPRESS)
+    ap.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    ap.add_argument("--transport", default="aiohttp", help=argparse.SUPPRESS)
+    return ap.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.e2e_child:
+        e2e_child(args.e2e_child, args.port, args.transport)
+        return 0
+
+    results = {}
+    for name, fn in BENCHMARKS:
+        if args.only and name not in args.only:
+            continue
+        print(f"Running {name} ...")
+        results.update(fn())
+
+    if args.update_baseline or not os.path.exists(args.baseline):
+        with open(args.baseline, "w") as f:
+            json.dump({
+                "machine": {"host": platform.node(), "python": platform.python_version(),
+                            "processor": platform.processor() or platform.machine(), "cpus": os.cpu_count()},
+                "recorded": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "metrics": results,
+            }, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"Baseline written to {args.baseline}")
+        compare(results, {}, args.tolerance)
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline["metrics"], args.tolerance)
+    if regressions:
+        print(f"\n{len(regressions)} metric(s) regressed by more than {args.tolerance:.0%}: {', '.join(regressions)}")
+        return 1
+    print("\nNo regressions beyond tolerance")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
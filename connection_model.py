@@ -0,0 +1,83 @@
+"""
+Connection lifecycle of the simulated devices (--connection-model).
+
+  pool     a shared pool of at most --concurrency keep-alive sockets (default;
+           what aiohttp's TCPConnector does)
+  device   every device holds its own keep-alive socket between reports, idle
+           most of the time, like a tracker with a persistent connection;
+           needs --transport raw (raw_http.py), since aiohttp cannot pin a
+           pooled connection to a device
+  request  connect, send one report and close, like trackers that reconnect
+           per report (aiohttp: force_close)
+
+TCP tracker protocols (tcp_fleet.py) always use one socket per device.
+
+Every connection opened is counted and its setup time (TCP connect, plus
+TLS for https) recorded in connect_hist, separately from the request
+latency histograms. Those still measure a send as the device sees it, so a
+send that had to connect includes the connect time there as well.
+"""
+
+import time
+
+import aiohttp
+
+from latency_histogram import LatencyHistogram
+from raw_http import MODELS
+
+
+def empty(hist_digits=3):
+    return {"connections": 0, "connect_hist": LatencyHistogram(significant_digits=hist_digits)}
+
+
+def effective(args):
+    """The model in use: TCP protocols are always per device."""
+    return "device" if getattr(args, "protocol", "osmand") != "osmand" else getattr(args, "connection_model", "pool")
+
+
+def recorder(stats):
+    """on_connect(ms) callback counting connections into `stats`."""
+    def on_connect(ms):
+        stats["connections"] += 1
+        stats["connect_hist"].record(ms)
+    return on_connect
+
+
+def aiohttp_trace(on_connect):
+    """TraceConfig that times aiohttp's connection setup into on_connect(ms)."""
+    trace = aiohttp.TraceConfig()
+
+    async def start(session, ctx, params):
+        ctx.connect_t0 = time.perf_counter()
+
+    async def end(session, ctx, params):
+        on_connect((time.perf_counter() - ctx.connect_t0) * 1000)
+
+    trace.on_connection_create_start.append(start)
+    trace.on_connection_create_end.append(end)
+    return trace
+
+
+def aiohttp_connector(model, limit, ssl=None):
+    return aiohttp.TCPConnector(limit=limit, ssl=ssl, force_close=model == "request")
+
+
+def check(args):
+    """Error message for an unsupported combination, or None."""
+    if getattr(args, "connection_model", "pool") == "device" and args.protocol == "osmand" and args.transport != "raw":
+        return "--connection-model device needs --transport raw (aiohttp shares its pooled sockets between devices)"
+    return None
+
+
+def summary_line(stats, duration):
+    hist = stats["connect_hist"]
+    if not stats["connections"]:
+        return None
+    return (f"Connections opened: {stats['connections']} ({stats['connections'] / max(1, duration):.2f}/s), "
+            f"setup P50 {hist.percentile(50):.1f} ms, P99 {hist.percentile(99):.1f} ms, max {hist.max:.1f} ms")
+
+
+def report_values(stats, args, duration):
+    hist = stats["connect_hist"]
+    return [effective(args), stats["connections"], f"{stats['connections'] / duration if duration > 0 else 0:.2f}",
+            f"{hist.percentile(50):.1f}", f"{hist.percentile(99):.1f}"]
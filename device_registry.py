@@ -0,0 +1,211 @@
+"""
+Persistent on-disk cache of the SIM devices registered in Traccar.
+
+Downloading /api/devices for 100k devices is itself a heavy request against
+the server under test, so the (id, uniqueId) pairs of the SIM devices are
+kept in a small SQLite file and reused across runs. Before reuse the cache is
+validated cheaply: a handful of cached ids spread over the range are fetched
+with GET /api/devices?id=..&id=.. and their uniqueIds compared. add_device.py
+keeps the cache current when it creates or deletes devices.
+
+When the list does have to be downloaded it is parsed incrementally (see
+json_stream.py) and only the (id, uniqueId) of SIM devices is kept;
+stream_sim_devices() hands out batches while the download is still running
+so the simulator can start launching devices before it finishes.
+
+The cache location defaults to .sim_devices.sqlite in the working directory
+and can be changed with the SIM_DEVICE_CACHE environment variable.
+"""
+
+import asyncio
+import os
+import sqlite3
+import time
+
+import aiohttp
+import requests
+
+from json_stream import CHUNK_SIZE, aiter_items, iter_items
+
+SIM_PREFIX = "SIM"
+VALIDATION_SAMPLES = 8
+STREAM_BATCH = 2000
+
+
+def cache_path():
+    return os.getenv("SIM_DEVICE_CACHE", ".sim_devices.sqlite")
+
+
+def api_headers(api_key):
+    return {"Accept": "application/json", "Authorization": f"Bearer {api_key}"}
+
+
+def _connect(path=None):
+    db = sqlite3.connect(path or cache_path())
+    db.execute("CREATE TABLE IF NOT EXISTS devices (id INTEGER PRIMARY KEY, unique_id TEXT NOT NULL)")
+    db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+    return db
+
+
+def _server_key(base_url):
+    return base_url.rstrip("/")
+
+
+def load_cached(base_url, path=None):
+    """Return cached [(id, uniqueId)] for base_url ordered by id, or None when there is no usable cache."""
+    if not os.path.exists(path or cache_path()):
+        return None
+    with _connect(path) as db:
+        row = db.execute("SELECT value FROM meta WHERE key = 'base_url'").fetchone()
+        if not row or row[0] != _server_key(base_url):
+            return None
+        devices = db.execute("SELECT id, unique_id FROM devices ORDER BY id").fetchall()
+    return devices or None
+
+
+def store(base_url, devices, path=None):
+    """Replace the cache with `devices` ([(id, uniqueId)]) for base_url."""
+    with _connect(path) as db:
+        db.execute("DELETE FROM devices")
+        db.executemany("INSERT INTO devices (id, unique_id) VALUES (?, ?)", devices)
+        db.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                       [("base_url", _server_key(base_url)), ("fetched_at", str(int(time.time())))])
+
+
+def add_devices(base_url, devices, path=None):
+    """Add newly created SIM devices to an existing cache for base_url.
+
+    Without a cache nothing is written: a cache holding only the new devices
+    would pass validation while missing every device created before.
+    """
+    if not os.path.exists(path or cache_path()):
+        return False
+    with _connect(path) as db:
+        row = db.execute("SELECT value FROM meta WHERE key = 'base_url'").fetchone()
+        if not row or row[0] != _server_key(base_url):
+            return False
+        db.executemany("INSERT OR REPLACE INTO devices (id, unique_id) VALUES (?, ?)",
+                       [(i, u) for i, u in devices if u.startswith(SIM_PREFIX)])
+    return True
+
+
+def invalidate(path=None):
+    """Forget the cached list so the next run re-downloads it."""
+    if os.path.exists(path or cache_path()):
+        with _connect(path) as db:
+            db.execute("DELETE FROM meta WHERE key = 'base_url'")
+
+
+def remove_devices(base_url, ids, path=None):
+    """Drop deleted device ids from the cache."""
+    if not os.path.exists(path or cache_path()):
+        return
+    with _connect(path) as db:
+        db.executemany("DELETE FROM devices WHERE id = ?", [(i,) for i in ids])
+
+
+def _sim_device(d):
+    unique_id = d.get("uniqueId", "")
+    return (d["id"], unique_id) if unique_id.startswith(SIM_PREFIX) else None
+
+
+def fetch_sim_devices(base_url, api_key, timeout=60):
+    """Download the full device list and return [(id, uniqueId)] of the SIM devices, ordered by id."""
+    with requests.get(f"{_server_key(base_url)}/api/devices", headers=api_headers(api_key),
+                      timeout=timeout, stream=True) as resp:
+        resp.raise_for_status()
+        total = 0
+        devices = []
+        for d in iter_items(resp.iter_content(CHUNK_SIZE)):
+            total += 1
+            sim = _sim_device(d)
+            if sim:
+                devices.append(sim)
+    print(f"Fetched {total} devices from Traccar")
+    devices.sort()
+    return devices
+
+
+def validate(base_url, api_key, devices, samples=VALIDATION_SAMPLES, timeout=20):
+    """Spot-check cached devices against the server with a single filtered /api/devices request."""
+    if not devices:
+        return False
+    step = max(1, (len(devices) - 1) // max(1, samples - 1))
+    picked = {devices[i] for i in range(0, len(devices), step)} | {devices[-1]}
+    params = [("id", i) for i, _ in picked]
+    try:
+        resp = requests.get(f"{_server_key(base_url)}/api/devices", headers=api_headers(api_key),
+                            params=params, timeout=timeout)
+        resp.raise_for_status()
+        found = {(d["id"], d.get("uniqueId")) for d in resp.json()}
+    except (requests.RequestException, ValueError, KeyError) as e:
+        print(f"Device cache validation failed: {e}")
+        return False
+    return picked <= found
+
+
+def _cached_if_valid(base_url, api_key, path):
+    cached = load_cached(base_url, path)
+    if cached and validate(base_url, api_key, cached):
+        print(f"Using {len(cached)} SIM devices from cache {path or cache_path()}")
+        return cached
+    if cached:
+        print("Device cache is stale; re-downloading device list")
+    return None
+
+
+def get_sim_devices(base_url, api_key, refresh=False, path=None):
+    """Return [(id, uniqueId)] of the SIM devices, from the validated cache when possible."""
+    if not refresh:
+        cached = _cached_if_valid(base_url, api_key, path)
+        if cached:
+            return cached
+    devices = fetch_sim_devices(base_url, api_key)
+    if devices:
+        store(base_url, devices, path)
+    return devices
+
+
+async def stream_sim_devices(base_url, api_key, refresh=False, path=None, batch=STREAM_BATCH, timeout=60):
+    """Async generator of [(id, uniqueId)] batches of SIM devices.
+
+    A valid cache is yielded as a single batch. Otherwise batches are yielded
+    in server order while /api/devices is still downloading, and the complete
+    list is stored in the cache once the download finishes. `timeout` bounds
+    connecting and each wait for more data, not the whole download: the
+    caller may take longer than that to consume the batches.
+    """
+    if not refresh:
+        cached = await asyncio.to_thread(_cached_if_valid, base_url, api_key, path)
+        if cached:
+            yield cached
+            return
+    devices = []
+    total = 0
+    pending = 0
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=None, sock_connect=timeout, sock_read=timeout)) as session:
+        async with session.get(f"{_server_key(base_url)}/api/devices", headers=api_headers(api_key)) as resp:
+            resp.raise_for_status()
+            async for d in aiter_items(resp.content.iter_chunked(CHUNK_SIZE)):
+                total += 1
+                sim = _sim_device(d)
+                if sim:
+                    devices.append(sim)
+                    if len(devices) - pending >= batch:
+                        yield devices[pending:]
+                        pending = len(devices)
+    if len(devices) > pending:
+        yield devices[pending:]
+    print(f"Fetched {total} devices from Traccar")
+    if devices:
+        devices.sort()
+        await asyncio.to_thread(store, base_url, devices, path)
+
+
+async def id_batches(device_ids):
+    """Pass through an async iterator of id batches, or yield a plain id list as one batch."""
+    if hasattr(device_ids, "__aiter__"):
+        async for ids in device_ids:
+            yield ids
+    else:
+        yield device_ids
@@ -0,0 +1,219 @@
+"""
+DigitalOcean Monitoring metrics for the time window a level ran in.
+
+All queries for a level (bandwidth in/out, CPU, memory, load 1/5/15, disk)
+go out concurrently on one pooled aiohttp session, so collecting them costs
+one API round trip and never blocks the event loop; with --continuous the
+fleet keeps sending while they are in flight. Each metric is reduced to
+mean, max and last over the samples that fall inside [start, end] of the
+level. The request reaches LOOKBACK_S further back only to anchor the first
+CPU counter delta and, for levels shorter than the droplet's sampling step,
+to fall back to the newest earlier sample (counted as do_stale).
+
+Result keys are the stats keys the CSV report uses (the mean) plus
+<key>_max and <key>_last. Outcomes are counted in the level's statuses as
+do_ok, do_empty, do_stale, do_http_<code>, do_error and do_skipped.
+
+Environment: DO_API_KEY, DO_DROPLET_ID and optionally DO_API_BASE_URL, e.g.
+the fake monitoring API of fake_traccar_server.py for offline runs.
+"""
+
+import asyncio
+import math
+import os
+import sys
+
+import aiohttp
+
+DEFAULT_API_BASE_URL = "https://api.digitalocean.com"
+METRICS_PATH = "/v2/monitoring/metrics/droplet/"
+TIMEOUT_S = 20
+LOOKBACK_S = 120
+# stats key -> decimals in the CSV report; ramp_report.REPORT_COLUMNS lists the _max/_last columns in this order
+METRICS = (
+    ("bandwidth_pub_out", 1),
+    ("bandwidth_pub_in", 1),
+    ("cpu_percent", 1),
+    ("memory_usage", 1),
+    ("load_1m", 2),
+    ("load_5m", 2),
+    ("load_15m", 2),
+    ("disk_usage_percent", 2),
+)
+# Queries sent for every level: name -> (metric path, extra query parameters)
+QUERIES = {
+    "bandwidth_out": ("bandwidth", {"interface": "public", "direction": "outbound"}),
+    "bandwidth_in": ("bandwidth", {"interface": "public", "direction": "inbound"}),
+    "cpu": ("cpu", {}),
+    "memory_total": ("memory_total", {}),
+    "memory_available": ("memory_available", {}),
+    "load_1": ("load_1", {}),
+    "load_5": ("load_5", {}),
+    "load_15": ("load_15", {}),
+    "filesystem_free": ("filesystem_free", {}),
+    "filesystem_size": ("filesystem_size", {}),
+}
+
+_NAN = float("nan")
+
+
+def configured(droplet_id=None):
+    """True when DO_API_KEY and a droplet id (argument or DO_DROPLET_ID) are set."""
+    return bool(os.getenv("DO_API_KEY") and (droplet_id or os.getenv("DO_DROPLET_ID")))
+
+
+def empty():
+    """All result keys set to nan."""
+    return {f"{key}{suffix}": _NAN for key, _ in METRICS for suffix in ("", "_max", "_last")}
+
+
+def report_values(stats):
+    """The _max/_last CSV cells of a level, in REPORT_COLUMNS order."""
+    return [f"{stats.get(key + suffix, _NAN):.{digits}f}" for key, digits in METRICS for suffix in ("_max", "_last")]
+
+
+def reduce(points):
+    """(mean, max, last) of a list of (ts, value) sorted by ts; nan when empty."""
+    if not points:
+        return _NAN, _NAN, _NAN
+    values = [v for _, v in points]
+    return sum(values) / len(values), max(values), values[-1]
+
+
+def _values(result):
+    points = []
+    for ts, value in result.get("values", []):
+        value = float(value)
+        if not math.isnan(value):
+            points.append((float(ts), value))
+    return sorted(points)
+
+
+def _window(points, start, end, statuses):
+    """Samples inside [start, end]; the newest earlier sample when there are none."""
+    inside = [p for p in points if start <= p[0] <= end]
+    if inside or not points:
+        return inside
+    earlier = [p for p in points if p[0] < start]
+    if earlier:
+        statuses["do_stale"] += 1
+        return earlier[-1:]
+    return []
+
+
+def _first_series(payload, prefer=None):
+    """Points of the first result (or the one whose labels include `prefer`)."""
+    results = payload.get("data", {}).get("result", []) if payload else []
+    if not results:
+        return []
+    if prefer:
+        for result in results:
+            if prefer.items() <= result.get("metric", {}).items():
+                return _values(result)
+    return _values(results[0])
+
+
+def _ratio_percent(used_of, total_points, other_points):
+    """Per-timestamp percentage used_of(total, other) / total * 100 over the timestamps both series have."""
+    other = dict(other_points)
+    return [(ts, used_of(total, other[ts]) / total * 100) for ts, total in total_points if ts in other and total > 0]
+
+
+def _cpu_intervals(payload, start, end, statuses):
+    """Busy percentage per sampling interval in [start, end], and over the whole window.
+
+    The cpu metric is a set of cumulative per-mode counters; utilisation of an
+    interval is 1 - idle delta / all-modes delta.
+    """
+    totals = {}
+    idle = {}
+    for result in (payload or {}).get("data", {}).get("result", []):
+        is_idle = result.get("metric", {}).get("mode") == "idle"
+        for ts, value in _values(result):
+            totals[ts] = totals.get(ts, 0.0) + value
+            if is_idle:
+                idle[ts] = idle.get(ts, 0.0) + value
+    stamps = sorted(ts for ts in totals if ts in idle)
+    deltas = {}
+    for prev, ts in zip(stamps, stamps[1:]):
+        d_total = totals[ts] - totals[prev]
+        if d_total > 0:  # skips counter resets (reboot)
+            deltas[ts] = (d_total - (idle[ts] - idle[prev]), d_total)
+    points = _window([(ts, busy / total * 100) for ts, (busy, total) in sorted(deltas.items())], start, end, statuses)
+    total_sum = sum(deltas[ts][1] for ts, _ in points)
+    mean = sum(deltas[ts][0] for ts, _ in points) / total_sum * 100 if total_sum > 0 else _NAN
+    return points, mean
+
+
+async def _query(session, base_url, metric, params, statuses):
+    try:
+        async with session.get(base_url + METRICS_PATH + metric, params=params) as resp:
+            statuses[f"do_http_{resp.status}"] += 1
+            if resp.status != 200:
+                print(f"[DO] {metric}: HTTP {resp.status}", file=sys.stderr)
+                return None
+            return await resp.json(content_type=None)
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+        print(f"[DO] {metric}: {e!r}", file=sys.stderr)
+        statuses["do_error"] += 1
+        return None
+
+
+async def collect(start, end, statuses, droplet_id=None, base_url=None):
+    """Fetch and reduce every droplet metric for the window [start, end] (epoch seconds).
+
+    Returns empty() values for metrics that could not be fetched, or for all of
+    them when the DigitalOcean credentials are not set.
+    """
+    api_key = os.getenv("DO_API_KEY")
+    droplet_id = droplet_id or os.getenv("DO_DROPLET_ID")
+    result = empty()
+    if not api_key or not droplet_id:
+        statuses["do_skipped"] += 1
+        return result
+    base_url = (base_url or os.getenv("DO_API_BASE_URL") or DEFAULT_API_BASE_URL).rstrip("/")
+    window = {"host_id": droplet_id, "start": str(int(start) - LOOKBACK_S), "end": str(math.ceil(end))}
+    headers = {"Authorization": f"Bearer {api_key}", "Accept": "application/json"}
+    connector = aiohttp.TCPConnector(limit=len(QUERIES))
+    async with aiohttp.ClientSession(connector=connector, headers=headers,
+                                     timeout=aiohttp.ClientTimeout(total=TIMEOUT_S)) as session:
+        payloads = await asyncio.gather(*(_query(session, base_url, metric, {**window, **extra}, statuses)
+                                          for metric, extra in QUERIES.values()))
+    data = dict(zip(QUERIES, payloads))
+
+    def series(name, prefer=None):
+        return _window(_first_series(data[name], prefer), start, end, statuses)
+
+    def store(key, points, mean=None):
+        if not points:
+            statuses["do_empty"] += 1
+            return
+        statuses["do_ok"] += 1
+        avg, result[f"{key}_max"], result[f"{key}_last"] = reduce(points)
+        result[key] = avg if mean is None else mean
+
+    # Bandwidth is reported in Mbps; the report has always used kbps
+    store("bandwidth_pub_out", [(ts, v * 1000) for ts, v in series("bandwidth_out")])
+    store("bandwidth_pub_in", [(ts, v * 1000) for ts, v in series("bandwidth_in")])
+    intervals, cpu_mean = _cpu_intervals(data["cpu"], start, end, statuses)
+    store("cpu_percent", intervals, cpu_mean)
+    store("memory_usage", _ratio_percent(lambda total, available: total - available,
+                                         series("memory_total"), series("memory_available")))
+    store("load_1m", series("load_1"))
+    store("load_5m", series("load_5"))
+    store("load_15m", series("load_15"))
+    root = {"mountpoint": "/"}
+    store("disk_usage_percent", _ratio_percent(lambda size, free: size - free,
+                                               series("filesystem_size", root), series("filesystem_free", root)))
+    return result
+
+
+def summary_line(stats):
+    """One-line host resource summary for the level printout, or None when nothing was collected."""
+    parts = []
+    for key, label, unit in (("cpu_percent", "CPU", "%"), ("memory_usage", "mem", "%"), ("load_1m", "load1", ""),
+                             ("bandwidth_pub_out", "out", " kbps"), ("bandwidth_pub_in", "in", " kbps")):
+        mean = stats.get(key, _NAN)
+        if not math.isnan(mean):
+            parts.append(f"{label} {mean:.1f}{unit} (max {stats[key + '_max']:.1f}, last {stats[key + '_last']:.1f})")
+    return "Host over level: " + ", ".join(parts) if parts else None
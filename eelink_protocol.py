@@ -0,0 +1,127 @@
+"""
+Eelink binary tracker protocol (TCP, Traccar port 5064 by default).
+
+Every frame is 0x67 0x67, a one-byte type, a big-endian 2-byte length of
+the rest and a 2-byte sequence number, followed by the type's content; TCP
+frames carry no checksum. A device logs in with its IMEI (0x01), then sends
+location packets (0x12, protocol 2.0: unix time, field mask, latitude and
+longitude in 1/1800000 degree, altitude, speed km/h, course, satellites,
+status) and heartbeats (0x03). Traccar answers login, heartbeat and location
+frames with the same type and sequence number.
+
+Each Device pre-allocates its location and heartbeat frames once; a send
+only writes the changing fields (sequence, time, fix) into the existing
+bytearray with struct.pack_into. The asyncio transport may keep a reference
+to a frame it could not send at once, so a frame is only rewritten in place
+when the connection's write buffer is empty; otherwise the device moves to
+a fresh buffer.
+
+The uniqueId Traccar sees is the IMEI: --id-prefix + device id, zero-padded
+to 15 digits.
+"""
+
+import struct
+import time
+
+NAME = "eelink"
+DEFAULT_PORT = 5064
+HEARTBEAT_ACKED = True
+MSG_LOGIN = 0x01
+MSG_HEARTBEAT = 0x03
+MSG_NORMAL = 0x12
+HEADER = struct.Struct(">2sBHH")  # 0x6767, type, length (sequence + content), sequence
+_MARK = b"gg"  # 0x67 0x67
+_SEQ_TIME = struct.Struct(">HI")  # sequence at offset 5, time at 7
+_FIX = struct.Struct(">iiHHH")  # lat, lon, altitude, speed, course at offset 12
+_SEQ = struct.Struct(">H")
+_MASK_GPS = 0x01
+_LOCATION_LEN = 2 + 4 + 1 + _FIX.size + 1 + 2  # sequence, time, mask, fix, satellites, status
+_COORD_SCALE = 1800000
+
+
+def device_ident(dev_id, prefix=""):
+    return f"{prefix}{dev_id}".rjust(15, "0")
+
+
+def _location_template():
+    buf = bytearray(HEADER.size - 2 + _LOCATION_LEN)
+    HEADER.pack_into(buf, 0, _MARK, MSG_NORMAL, _LOCATION_LEN, 0)
+    buf[11] = _MASK_GPS
+    buf[12 + _FIX.size] = 8  # satellites
+    return buf  # status (last two bytes) stays 0
+
+
+def _heartbeat_template():
+    buf = bytearray(HEADER.size + 2)
+    HEADER.pack_into(buf, 0, _MARK, MSG_HEARTBEAT, 4, 0)
+    return buf
+
+
+class Device:
+    """Frames of one Eelink device, with its own sequence counter and reusable frame buffers."""
+    __slots__ = ("ident", "seq", "location", "heartbeat_buf")
+
+    def __init__(self, ident):
+        self.ident = ident
+        self.seq = 0
+        self.location = _location_template()
+        self.heartbeat_buf = _heartbeat_template()
+
+    def _next_seq(self):
+        self.seq = (self.seq + 1) & 0xFFFF
+        return self.seq
+
+    def login(self):
+        """Login frame: IMEI as 8 BCD bytes, language (English) and time zone (UTC)."""
+        content = bytes.fromhex("0" + self.ident[-15:]) + b"\x01\x00"
+        return HEADER.pack(_MARK, MSG_LOGIN, 2 + len(content), self._next_seq()) + content
+
+    def position(self, lat, lon, speed_kmh, bearing, ts=None, reuse=True):
+        """Location frame for this fix; rewritten in place when `reuse` (nothing of it still queued)."""
+        buf = self.location if reuse else _location_template()
+        self.location = buf
+        _SEQ_TIME.pack_into(buf, 5, self._next_seq(), int(ts or time.time()))
+        _FIX.pack_into(buf, 12, int(lat * _COORD_SCALE), int(lon * _COORD_SCALE), 0,
+                       min(int(speed_kmh), 0xFFFF), int(bearing) % 360)
+        return buf
+
+    def heartbeat(self, ts=None, reuse=True):
+        buf = self.heartbeat_buf if reuse else _heartbeat_template()
+        self.heartbeat_buf = buf
+        _SEQ.pack_into(buf, 5, self._next_seq())
+        return buf
+
+
+def split_frames(buf):
+    """Complete frames at the start of `buf` and the number of bytes they used."""
+    frames = []
+    start = 0
+    while len(buf) - start >= 5:
+        if buf[start:start + 2] != _MARK:
+            # Out of sync: skip to the next frame marker
+            nxt = buf.find(_MARK, start + 1)
+            start = len(buf) - 1 if nxt < 0 else nxt
+            continue
+        end = start + 5 + ((buf[start + 3] << 8) | buf[start + 4])
+        if end > len(buf):
+            break
+        frames.append(bytes(buf[start:end]))
+        start = end
+    return frames, start
+
+
+def answer(frame):
+    """Traccar's reply to a device frame (None: no reply); used by fake_traccar_server.py."""
+    kind = frame[2]
+    if kind not in (MSG_LOGIN, MSG_HEARTBEAT, MSG_NORMAL):
+        return None
+    (seq,) = _SEQ.unpack_from(frame, 5)
+    content = struct.pack(">IHB", int(time.time()), 0, 0) if kind == MSG_LOGIN else b""  # server time, zone, language
+    return HEADER.pack(_MARK, kind, 2 + len(content), seq) + content
+
+
+def decode_location(frame):
+    """(seq, ts, lat, lon, speed_kmh, course) of a location frame, for checking the encoder."""
+    seq, ts = _SEQ_TIME.unpack_from(frame, 5)
+    lat, lon, _, speed, course = _FIX.unpack_from(frame, 12)
+    return seq, ts, lat / _COORD_SCALE, lon / _COORD_SCALE, speed, course
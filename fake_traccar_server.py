@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for a Traccar server, for benchmarking the simulators themselves.
+
+Serves the endpoints the simulators and add_device.py use on one port:
+  GET/POST /?id=...          OsmAnd position updates (empty 200 response)
+  POST / (JSON)              OsmAnd batch uploads {"device_id", "location": [...]}
+  GET /api/devices           JSON list of N devices with 'SIM' uniqueIds (supports ?id=..&id=.. and
+                             ?uniqueId=.. filters)
+  POST /api/devices          create a device (400 with H2's unique violation message on a duplicate uniqueId)
+  DELETE /api/devices/{id}   delete a device (204, or 404 if unknown)
+  GET /v2/monitoring/metrics/droplet/{metric}
+                             synthetic DigitalOcean Monitoring series for ?start=..&end=..
+                             (point DO_API_BASE_URL here, see droplet_metrics.py)
+And, with --h02-port / --eelink-port, tracker listeners that answer like
+Traccar does (H02: every V1 position, as with h02.ack=true; Eelink: login,
+heartbeat and location frames).
+
+It is a bare asyncio.Protocol HTTP/1.1 server with keep-alive, so it can
+absorb far more requests per second than the generator produces. Latency and
+errors can be injected to check how the generator behaves against a slow or
+failing server without a real droplet in the loop.
+
+Example:
+  python3 fake_traccar_server.py --port 5055 --devices 100000 --latency-ms 5 --error-rate 0.01
+  TRACCAR_BASE_URL=http://127.0.0.1:5055 TRACCAR_API_KEY=x \
+  DO_API_BASE_URL=http://127.0.0.1:5055 DO_API_KEY=x DO_DROPLET_ID=1 python3 sim_traccar_osmand_ramp.py ...
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+from collections import defaultdict
+from urllib.parse import parse_qs
+
+import eelink_protocol
+import h02_protocol
+
+_REASONS = {200: b"OK", 204: b"No Content", 400: b"Bad Request", 404: b"Not Found", 500: b"Internal Server Error",
+            503: b"Service Unavailable"}
+
+
+def build_devices(count, first_id=1):
+    return [{"id": first_id + i, "name": f"SIM{i:06d}", "uniqueId": f"SIM{i:06d}", "status": "online"}
+            for i in range(count)]
+
+
+def devices_json(devices):
+    return json.dumps(devices, separators=(",", ":")).encode()
+
+
+MEMORY_TOTAL = 4 * 1024 ** 3
+DISK_SIZE = 25 * 1000 ** 3
+CPUS = 2
+
+
+def droplet_series(metric, params, t):
+    """[(labels, value)] of one fake droplet metric at epoch second t: slow waves, so windows differ."""
+    wave = math.sin(t / 600.0)
+    if metric == "bandwidth":
+        rate = 2.0 if params.get("direction") == "inbound" else 1.0
+        return [({"interface": params.get("interface", "public"), "direction": params.get("direction", "outbound")},
+                 rate * (1.5 + wave))]
+    if metric == "cpu":
+        # Cumulative CPU seconds per mode; busy share moves between 20% and 60%
+        busy = CPUS * (0.4 * t - 120.0 * math.cos(t / 600.0))
+        return [({"mode": "idle"}, CPUS * t - busy), ({"mode": "user"}, busy * 0.75), ({"mode": "system"}, busy * 0.25)]
+    if metric == "memory_total":
+        return [({}, MEMORY_TOTAL)]
+    if metric == "memory_available":
+        return [({}, MEMORY_TOTAL * (0.5 - 0.2 * wave))]
+    if metric.startswith("load_"):
+        return [({}, (1.0 + wave) * {"load_1": 1.2, "load_5": 1.0, "load_15": 0.8}.get(metric, 1.0))]
+    if metric == "filesystem_size":
+        return [({"device": "/dev/vda1", "mountpoint": "/"}, DISK_SIZE), ({"device": "/dev/vda15", "mountpoint": "/boot/efi"}, 1e8)]
+    if metric == "filesystem_free":
+        return [({"device": "/dev/vda1", "mountpoint": "/"}, DISK_SIZE * 0.7), ({"device": "/dev/vda15", "mountpoint": "/boot/efi"}, 9e7)]
+    return None
+
+
+def http_response(status, body=b"", content_type=b"text/plain", close=False):
+    return b"".join([
+        b"HTTP/1.1 ", str(status).encode(), b" ", _REASONS.get(status, b"Status"), b"\r\n",
+        b"Content-Type: ", content_type, b"\r\n",
+        b"Content-Length: ", str(len(body)).encode(), b"\r\n",
+        b"Connection: close\r\n" if close else b"",
+        b"\r\n", body,
+    ])
+
+
+class FakeTraccar:
+    """Shared configuration and counters for all connections."""
+
+    def __init__(self, devices=1000, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, error_status=503,
+                 reset_rate=0.0, seed=None, metrics_step=60):
+        self.devices = {d["id"]: d for d in build_devices(devices)}
+        self.unique_ids = {d["uniqueId"] for d in self.devices.values()}
+        self.next_id = devices + 1
+        self._devices_body = None
+        self.latency = latency_ms / 1000.0
+        self.jitter = jitter_ms / 1000.0
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.reset_rate = reset_rate
+        self.metrics_step = metrics_step
+        self.rng = random.Random(seed)
+        self.requests = defaultdict(int)
+        self.connections_open = 0
+        self.connections_total = 0
+        self.ok_response = http_response(200)
+        self.error_response = http_response(error_status, b"injected error")
+        self.not_found = http_response(404, b"not found")
+
+    def delay(self):
+        if self.jitter:
+            return max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+        return self.latency
+
+    @property
+    def devices_body(self):
+        if self._devices_body is None:
+            self._devices_body = devices_json(list(self.devices.values()))
+        return self._devices_body
+
+    def create_device(self, body):
+        device = json.loads(body)
+        if device.get("uniqueId") in self.unique_ids:
+            # Traccar's default H2 database; MySQL/PostgreSQL word it differently
+            return http_response(400, b'Unique index or primary key violation: "PUBLIC.IDX_DEVICES_UNIQUEID ON '
+                                      b'PUBLIC.TC_DEVICES(UNIQUEID NULLS FIRST)"')
+        device["id"] = self.next_id
+        self.next_id += 1
+        self.devices[device["id"]] = device
+        self.unique_ids.add(device["uniqueId"])
+        self._devices_body = None
+        return http_response(200, json.dumps(device).encode(), b"application/json")
+
+    def delete_device(self, device_id):
+        device = self.devices.pop(device_id, None)
+        if device is None:
+            return self.not_found
+        self.unique_ids.discard(device["uniqueId"])
+        self._devices_body = None
+        return http_response(204)
+
+    def droplet_metrics(self, metric, query):
+        """Prometheus-style matrix like the DigitalOcean Monitoring API, one sample per metrics_step."""
+        params = {k: v[0] for k, v in parse_qs(query.decode()).items()}
+        try:
+            start, end = int(params["start"]), int(params["end"])
+        except (KeyError, ValueError):
+            return http_response(400, b"start and end are required")
+        if droplet_series(metric, params, start) is None:
+            return self.not_found
+        step = self.metrics_step
+        series = {}
+        for t in range(-(-start // step) * step, end + 1, step):
+            for labels, value in droplet_series(metric, params, t):
+                key = tuple(sorted(labels.items()))
+                series.setdefault(key, []).append([t, repr(float(value))])
+        result = [{"metric": {"host_id": params.get("host_id", ""), **dict(key)}, "values": values}
+                  for key, values in series.items()]
+        body = json.dumps({"status": "success", "data": {"resultType": "matrix", "result": result}}).encode()
+        return http_response(200, body, b"application/json")
+
+    def route(self, method, target, body=b""):
+        """Return response bytes for a request, or None to reset the connection."""
+        path, _, query = target.partition(b"?")
+        if path == b"/api/devices":
+            self.requests["api_devices"] += 1
+            if method == b"POST":
+                return self.create_device(body)
+            params = parse_qs(query.decode()) if query else {}
+            if params.get("id"):
+                subset = [self.devices[int(i)] for i in params["id"] if int(i) in self.devices]
+                return http_response(200, devices_json(subset), b"application/json")
+            if params.get("uniqueId"):
+                wanted = set(params["uniqueId"])
+                subset = [d for d in self.devices.values() if d["uniqueId"] in wanted]
+                return http_response(200, devices_json(subset), b"application/json")
+            return http_response(200, self.devices_body, b"application/json")
+        if path.startswith(b"/api/devices/") and method == b"DELETE":
+            self.requests["api_devices"] += 1
+            return self.delete_device(int(path.rsplit(b"/", 1)[1]))
+        if path.startswith(b"/v2/monitoring/metrics/droplet/"):
+            self.requests["droplet_metrics"] += 1
+            return self.droplet_metrics(path.rsplit(b"/", 1)[1].decode(), query)
+        if path not in (b"/", b""):
+            self.requests["not_found"] += 1
+            return self.not_found
+        self.requests["osmand"] += 1
+        # JSON uploads carry a batch of locations; query-string reports one position
+        self.requests["positions"] += body.count(b'"coords"') if method == b"POST" and body else 1
+        if self.reset_rate and self.rng.random() < self.reset_rate:
+            self.requests["reset"] += 1
+            return None
+        if self.error_rate and self.rng.random() < self.error_rate:
+            self.requests["error"] += 1
+            return self.error_response
+        return self.ok_response
+
+
+class FakeTraccarProtocol(asyncio.Protocol):
+    def __init__(self, server):
+        self.server = server
+        self.buf = bytearray()
+        self.transport = None
+        self.ready_at = 0.0  # keeps delayed responses in request order on this connection
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.server.connections_open += 1
+        self.server.connections_total += 1
+
+    def connection_lost(self, exc):
+        self.server.connections_open -= 1
+        self.transport = None
+
+    def data_received(self, data):
+        buf = self.buf
+        buf += data
+        while True:
+            end = buf.find(b"\r\n\r\n")
+            if end < 0:
+                return
+            head = bytes(buf[:end])
+            request_line, _, headers = head.partition(b"\r\n")
+            length = 0
+            close = False
+            for line in headers.split(b"\r\n"):
+                name, _, value = line.partition(b":")
+                name = name.strip().lower()
+                if name == b"content-length":
+                    length = int(value)
+                elif name == b"connection" and value.strip().lower() == b"close":
+                    close = True
+            if len(buf) < end + 4 + length:
+                return
+            body = bytes(buf[end + 4:end + 4 + length])
+            del buf[:end + 4 + length]
+            parts = request_line.split(b" ")
+            if len(parts) < 2:
+                self.transport.close()
+                return
+            response = self.server.route(parts[0], parts[1], body)
+            if response is None:
+                self.transport.abort()
+                return
+            self._respond(response, close)
+            if close:
+                return
+
+    def _respond(self, response, close):
+        delay = self.server.delay()
+        if not delay and self.ready_at == 0.0:
+            self._write(response, close)
+            return
+        loop = asyncio.get_running_loop()
+        self.ready_at = max(loop.time() + delay, self.ready_at)
+        loop.call_at(self.ready_at, self._write, response, close)
+
+    def _write(self, response, close):
+        if self.transport is None:
+            return
+        self.transport.write(response)
+        if close:
+            self.transport.close()
+
+
+class FakeTrackerProtocol(asyncio.Protocol):
+    """A persistent tracker connection: counts frames and sends the codec's answer for each (after the injected delay)."""
+
+    def __init__(self, server, codec):
+        self.server = server
+        self.codec = codec
+        self.buf = bytearray()
+        self.transport = None
+        self.ready_at = 0.0
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.server.connections_open += 1
+        self.server.connections_total += 1
+
+    def connection_lost(self, exc):
+        self.server.connections_open -= 1
+        self.transport = None
+
+    def data_received(self, data):
+        self.buf += data
+        frames, used = self.codec.split_frames(self.buf)
+        del self.buf[:used]
+        server = self.server
+        for frame in frames:
+            server.requests[self.codec.NAME] += 1
+            if server.reset_rate and server.rng.random() < server.reset_rate:
+                server.requests["reset"] += 1
+                self.transport.abort()
+                return
+            response = self.codec.answer(frame)
+            if response is not None:
+                self._respond(response)
+
+    def _respond(self, response):
+        delay = self.server.delay()
+        if not delay and self.ready_at == 0.0:
+            self.transport.write(response)
+            return
+        loop = asyncio.get_running_loop()
+        self.ready_at = max(loop.time() + delay, self.ready_at)
+        loop.call_at(self.ready_at, self._write, response)
+
+    def _write(self, response):
+        if self.transport is not None:
+            self.transport.write(response)
+
+
+async def serve(server, host, port, report_every=10, tracker_ports=None):
+    loop = asyncio.get_running_loop()
+    srv = await loop.create_server(lambda: FakeTraccarProtocol(server), host, port, backlog=4096)
+    print(f"Fake Traccar listening on {host}:{port}")
+    for codec, tracker_port in (tracker_ports or {}).items():
+        await loop.create_server(lambda codec=codec: FakeTrackerProtocol(server, codec), host, tracker_port, backlog=4096)
+        print(f"Fake {codec.NAME} tracker port listening on {host}:{tracker_port}")
+    async with srv:
+        last = 0
+        last_ts = time.monotonic()
+        while True:
+            await asyncio.sleep(report_every)
+            now = time.monotonic()
+            total = sum(n for kind, n in server.requests.items() if kind != "positions")
+            print(f"[{time.strftime('%H:%M:%S')}] requests={total} rps={(total - last) / (now - last_ts):.1f} "
+                  f"open_conns={server.connections_open} conns_total={server.connections_total} "
+                  f"breakdown={dict(server.requests)}")
+            last, last_ts = total, now
+
+
+def parse_args():
+    ap = argparse.ArgumentParser(description="Fake Traccar OsmAnd + /api/devices endpoint for offline simulator benchmarks")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=5055)
+    ap.add_argument("--devices", type=int, default=1000, help="SIM devices returned by /api/devices")
+    ap.add_argument("--latency-ms", type=float, default=0.0, help="Added response latency")
+    ap.add_argument("--jitter-ms", type=float, default=0.0, help="Uniform +/- jitter around --latency-ms")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="Fraction of OsmAnd requests answered with --error-status")
+    ap.add_argument("--error-status", type=int, default=503)
+    ap.add_argument("--reset-rate", type=float, default=0.0, help="Fraction of OsmAnd requests answered by resetting the connection")
+    ap.add_argument("--seed", type=int, default=None)
+    ap.add_argument("--h02-port", type=int, default=None, help="Also accept H02 tracker connections on this port (Traccar uses 5013)")
+    ap.add_argument("--eelink-port", type=int, default=None, help="Also accept Eelink tracker connections on this port (Traccar uses 5064)")
+    ap.add_argument("--metrics-step", type=int, default=60, help="Seconds between samples of the fake droplet metrics")
+    return ap.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    server = FakeTraccar(devices=args.devices, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                         error_rate=args.error_rate, error_status=args.error_status,
+                         reset_rate=args.reset_rate, seed=args.seed, metrics_step=args.metrics_step)
+    try:
+        tracker_ports = {codec: port for codec, port in ((h02_protocol, args.h02_port), (eelink_protocol, args.eelink_port)) if port}
+        asyncio.run(serve(server, args.host, args.port, tracker_ports=tracker_ports))
+    except KeyboardInterrupt:
+        pass
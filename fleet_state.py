@@ -0,0 +1,104 @@
+"""
+Vectorized fleet state for the OsmAnd simulators.
+
+Keeps lat/lon/bearing/speed for every simulated device in contiguous NumPy
+arrays and advances whole cohorts of devices in one batched step. Random
+draws come from a counter-based generator keyed on (seed, device id, step),
+so a device follows the same track for a given seed no matter which cohort
+it is stepped in or how many other devices share the run.
+"""
+
+import numpy as np
+
+# Seed each device around a center (Cebu example) with slight offsets
+CENTER_LAT = 10.3157
+CENTER_LON = 123.8854
+
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+_MIX1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX2 = np.uint64(0x94D049BB133111EB)
+_DRAWS_PER_STEP = 4
+
+
+def _splitmix64(x):
+    with np.errstate(over="ignore"):
+        z = x + _GOLDEN
+        z = (z ^ (z >> np.uint64(30))) * _MIX1
+        z = (z ^ (z >> np.uint64(27))) * _MIX2
+        return z ^ (z >> np.uint64(31))
+
+
+def _uniform(keys, counters, draw, lo, hi):
+    """Uniform floats in [lo, hi) for each (key, counter) pair; `draw` picks the stream within a step."""
+    with np.errstate(over="ignore"):
+        x = keys + (counters * np.uint64(_DRAWS_PER_STEP) + np.uint64(draw)) * _GOLDEN
+    u = (_splitmix64(x) >> np.uint64(11)).astype(np.float64) * (1.0 / (1 << 53))
+    return lo + (hi - lo) * u
+
+
+class FleetState:
+    def __init__(self, device_ids, seed):
+        self.ids = np.empty(0, dtype=np.int64)
+        self.lat = np.empty(0, dtype=np.float64)
+        self.lon = np.empty(0, dtype=np.float64)
+        self.bearing = np.empty(0, dtype=np.float64)
+        self.speed_kmh = np.empty(0, dtype=np.float64)
+        self._seed_key = _splitmix64(np.array([seed & 0xFFFFFFFFFFFFFFFF], dtype=np.uint64))[0]
+        self._keys = np.empty(0, dtype=np.uint64)
+        self._steps = np.empty(0, dtype=np.uint64)
+        self.extend(device_ids)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def extend(self, device_ids):
+        """Append devices to the fleet; returns the slot range assigned to them."""
+        ids = np.asarray(device_ids, dtype=np.int64)
+        first = len(self.ids)
+        keys = _splitmix64(ids.astype(np.uint64) ^ self._seed_key)
+        zero = np.zeros(len(ids), dtype=np.uint64)
+        self.ids = np.concatenate([self.ids, ids])
+        self._keys = np.concatenate([self._keys, keys])
+        self._steps = np.concatenate([self._steps, zero + np.uint64(1)])
+        self.lat = np.concatenate([self.lat, CENTER_LAT + _uniform(keys, zero, 0, -0.05, 0.05)])
+        self.lon = np.concatenate([self.lon, CENTER_LON + _uniform(keys, zero, 1, -0.05, 0.05)])
+        self.bearing = np.concatenate([self.bearing, _uniform(keys, zero, 2, 0, 360)])
+        self.speed_kmh = np.concatenate([self.speed_kmh, _uniform(keys, zero, 3, 5, 40)])  # moving-ish
+        return range(first, len(self.ids))
+
+    def advance(self, slots, dt_seconds):
+        """Step every device in `slots` by dt_seconds in one batch."""
+        slots = np.asarray(slots, dtype=np.intp)
+        if len(slots) == 0:
+            return
+        keys = self._keys[slots]
+        steps = self._steps[slots]
+        # Random walk with mild drift; wrap bearing 0..360
+        bearing = (self.bearing[slots] + _uniform(keys, steps, 0, -6, 6)) % 360
+        lat = self.lat[slots]
+        speed = self.speed_kmh[slots]
+        # Convert km/h to deg/sec approx (rough near equator; fine for load)
+        # 1 km ~ 0.009 deg lat; scale lon by cos(lat).
+        dlat = speed / 3600.0 * 0.009 * dt_seconds
+        dlon = dlat * np.maximum(0.2, np.abs(np.cos(np.radians(lat))))
+        # Move along bearing
+        rad = np.radians(bearing)
+        self.lat[slots] = lat + dlat * np.cos(rad)
+        self.lon[slots] += dlon * np.sin(rad)
+        self.bearing[slots] = bearing
+        # occasional stop/start
+        toggle = _uniform(keys, steps, 1, 0, 1) < 0.02
+        restart = _uniform(keys, steps, 2, 10, 40)
+        self.speed_kmh[slots] = np.where(toggle, np.where(speed > 1, 0.0, restart), speed)
+        self._steps[slots] = steps + np.uint64(1)
+
+    def snapshot(self, slots):
+        """Return (ids, lat, lon, speed_kmh, bearing) lists for `slots`, ready for formatting."""
+        slots = np.asarray(slots, dtype=np.intp)
+        return (
+            self.ids[slots].tolist(),
+            self.lat[slots].tolist(),
+            self.lon[slots].tolist(),
+            self.speed_kmh[slots].tolist(),
+            self.bearing[slots].tolist(),
+        )
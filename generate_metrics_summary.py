@@ -4,11 +4,14 @@ Performance Metrics Summary Generator
 Analyzes CSV data from all droplet tiers and generates summary tables and metrics
 """
 
+import argparse
 import pandas as pd
 import os
 import glob
 from typing import Dict, List, Tuple
 
+import timeseries
+
 def analyze_droplet_tier(tier_dir: str) -> Dict:
     """Analyze performance data for a specific droplet tier"""
     csv_files = glob.glob(f'{tier_dir}*.csv')
@@ -29,6 +32,11 @@ def analyze_droplet_tier(tier_dir: str) -> Dict:
         return None
     
     combined_df = pd.concat(all_dfs, ignore_index=True)
+    # Levels where the load generator itself was the bottleneck say nothing about the server
+    if 'gen_overloaded' in combined_df.columns:
+        combined_df = combined_df[combined_df['gen_overloaded'] != 1]
+        if combined_df.empty:
+            return None
     
     # Extract tier information from directory name
     tier_name = tier_dir.split('/')[-2].replace('droplet_', '').replace('_reports', '')
@@ -178,5 +186,82 @@ def generate_summary_tables():
     print()
     print("*Data compiled from comprehensive load testing across all droplet tiers with empirical performance measurements.*")
 
+def load_timeseries(path: str) -> pd.DataFrame:
+    """Load a simulator per-second stream (--timeseries) into a DataFrame, one row per second and worker"""
+    df = pd.DataFrame(timeseries.read_records(path))
+    df['time'] = pd.to_datetime(df['ts'], unit='s')
+    return df
+
+def summarize_timeseries(path: str):
+    """Per-level drill-down of a per-second stream: spikes, first failures and generator state"""
+    df = load_timeseries(path)
+    if df.empty:
+        print(f"No samples in {path}")
+        return
+    # Combine the workers of a level into one row per second
+    per_second = df.groupby(['level', 'ts']).agg(
+        sent=('sent', 'sum'), ok=('ok', 'sum'), fail=('fail', 'sum'),
+        s5xx=('s5xx', 'sum'), exceptions=('exceptions', 'sum'),
+        p99_ms=('p99_ms', 'max'), max_ms=('max_ms', 'max'),
+        inflight=('inflight', 'sum'), open_conns=('open_conns', 'sum'),
+        loop_lag_max_ms=('loop_lag_max_ms', 'max'),
+    ).reset_index()
+
+    print(f"## Per-second drill-down: {path}")
+    print()
+    print("| Level | Seconds | Peak RPS | Worst p99 (ms) | at +s | First failure at +s | Max In-flight | Max Open Conns | Max Loop Lag (ms) |")
+    print("|-------|---------|----------|----------------|-------|---------------------|---------------|----------------|-------------------|")
+    for level, rows in per_second.groupby('level'):
+        start = rows['ts'].min()
+        worst = rows.loc[rows['p99_ms'].idxmax()] if rows['p99_ms'].notna().any() else None
+        failing = rows[rows['fail'] > 0]
+        first_fail = f"{failing['ts'].min() - start:.0f}" if len(failing) else "-"
+        print(f"| {level} | {len(rows)} | {rows['sent'].max():,} | "
+              f"{worst['p99_ms'] if worst is not None else float('nan'):.1f} | "
+              f"{worst['ts'] - start if worst is not None else float('nan'):.0f} | {first_fail} | "
+              f"{rows['inflight'].max():,} | {rows['open_conns'].max():,} | {rows['loop_lag_max_ms'].max():.1f} |")
+
+    host_path = path[:-len(".timeseries.bin")] + ".host.bin" if path.endswith(".timeseries.bin") else None
+    if host_path and os.path.exists(host_path):
+        print()
+        summarize_host(per_second, host_path)
+
+def summarize_host(per_second: pd.DataFrame, path: str, saturated_cpu: float = 90.0):
+    """Per-level host resources (--host-source) next to the request stream: when CPU saturated and what p99 did"""
+    host = pd.DataFrame(timeseries.read_records(path))
+    if host.empty:
+        print(f"No host samples in {path}")
+        return
+    print(f"## Host resources: {path}")
+    print()
+    print(f"| Level | Samples | CPU Mean % | CPU Max % | CPU >= {saturated_cpu:.0f}% from +s | p99 Before (ms) | p99 After (ms) | Max Steal % | Max Load 1m | Max Mem % |")
+    print("|-------|---------|------------|-----------|-------------------|-----------------|----------------|-------------|-------------|-----------|")
+    for level, rows in host.groupby('level'):
+        seconds = per_second[per_second['level'] == level]
+        start = seconds['ts'].min() if len(seconds) else rows['ts'].min()
+        hot = rows[rows['cpu_percent'] >= saturated_cpu]
+        if len(hot):
+            # Host samples cover the interval ending at their timestamp; compare request p99 on either side
+            onset = hot['ts'].min()
+            before = seconds[seconds['ts'] < onset]['p99_ms'].max()
+            after = seconds[seconds['ts'] >= onset]['p99_ms'].max()
+            onset_cell = f"{onset - start:.0f}"
+        else:
+            before = seconds['p99_ms'].max()
+            after = float('nan')
+            onset_cell = "-"
+        print(f"| {level} | {len(rows)} | {rows['cpu_percent'].mean():.1f} | {rows['cpu_percent'].max():.1f} | "
+              f"{onset_cell} | {before:.1f} | {after:.1f} | {rows['steal_percent'].max():.1f} | "
+              f"{rows['load_1m'].max():.2f} | {rows['memory_usage'].max():.1f} |")
+
 if __name__ == "__main__":
-    generate_summary_tables()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Summarize droplet tier reports")
+    parser.add_argument("--timeseries", nargs="+", metavar="FILE",
+                        help="Drill into per-second streams written by the simulators instead")
+    cli_args = parser.parse_args()
+    if cli_args.timeseries:
+        for ts_path in cli_args.timeseries:
+            summarize_timeseries(ts_path)
+            print()
+    else:
+        generate_summary_tables()
\ No newline at end of file
@@ -0,0 +1,99 @@
+"""
+H02 (SinoTrack and many other Chinese trackers) text protocol frames.
+
+A device keeps one TCP connection open and writes ASCII frames of the form
+  *HQ,<id>,V1,<hhmmss>,A,<ddmm.mmmm>,N,<dddmm.mmmm>,E,<knots>,<course>,<ddmmyy>,<status>#
+for positions and *HQ,<id>,LINK,... for heartbeats. Traccar (port 5013 by
+default) answers a position with *HQ,<id>,V4,V1,<yyyyMMddHHmmss># only when
+h02.ack is enabled in its configuration; heartbeats get no answer.
+
+Traccar only accepts numeric identifiers here, so the device identifier is
+--id-prefix followed by the device id; register the SIM devices with those
+uniqueIds (or enable database.registerUnknown) before an H02 run.
+"""
+
+import time
+
+NAME = "h02"
+DEFAULT_PORT = 5013
+STATUS = "FFFFFBFF"  # all status bits idle (no alarms)
+HEARTBEAT_ACKED = False
+
+
+def device_ident(dev_id, prefix=""):
+    return f"{prefix}{dev_id}"
+
+
+def _degrees_minutes(value, degree_digits):
+    value = abs(value)
+    degrees = int(value)
+    return f"{degrees:0{degree_digits}d}{(value - degrees) * 60:07.4f}"
+
+
+def position_frame(ident, lat, lon, speed_kmh, bearing, ts=None):
+    """V1 position report as bytes."""
+    t = time.gmtime(ts)
+    return (
+        f"*HQ,{ident},V1,{t.tm_hour:02d}{t.tm_min:02d}{t.tm_sec:02d},A,"
+        f"{_degrees_minutes(lat, 2)},{'N' if lat >= 0 else 'S'},"
+        f"{_degrees_minutes(lon, 3)},{'E' if lon >= 0 else 'W'},"
+        f"{speed_kmh / 1.852:.2f},{int(bearing) % 360},"
+        f"{t.tm_mday:02d}{t.tm_mon:02d}{t.tm_year % 100:02d},{STATUS}#"
+    ).encode()
+
+
+def heartbeat_frame(ident, ts=None):
+    """LINK heartbeat as bytes (Traccar records it without a position and does not answer)."""
+    t = time.gmtime(ts)
+    return (f"*HQ,{ident},LINK,{t.tm_hour:02d}{t.tm_min:02d}{t.tm_sec:02d},0,0,0,0,0,"
+            f"{t.tm_mday:02d}{t.tm_mon:02d}{t.tm_year % 100:02d}#").encode()
+
+
+class Device:
+    """Frames of one H02 device; H02 has no login or sequence numbers, so each frame is formatted per send."""
+    __slots__ = ("ident",)
+
+    def __init__(self, ident):
+        self.ident = ident
+
+    def login(self):
+        return None
+
+    def position(self, lat, lon, speed_kmh, bearing, ts=None, reuse=True):
+        return position_frame(self.ident, lat, lon, speed_kmh, bearing, ts)
+
+    def heartbeat(self, ts=None, reuse=True):
+        return heartbeat_frame(self.ident, ts)
+
+
+def split_frames(buf):
+    """Complete '*...#' frames at the start of `buf` and the number of bytes they used."""
+    frames = []
+    start = 0
+    while True:
+        end = buf.find(b"#", start)
+        if end < 0:
+            return frames, start
+        frames.append(bytes(buf[start:end + 1]))
+        start = end + 1
+
+
+def ack_frame(ident, ts=None):
+    """The V4 answer Traccar sends for a V1 position when h02.ack is enabled."""
+    return f"*HQ,{ident},V4,V1,{time.strftime('%Y%m%d%H%M%S', time.gmtime(ts))}#".encode()
+
+
+def answer(frame):
+    """What a Traccar with h02.ack=true sends back for `frame` (None: no answer); used by fake_traccar_server.py."""
+    return ack_frame(frame_ident(frame)) if is_position(frame) else None
+
+
+def is_position(frame):
+    """True for a V1 position frame (the frames Traccar acknowledges)."""
+    parts = frame.split(b",", 3)
+    return len(parts) > 2 and parts[2] == b"V1"
+
+
+def frame_ident(frame):
+    parts = frame.split(b",", 2)
+    return parts[1].decode() if len(parts) > 1 else ""
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Minimal host metrics agent for a self-hosted or local Traccar box.
+
+read_snapshot() returns the raw counters host_sampler.py turns into CPU,
+load, memory, disk and network figures: the aggregate line of /proc/stat,
+/proc/loadavg, MemTotal/MemAvailable, /proc/net/dev and the size/free bytes
+of one filesystem, as plain text sections separated by SECTION lines. The
+same text is produced by SNAPSHOT_SHELL, so a host can be sampled over SSH
+without installing anything.
+
+Run on the Traccar host to serve it over HTTP (standard library only):
+  python3 host_agent.py --port 9101
+and point the simulator at it with --host-source http --host-target http://HOST:9101
+"""
+
+import argparse
+import os
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+SECTION = "--"
+# POSIX shell equivalent of read_snapshot() for the ssh source (df -Pk prints 1K blocks)
+SNAPSHOT_SHELL = (
+    "head -n 1 /proc/stat; echo " + SECTION + "; cat /proc/loadavg; echo " + SECTION + "; "
+    "grep -E '^(MemTotal|MemAvailable):' /proc/meminfo; echo " + SECTION + "; cat /proc/net/dev; "
+    "echo " + SECTION + "; df -Pk {mount} | awk 'NR==2 {{print $2*1024, $4*1024}}'"
+)
+
+
+def read_snapshot(mount="/"):
+    """Raw counters of this host as text (see the module docstring)."""
+    with open("/proc/stat") as f:
+        cpu = f.readline().rstrip("\n")
+    with open("/proc/loadavg") as f:
+        load = f.read().strip()
+    with open("/proc/meminfo") as f:
+        mem = "\n".join(line.rstrip("\n") for line in f if line.startswith(("MemTotal:", "MemAvailable:")))
+    with open("/proc/net/dev") as f:
+        net = f.read().rstrip("\n")
+    fs = os.statvfs(mount)
+    disk = f"{fs.f_blocks * fs.f_frsize} {fs.f_bavail * fs.f_frsize}"
+    return "\n".join([cpu, SECTION, load, SECTION, mem, SECTION, net, SECTION, disk]) + "\n"
+
+
+class SnapshotHandler(BaseHTTPRequestHandler):
+    mount = "/"
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/snapshot":
+            self.send_error(404)
+            return
+        body = read_snapshot(self.mount).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, fmt, *args):
+        pass
+
+
+def parse_args():
+    ap = argparse.ArgumentParser(description="Serve /proc counters for the simulators' --host-source http")
+    ap.add_argument("--host", default="0.0.0.0")
+    ap.add_argument("--port", type=int, default=9101)
+    ap.add_argument("--mount", default="/", help="Filesystem reported as disk usage")
+    return ap.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    SnapshotHandler.mount = args.mount
+    server = ThreadingHTTPServer((args.host, args.port), SnapshotHandler)
+    print(f"Host agent serving http://{args.host}:{args.port}/snapshot")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,308 @@
+"""
+Background host resource sampling for the server under test (--host-source).
+
+While a level runs, a sampler reads the Traccar host's resources every
+--host-interval seconds, on whole-second boundaries so its timestamps line up
+with the per-second request stream (timeseries.py), and appends one record
+per sample to <csv name>.host.bin in the same file layout. Samples can come
+from one of these sources:
+
+  do     DigitalOcean Monitoring (droplet_metrics.py); at most every
+         DO_MIN_INTERVAL_S, its newest sample per metric
+  local  /proc of this machine (Traccar on the load generator's host)
+  ssh    /proc of --host-target over one persistent `ssh` session
+  http   host_agent.py running on the Traccar host at --host-target
+
+For the /proc sources the level's CSV droplet columns (mean/_max/_last) are
+computed from these in-run samples; with `do` they still come from the
+windowed DigitalOcean query at the end of the level.
+"""
+
+import asyncio
+import math
+import os
+import shlex
+import struct
+import sys
+import time
+from collections import defaultdict
+
+import aiohttp
+
+import droplet_metrics
+import host_agent
+import timeseries
+
+SOURCES = ("do", "local", "ssh", "http", "none")
+DO_MIN_INTERVAL_S = 30
+END_MARKER = "@@END"
+FIELDS = (
+    ("ts", "d"),                 # sample time, epoch seconds (whole seconds for the /proc sources)
+    ("level", "H"),
+    ("cpu_percent", "f"),        # busy share of all CPUs since the previous sample
+    ("iowait_percent", "f"),
+    ("steal_percent", "f"),
+    ("load_1m", "f"),
+    ("load_5m", "f"),
+    ("load_15m", "f"),
+    ("memory_usage", "f"),       # (MemTotal - MemAvailable) / MemTotal
+    ("disk_usage_percent", "f"),
+    ("net_in_kbps", "f"),        # all interfaces except lo
+    ("net_out_kbps", "f"),
+)
+RECORD = struct.Struct("<" + "".join(fmt for _, fmt in FIELDS))
+# Host sample field -> droplet_metrics key used by the CSV report
+REPORT_KEYS = {
+    "net_out_kbps": "bandwidth_pub_out", "net_in_kbps": "bandwidth_pub_in", "cpu_percent": "cpu_percent",
+    "memory_usage": "memory_usage", "load_1m": "load_1m", "load_5m": "load_5m", "load_15m": "load_15m",
+    "disk_usage_percent": "disk_usage_percent",
+}
+
+_NAN = float("nan")
+
+
+def default_path(csv_path):
+    """Host samples next to the CSV report: ramp_report.csv -> ramp_report.host.bin."""
+    return os.path.splitext(csv_path)[0] + ".host.bin"
+
+
+def configure(args, csv_path):
+    """Resolve args.host_series (None: next to csv_path, '': disabled) and create the file."""
+    if args.host_source == "none":
+        args.host_series = ""
+    elif args.host_series is None:
+        args.host_series = default_path(csv_path)
+    if args.host_series:
+        timeseries.ensure_file(args.host_series, RECORD, FIELDS)
+    if args.host_source in ("ssh", "http") and not args.host_target:
+        print(f"--host-source {args.host_source} needs --host-target", file=sys.stderr)
+        sys.exit(1)
+
+
+def parse_snapshot(text):
+    """Raw counters from host_agent.read_snapshot() text."""
+    sections = [s.strip("\n") for s in text.split("\n" + host_agent.SECTION + "\n")]
+    if len(sections) != 5:
+        raise ValueError(f"expected 5 snapshot sections, got {len(sections)}")
+    cpu, load, mem, net, disk = sections
+    # cpu  user nice system idle iowait irq softirq steal guest guest_nice (guest time is already in user/nice)
+    ticks = [int(v) for v in cpu.split()[1:9]]
+    meminfo = {}
+    for line in mem.splitlines():
+        name, _, value = line.partition(":")
+        meminfo[name] = int(value.split()[0])
+    rx = tx = 0
+    for line in net.splitlines()[2:]:
+        name, _, counters = line.partition(":")
+        if name.strip() != "lo":
+            values = counters.split()
+            rx += int(values[0])
+            tx += int(values[8])
+    size, free = (float(v) for v in disk.split()[:2])
+    return {
+        "ticks": ticks,
+        "load": [float(v) for v in load.split()[:3]],
+        "memory_usage": (1 - meminfo["MemAvailable"] / meminfo["MemTotal"]) * 100 if meminfo.get("MemTotal") else _NAN,
+        "disk_usage_percent": (1 - free / size) * 100 if size > 0 else _NAN,
+        "rx_bytes": rx,
+        "tx_bytes": tx,
+    }
+
+
+def host_sample(prev, cur, elapsed):
+    """Host metrics dict (FIELDS names) from two parse_snapshot() results `elapsed` seconds apart."""
+    sample = {"load_1m": cur["load"][0], "load_5m": cur["load"][1], "load_15m": cur["load"][2],
+              "memory_usage": cur["memory_usage"], "disk_usage_percent": cur["disk_usage_percent"],
+              "cpu_percent": _NAN, "iowait_percent": _NAN, "steal_percent": _NAN,
+              "net_in_kbps": _NAN, "net_out_kbps": _NAN}
+    if prev is None or elapsed <= 0:
+        return sample
+    delta = [c - p for c, p in zip(cur["ticks"], prev["ticks"])]
+    total = sum(delta)
+    if total > 0:
+        user, nice, system, idle, iowait, irq, softirq, steal = delta
+        sample["cpu_percent"] = (total - idle - iowait) / total * 100
+        sample["iowait_percent"] = iowait / total * 100
+        sample["steal_percent"] = steal / total * 100
+    if cur["rx_bytes"] >= prev["rx_bytes"] and cur["tx_bytes"] >= prev["tx_bytes"]:
+        sample["net_in_kbps"] = (cur["rx_bytes"] - prev["rx_bytes"]) * 8 / 1000 / elapsed
+        sample["net_out_kbps"] = (cur["tx_bytes"] - prev["tx_bytes"]) * 8 / 1000 / elapsed
+    return sample
+
+
+class LocalSource:
+    """/proc of the machine the simulator runs on."""
+    replaces_droplet_metrics = True
+
+    async def snapshot(self):
+        return await asyncio.to_thread(host_agent.read_snapshot)
+
+    async def close(self):
+        pass
+
+
+class SSHSource:
+    """/proc of a remote host through one long-lived `ssh` process; each newline on stdin asks for a snapshot."""
+    replaces_droplet_metrics = True
+
+    def __init__(self, target, mount="/"):
+        self.target = target
+        self.command = ("while read _; do " + host_agent.SNAPSHOT_SHELL.format(mount=shlex.quote(mount))
+                        + f"; echo {END_MARKER}; done")
+        self.proc = None
+
+    async def snapshot(self):
+        if self.proc is None or self.proc.returncode is not None:
+            self.proc = await asyncio.create_subprocess_exec(
+                "ssh", "-o", "BatchMode=yes", "-T", self.target, self.command,
+                stdin=asyncio.subprocess.PIPE, stdout=asyncio.subprocess.PIPE)
+        self.proc.stdin.write(b"\n")
+        await self.proc.stdin.drain()
+        lines = []
+        while True:
+            line = await self.proc.stdout.readline()
+            if not line:
+                raise ConnectionError(f"ssh {self.target} exited with {await self.proc.wait()}")
+            line = line.decode()
+            if line.rstrip("\n") == END_MARKER:
+                return "".join(lines)
+            lines.append(line)
+
+    async def close(self):
+        if self.proc is not None and self.proc.returncode is None:
+            self.proc.stdin.close()
+            try:
+                await asyncio.wait_for(self.proc.wait(), 5)
+            except asyncio.TimeoutError:
+                self.proc.kill()
+
+
+class HTTPSource:
+    """host_agent.py serving GET /snapshot on the Traccar host."""
+    replaces_droplet_metrics = True
+
+    def __init__(self, target):
+        self.url = target.rstrip("/") + "/snapshot"
+        self.session = None
+
+    async def snapshot(self):
+        if self.session is None:
+            self.session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=5))
+        async with self.session.get(self.url) as resp:
+            resp.raise_for_status()
+            return await resp.text()
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+
+
+class DigitalOceanSource:
+    """Newest DigitalOcean Monitoring sample of every metric; the report keeps using droplet_metrics.collect()."""
+    replaces_droplet_metrics = False
+
+    async def sample(self):
+        now = time.time()
+        values = await droplet_metrics.collect(now - DO_MIN_INTERVAL_S, now, defaultdict(int))
+        sample = {name: values.get(f"{key}_last", _NAN) for name, key in REPORT_KEYS.items()}
+        sample.update(iowait_percent=_NAN, steal_percent=_NAN)
+        return sample
+
+    async def close(self):
+        pass
+
+
+def make_source(args):
+    if args.host_source == "local":
+        return LocalSource()
+    if args.host_source == "ssh":
+        return SSHSource(args.host_target)
+    if args.host_source == "http":
+        return HTTPSource(args.host_target)
+    if args.host_source == "do":
+        return DigitalOceanSource() if droplet_metrics.configured() else None
+    return None
+
+
+class HostSampler:
+    """Sample a source every `interval` seconds for one level; keeps the samples for level_metrics()."""
+
+    def __init__(self, source, path, level=0, interval=5):
+        self.source = source
+        self.level = level
+        self.interval = max(1, int(interval))
+        if isinstance(source, DigitalOceanSource):
+            self.interval = max(self.interval, DO_MIN_INTERVAL_S)
+        self.fd = None
+        if path:
+            timeseries.ensure_file(path, RECORD, FIELDS)
+            self.fd = os.open(path, os.O_WRONLY | os.O_APPEND)
+        self.samples = []
+        self.errors = 0
+        self._prev = self._prev_ts = None
+        self._task = None
+
+    async def _sample(self, ts):
+        if isinstance(self.source, DigitalOceanSource):
+            sample = await self.source.sample()
+        else:
+            cur = parse_snapshot(await self.source.snapshot())
+            sample = host_sample(self._prev, cur, ts - self._prev_ts if self._prev_ts else 0)
+            self._prev, self._prev_ts = cur, ts
+        sample["ts"] = ts
+        self.samples.append(sample)
+        if self.fd is not None:
+            os.write(self.fd, RECORD.pack(ts, self.level & 0xFFFF, *(sample[name] for name, _ in FIELDS[2:])))
+
+    async def _run(self):
+        ts = math.floor(time.time())
+        while True:
+            try:
+                await self._sample(ts)
+            except Exception as e:  # a flaky host link must not end the level
+                self.errors += 1
+                if self.errors <= 3:
+                    print(f"[HOST] sample failed: {e!r}", file=sys.stderr)
+                self._prev = self._prev_ts = None
+            ts = (math.floor(time.time()) // self.interval + 1) * self.interval
+            await asyncio.sleep(max(0.0, ts - time.time()))
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.source.close()
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        if self.errors:
+            print(f"[HOST] {self.errors} host samples failed this level", file=sys.stderr)
+
+    @property
+    def replaces_droplet_metrics(self):
+        return self.source.replaces_droplet_metrics
+
+    def level_metrics(self, start, end):
+        """The report's droplet keys (mean, _max, _last) over the samples taken in [start, end]."""
+        result = droplet_metrics.empty()
+        for name, key in REPORT_KEYS.items():
+            points = [(s["ts"], s[name]) for s in self.samples
+                      if start <= s["ts"] <= end and not math.isnan(s[name])]
+            result[key], result[f"{key}_max"], result[f"{key}_last"] = droplet_metrics.reduce(points)
+        return result
+
+
+def start(args, level=0):
+    """Start sampling for one level per args.host_source, or return None when disabled."""
+    source = make_source(args)
+    if source is None:
+        return None
+    return HostSampler(source, args.host_series, level, args.host_interval).start()
@@ -0,0 +1,80 @@
+"""
+Incremental parser for large top-level JSON arrays such as GET /api/devices.
+
+resp.json() on a 100k-device list materialises the whole body as a string
+and then every device as a dict before the caller can drop what it does not
+need. JSONArrayParser instead takes the body chunk by chunk and hands back
+each array element as soon as it is complete, so callers keep only the fields
+they want and peak memory is bounded by one chunk plus one element.
+
+Elements must be objects, arrays or strings (a bare number split across
+chunks would be decoded early), which holds for every Traccar list endpoint.
+"""
+
+import codecs
+import json
+import re
+
+CHUNK_SIZE = 64 * 1024
+
+_WS = re.compile(r"[ \t\n\r]*")
+
+
+class JSONArrayParser:
+    def __init__(self):
+        self._decode = codecs.getincrementaldecoder("utf-8")().decode
+        self._scan = json.JSONDecoder().raw_decode
+        self._buf = ""
+        self._started = False
+        self.done = False
+
+    def feed(self, chunk):
+        """Add a chunk of bytes and return the array elements it completed."""
+        buf = self._buf + self._decode(chunk)
+        items = []
+        pos = 0
+        end = len(buf)
+        while not self.done:
+            pos = _WS.match(buf, pos).end()
+            if pos >= end:
+                break
+            c = buf[pos]
+            if not self._started:
+                if c != "[":
+                    raise ValueError(f"expected a JSON array, got {buf[pos:pos + 20]!r}")
+                self._started = True
+                pos += 1
+            elif c == "]":
+                self.done = True
+                pos += 1
+            elif c == ",":
+                pos += 1
+            else:
+                try:
+                    item, pos = self._scan(buf, pos)
+                except json.JSONDecodeError:
+                    break  # element continues in the next chunk
+                items.append(item)
+        self._buf = buf[pos:]
+        return items
+
+    def close(self):
+        if not self.done:
+            raise ValueError(f"truncated JSON array ({len(self._buf)} unparsed characters)")
+
+
+def iter_items(chunks):
+    """Yield the elements of a JSON array from an iterable of byte chunks."""
+    parser = JSONArrayParser()
+    for chunk in chunks:
+        yield from parser.feed(chunk)
+    parser.close()
+
+
+async def aiter_items(chunks):
+    """Async variant of iter_items for e.g. aiohttp's resp.content.iter_chunked()."""
+    parser = JSONArrayParser()
+    async for chunk in chunks:
+        for item in parser.feed(chunk):
+            yield item
+    parser.close()
@@ -0,0 +1,181 @@
+"""
+Fixed-memory, log-bucketed latency histogram (HDR style).
+
+Values are recorded in microseconds: exactly below 2**sub_bits, and above that
+in power-of-two ranges split into 2**(sub_bits-1) linear sub-buckets, which
+bounds the relative error to 10**-significant_digits. Recording is O(1),
+memory does not grow with the number of samples, and histograms from
+different workers or levels can be merged by adding counts.
+"""
+
+import math
+from array import array
+
+_US_PER_MS = 1000.0
+
+
+class LatencyHistogram:
+    def __init__(self, highest_ms=3_600_000, significant_digits=3):
+        if not 1 <= significant_digits <= 5:
+            raise ValueError("significant_digits must be between 1 and 5")
+        self.highest_ms = highest_ms
+        self.significant_digits = significant_digits
+        self.sub_bits = math.ceil(math.log2(2 * 10 ** significant_digits))
+        self._linear = 1 << self.sub_bits
+        self._half = self._linear >> 1
+        highest_us = max(int(highest_ms * _US_PER_MS), self._linear)
+        self._max_index = self._index(highest_us)
+        self.counts = [0] * (self._max_index + 1)
+        self.total = 0
+        self.min_us = None
+        self.max_us = 0
+        self.sum_us = 0
+
+    def _index(self, v):
+        if v < self._linear:
+            return v
+        shift = v.bit_length() - self.sub_bits
+        return self._linear + (shift - 1) * self._half + ((v >> shift) - self._half)
+
+    def _upper_us(self, index):
+        """Highest value that falls into bucket `index`."""
+        if index < self._linear:
+            return index
+        shift, sub = divmod(index - self._linear, self._half)
+        shift += 1
+        return ((sub + self._half + 1) << shift) - 1
+
+    def record(self, value_ms, count=1):
+        v = int(value_ms * _US_PER_MS)
+        if v < 0:
+            v = 0
+        i = self._index(v)
+        if i > self._max_index:
+            i = self._max_index
+        self.counts[i] += count
+        self.total += count
+        self.sum_us += v * count
+        if v > self.max_us:
+            self.max_us = v
+        if self.min_us is None or v < self.min_us:
+            self.min_us = v
+
+    def merge(self, other):
+        """Add another histogram's counts into this one (same precision and range)."""
+        if (other.sub_bits, other._max_index) != (self.sub_bits, self._max_index):
+            raise ValueError("Cannot merge histograms with different precision or range")
+        counts = self.counts
+        for i, c in enumerate(other.counts):
+            if c:
+                counts[i] += c
+        self.total += other.total
+        self.sum_us += other.sum_us
+        self.max_us = max(self.max_us, other.max_us)
+        if other.min_us is not None and (self.min_us is None or other.min_us < self.min_us):
+            self.min_us = other.min_us
+        return self
+
+    def percentile(self, p):
+        """Latency in ms at percentile p (0-100); nan when empty."""
+        if self.total == 0:
+            return float('nan')
+        # Same rank rule as the previous sorted-list pct(): element int(n*p/100)
+        rank = min(max(int(self.total * p / 100), 0), self.total - 1) + 1
+        seen = 0
+        for i, c in enumerate(self.counts):
+            if c:
+                seen += c
+                if seen >= rank:
+                    return min(self._upper_us(i), self.max_us) / _US_PER_MS
+        return self.max_us / _US_PER_MS
+
+    def cumulative_counts(self, bounds_ms):
+        """Counts of values <= each of the ascending bounds_ms (by bucket upper bound), e.g. for Prometheus `le` buckets."""
+        result = []
+        bounds = iter(bounds_ms)
+        bound = next(bounds, None)
+        seen = 0
+        for i, c in enumerate(self.counts):
+            if bound is None:
+                break
+            while bound is not None and self._upper_us(i) > bound * _US_PER_MS:
+                result.append(seen)
+                bound = next(bounds, None)
+            seen += c
+        while bound is not None:
+            result.append(seen)
+            bound = next(bounds, None)
+        return result
+
+    @property
+    def max(self):
+        return self.max_us / _US_PER_MS if self.total else float('nan')
+
+    @property
+    def min(self):
+        return self.min_us / _US_PER_MS if self.total else float('nan')
+
+    @property
+    def mean(self):
+        return self.sum_us / self.total / _US_PER_MS if self.total else float('nan')
+
+    def __len__(self):
+        return self.total
+
+    def reset(self):
+        self.counts = [0] * (self._max_index + 1)
+        self.total = 0
+        self.min_us = None
+        self.max_us = 0
+        self.sum_us = 0
+
+    def snapshot(self):
+        """Copy of the bucket counts, to pass to since() later."""
+        return self.counts[:]
+
+    def since(self, snapshot):
+        """New histogram of the values recorded after snapshot() returned `snapshot` (None: all of them).
+
+        Only bucket counts are differenced, so min/max/mean of the result are
+        bucket bounds (clamped to this histogram's max) rather than exact values.
+        """
+        h = LatencyHistogram(self.highest_ms, self.significant_digits)
+        if snapshot is None:
+            return h.merge(self)
+        counts = h.counts
+        lowest = highest = None
+        for i, (c, prev) in enumerate(zip(self.counts, snapshot)):
+            if c != prev:
+                counts[i] = c - prev
+                if lowest is None:
+                    lowest = i
+                highest = i
+        if highest is not None:
+            h.total = sum(counts[lowest:highest + 1])
+            h.sum_us = sum(c * self._upper_us(lowest + k) for k, c in enumerate(counts[lowest:highest + 1]) if c)
+            h.min_us = min(self._upper_us(lowest), self.max_us)
+            h.max_us = min(self._upper_us(highest), self.max_us)
+        return h
+
+    def to_bytes(self):
+        """Compact encoding for shipping between processes: header followed by non-zero (index, count) pairs."""
+        pairs = array('q')
+        for i, c in enumerate(self.counts):
+            if c:
+                pairs.append(i)
+                pairs.append(c)
+        header = array('q', [self.significant_digits, int(self.highest_ms), self.total,
+                             -1 if self.min_us is None else self.min_us, self.max_us, self.sum_us])
+        return header.tobytes() + pairs.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        values = array('q')
+        values.frombytes(data)
+        digits, highest_ms, total, min_us, max_us, sum_us = values[:6]
+        h = cls(highest_ms=highest_ms, significant_digits=digits)
+        for k in range(6, len(values), 2):
+            h.counts[values[k]] = values[k + 1]
+        h.total, h.max_us, h.sum_us = total, max_us, sum_us
+        h.min_us = None if min_us < 0 else min_us
+        return h
@@ -0,0 +1,206 @@
+"""
+Coordinator/agent mode for driving one Traccar from several load-generator hosts.
+
+Agents connect to the coordinator over TCP and exchange newline-delimited
+JSON messages:
+
+  agent -> coordinator  {"type": "register", "name": ...}
+  coordinator -> agent  {"type": "welcome", "time": <coordinator epoch>}
+  coordinator -> agent  {"type": "level", "level": n, "base_url": ..., "args": {...},
+                         "device_ids": [...], "start_at": <coordinator epoch>}
+  agent -> coordinator  {"type": "tick", "level": n, "t": <second>, "sent": .., "ok": .., "fail": ..}
+  agent -> coordinator  {"type": "done", "level": n, "values": {"ok": .., "fail": .., ...},
+                         "statuses": {...}, "hists": {"latency_hist": <base64>, ...}}
+  coordinator -> agent  {"type": "shutdown"}
+
+The coordinator runs the simulator's normal ramp logic; for each level it
+hands every agent a shard of the SIM device IDs and a common start time,
+aggregates the per-second ticks for progress output and merges the final
+counters and latency histograms into one stats dict for the CSV row. Agents
+correct start times by the clock offset measured at registration, so hosts
+do not need tightly synchronized clocks. Everything also works on localhost
+with several agent processes.
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import math
+import socket
+import sys
+import time
+from collections import defaultdict
+
+import reconnect_storm
+from latency_histogram import LatencyHistogram
+from sharded_load import MAX_KEYS, SUM_KEYS, merge_stats, shard_ids
+
+# Time agents get to receive their shard and build their fleet before a level starts
+LEVEL_START_GRACE = 2.0
+
+
+def parse_host_port(value, default_host="0.0.0.0"):
+    host, _, port = value.rpartition(":")
+    return host or default_host, int(port)
+
+
+def _send(writer, msg):
+    writer.write(json.dumps(msg, separators=(",", ":")).encode() + b"\n")
+
+
+async def _recv(reader):
+    line = await reader.readline()
+    if not line:
+        return None
+    return json.loads(line)
+
+
+def _plain_args(args):
+    plain = {k: v for k, v in vars(args).items() if isinstance(v, (bool, int, float, str, type(None)))}
+    if getattr(args, "storm", None):
+        plain["storm"] = [list(event) for event in args.storm]  # rebuilt into StormEvents by the agent
+    return plain
+
+
+class _Agent:
+    def __init__(self, name, reader, writer):
+        self.name = name
+        self.reader = reader
+        self.writer = writer
+        self.closed = asyncio.get_running_loop().create_future()
+
+
+class LoadCoordinator:
+    def __init__(self, expect_agents):
+        self.expect_agents = expect_agents
+        self.agents = []
+        self.server = None
+        self._ready = asyncio.Event()
+
+    async def start(self, host, port):
+        self.server = await asyncio.start_server(self._on_agent, host, port)
+        print(f"[COORD] Listening on {host}:{port}, waiting for {self.expect_agents} agents")
+
+    async def _on_agent(self, reader, writer):
+        msg = await _recv(reader)
+        if not msg or msg.get("type") != "register":
+            writer.close()
+            return
+        agent = _Agent(msg.get("name", "?"), reader, writer)
+        _send(writer, {"type": "welcome", "time": time.time()})
+        await writer.drain()
+        self.agents.append(agent)
+        print(f"[COORD] Agent {agent.name} registered ({len(self.agents)}/{self.expect_agents})")
+        if len(self.agents) >= self.expect_agents:
+            self._ready.set()
+        # Keep the connection open until the coordinator shuts down
+        await agent.closed
+
+    async def wait_for_agents(self):
+        await self._ready.wait()
+
+    async def run_level(self, args, base_url, device_ids):
+        """Run one level across all agents and return merged stats."""
+        await self.wait_for_agents()
+        agents = list(self.agents)
+        shards = shard_ids(device_ids, len(agents))
+        agents = agents[:len(shards)]
+        start_at = time.time() + LEVEL_START_GRACE
+        level = getattr(args, "level", 0)
+        plain = _plain_args(args)
+        for agent, ids in zip(agents, shards):
+            shard_args = dict(plain, devices=len(ids), concurrency=max(1, math.ceil(args.concurrency / len(shards))))
+            _send(agent.writer, {"type": "level", "level": level, "base_url": base_url, "args": shard_args,
+                                 "device_ids": ids, "start_at": start_at})
+            await agent.writer.drain()
+        print(f"[COORD] Level {level}: {len(device_ids)} devices across {len(agents)} agents")
+
+        per_second = defaultdict(lambda: [0, 0, 0])  # t -> [sent, ok, fail]
+        parts = await asyncio.gather(*(self._collect(agent, level, per_second) for agent in agents))
+        stats = merge_stats(parts)
+        stats["per_second"] = dict(sorted(per_second.items()))
+        return stats
+
+    async def _collect(self, agent, level, per_second):
+        last_print = time.monotonic()
+        while True:
+            msg = await _recv(agent.reader)
+            if msg is None:
+                raise RuntimeError(f"Agent {agent.name} disconnected during level {level}")
+            if msg["type"] == "tick":
+                row = per_second[msg["t"]]
+                row[0] += msg["sent"]
+                row[1] += msg["ok"]
+                row[2] += msg["fail"]
+                if agent is self.agents[0] and time.monotonic() - last_print >= 10:
+                    last_print = time.monotonic()
+                    recent = [per_second[t] for t in sorted(per_second)[-11:-1]]
+                    rps = sum(r[0] for r in recent) / max(1, len(recent))
+                    print(f"[{time.strftime('%H:%M:%S')}] [COORD] cluster rps={rps:.1f}")
+            elif msg["type"] == "done":
+                part = dict(msg["values"], statuses=msg["statuses"], failure_samples=msg.get("failure_samples", []))
+                for key, data in msg["hists"].items():
+                    part[key] = LatencyHistogram.from_bytes(base64.b64decode(data))
+                return part
+
+    async def close(self):
+        for agent in self.agents:
+            try:
+                _send(agent.writer, {"type": "shutdown"})
+                await agent.writer.drain()
+                agent.writer.close()
+            except ConnectionError:
+                pass
+            if not agent.closed.done():
+                agent.closed.set_result(None)
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+
+
+async def run_agent(coordinator, run_load, new_stats):
+    """Serve levels for the coordinator at host:port using the simulator's run_load/new_stats."""
+    host, port = parse_host_port(coordinator, default_host="127.0.0.1")
+    reader, writer = await asyncio.open_connection(host, port)
+    _send(writer, {"type": "register", "name": f"{socket.gethostname()}:{id(writer) & 0xffff:04x}"})
+    await writer.drain()
+    welcome = await _recv(reader)
+    if not welcome or welcome.get("type") != "welcome":
+        print("Coordinator rejected registration", file=sys.stderr)
+        return
+    # Coordinator clock minus ours (ignores the one-way delay, which is small on a LAN)
+    offset = welcome["time"] - time.time()
+    print(f"[AGENT] Registered with {host}:{port} (clock offset {offset*1000:.1f} ms)")
+    while True:
+        msg = await _recv(reader)
+        if msg is None or msg["type"] == "shutdown":
+            break
+        if msg["type"] != "level":
+            continue
+        args = argparse.Namespace(**msg["args"])
+        if getattr(args, "storm", None):
+            args.storm = [reconnect_storm.StormEvent(*event) for event in args.storm]
+        stats = new_stats(args)
+        load = asyncio.create_task(run_load(args, msg["base_url"], msg["device_ids"], msg["start_at"] - offset, stats=stats))
+        last = (0, 0, 0)
+        while not load.done():
+            await asyncio.wait({load}, timeout=1.0)
+            now = (stats["count"], stats["ok"], stats["fail"])
+            if now != last:
+                _send(writer, {"type": "tick", "level": msg["level"], "t": int(time.time() + offset),
+                               "sent": now[0] - last[0], "ok": now[1] - last[1], "fail": now[2] - last[2]})
+                await writer.drain()
+                last = now
+        stats = load.result()
+        _send(writer, {
+            "type": "done", "level": msg["level"],
+            "values": {k: stats[k] for k in SUM_KEYS + MAX_KEYS if k in stats},
+            "statuses": {str(k): v for k, v in stats["statuses"].items()},
+            "failure_samples": stats["failure_samples"][:20],
+            "hists": {k: base64.b64encode(v.to_bytes()).decode()
+                      for k, v in stats.items() if isinstance(v, LatencyHistogram)},
+        })
+        await writer.drain()
+    writer.close()
+    print("[AGENT] Coordinator closed the session")
@@ -0,0 +1,86 @@
+"""
+Event-loop lag and resource probe for the load generator.
+
+A probe coroutine asks to wake up every `interval` seconds and records how
+late it actually ran. That scheduling delay is also added to every latency
+the generator measures, so when it grows the level is measuring the client
+rather than Traccar. The probe also tracks the process's own CPU% and RSS
+over the level.
+"""
+
+import asyncio
+import os
+import resource
+import time
+
+from latency_histogram import LatencyHistogram
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def current_rss_mb():
+    """Resident set size of this process in MB (peak RSS where /proc is unavailable)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        # ru_maxrss is KB on Linux, bytes on macOS
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss / (1024 * 1024) if rss > 1 << 32 else rss / 1024
+
+
+class LoopMonitor:
+    def __init__(self, interval=0.05, significant_digits=3):
+        self.interval = interval
+        self.lag_hist = LatencyHistogram(significant_digits=significant_digits)
+        self.peak_rss_mb = 0.0
+        self.current_lag_ms = 0.0
+        self.window_max_lag_ms = 0.0  # highest lag since the last take_window_max()
+        self._cpu0 = self._wall0 = None
+        self._task = None
+
+    async def _probe(self):
+        sleep = asyncio.sleep
+        monotonic = time.monotonic
+        samples = 0
+        while True:
+            expected = monotonic() + self.interval
+            await sleep(self.interval)
+            lag_ms = max(0.0, (monotonic() - expected) * 1000)
+            self.current_lag_ms = lag_ms
+            if lag_ms > self.window_max_lag_ms:
+                self.window_max_lag_ms = lag_ms
+            self.lag_hist.record(lag_ms)
+            samples += 1
+            if samples % 20 == 0:
+                self.peak_rss_mb = max(self.peak_rss_mb, current_rss_mb())
+
+    def start(self):
+        self._cpu0 = time.process_time()
+        self._wall0 = time.monotonic()
+        self.peak_rss_mb = current_rss_mb()
+        self._task = asyncio.create_task(self._probe())
+
+    def take_window_max(self):
+        """Return the highest loop lag seen since the previous call and start a new window."""
+        lag, self.window_max_lag_ms = self.window_max_lag_ms, 0.0
+        return lag
+
+    def stop(self):
+        """Stop probing and return the generator measurements for the level."""
+        if self._task:
+            self._task.cancel()
+        wall = max(1e-9, time.monotonic() - self._wall0)
+        cpu = time.process_time() - self._cpu0
+        self.peak_rss_mb = max(self.peak_rss_mb, current_rss_mb())
+        return {
+            "gen_lag_hist": self.lag_hist,
+            "gen_cpu_percent": cpu / wall * 100,
+            "gen_rss_mb": self.peak_rss_mb,
+        }
+
+
+def generator_overloaded(stats, max_lag_ms):
+    """True when the generator's p99 loop lag during the level exceeded max_lag_ms."""
+    lag = stats.get("gen_lag_hist")
+    return bool(lag is not None and len(lag) and lag.percentile(99) > max_lag_ms)
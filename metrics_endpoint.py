@@ -0,0 +1,133 @@
+"""
+Optional OpenMetrics/Prometheus endpoint for a running simulator (--metrics-port).
+
+The load loop publishes references to its live objects (the level's stats
+dict, loop monitor, connector and a launched-devices callback) and the
+endpoint renders them on every GET /metrics. Scrapes run on the same event
+loop as the sends, so reading the counters needs no locks and the send path
+does no extra work; the cost of a scrape is one pass over the latency
+histogram buckets.
+
+Counters are per level: they restart from zero when a new level (or a new
+process under --workers) begins, which Prometheus' rate()/increase() treat
+as an ordinary counter reset. Use the sim_level gauge to split series.
+"""
+
+import asyncio
+import math
+
+import timeseries
+
+# Histogram bucket bounds exposed to Prometheus, in milliseconds
+BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+CONTENT_TYPE = b"text/plain; version=0.0.4; charset=utf-8"
+
+_state = {"stats": None, "monitor": None, "connector": None, "launched": None, "level": 0, "worker": 0}
+_server = None
+
+
+def publish(stats=None, monitor=None, connector=None, launched=None, level=None, worker=None):
+    """Point the endpoint at the current level's live objects (only the given ones change)."""
+    for key, value in (("stats", stats), ("monitor", monitor), ("connector", connector),
+                       ("launched", launched), ("level", level), ("worker", worker)):
+        if value is not None:
+            _state[key] = value
+
+
+def _num(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return "NaN"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render():
+    """Return the current metrics in the Prometheus text exposition format."""
+    st = _state["stats"]
+    labels = f'worker="{_state["worker"]}"'
+    lines = [
+        "# HELP sim_level Ramp level currently running.",
+        "# TYPE sim_level gauge",
+        f"sim_level{{{labels}}} {_state['level']}",
+    ]
+    if st is not None:
+        lines += [
+            "# HELP sim_requests_total OsmAnd requests completed in this level, by HTTP status or 'exception'.",
+            "# TYPE sim_requests_total counter",
+        ]
+        for status, n in sorted(st["statuses"].items(), key=lambda kv: str(kv[0])):
+            if isinstance(status, int) or status == "exception":
+                lines.append(f'sim_requests_total{{{labels},status="{status}"}} {n}')
+        lines += [
+            "# HELP sim_requests_failed_total Requests counted as failures in this level.",
+            "# TYPE sim_requests_failed_total counter",
+            f"sim_requests_failed_total{{{labels}}} {st['fail']}",
+            "# HELP sim_positions_total Positions delivered by successful requests in this level.",
+            "# TYPE sim_positions_total counter",
+            f"sim_positions_total{{{labels}}} {st['positions']}",
+            "# HELP sim_late_sends_total Sends that started later than --late-threshold-ms behind schedule.",
+            "# TYPE sim_late_sends_total counter",
+            f"sim_late_sends_total{{{labels}}} {st['late']}",
+            "# HELP sim_inflight_requests Requests started but not finished.",
+            "# TYPE sim_inflight_requests gauge",
+            f"sim_inflight_requests{{{labels}}} {st.get('inflight', 0)}",
+        ]
+        hist = st["latency_hist"]
+        cumulative = hist.cumulative_counts(BUCKETS_MS)
+        lines += [
+            "# HELP sim_request_duration_seconds OsmAnd response time in this level.",
+            "# TYPE sim_request_duration_seconds histogram",
+        ]
+        for bound, count in zip(BUCKETS_MS, cumulative):
+            lines.append(f'sim_request_duration_seconds_bucket{{{labels},le="{bound / 1000:g}"}} {count}')
+        lines += [
+            f'sim_request_duration_seconds_bucket{{{labels},le="+Inf"}} {hist.total}',
+            f"sim_request_duration_seconds_sum{{{labels}}} {hist.sum_us / 1e6!r}",
+            f"sim_request_duration_seconds_count{{{labels}}} {hist.total}",
+        ]
+    if _state["launched"] is not None:
+        lines += [
+            "# HELP sim_devices_launched Devices launched in this level.",
+            "# TYPE sim_devices_launched gauge",
+            f"sim_devices_launched{{{labels}}} {_state['launched']()}",
+        ]
+    if _state["connector"] is not None:
+        lines += [
+            "# HELP sim_open_connections Sockets open in the HTTP connector pool.",
+            "# TYPE sim_open_connections gauge",
+            f"sim_open_connections{{{labels}}} {timeseries.open_connections(_state['connector'])}",
+        ]
+    if _state["monitor"] is not None:
+        lines += [
+            "# HELP sim_event_loop_lag_seconds Most recent event-loop lag of the load generator.",
+            "# TYPE sim_event_loop_lag_seconds gauge",
+            f"sim_event_loop_lag_seconds{{{labels}}} {_num(_state['monitor'].current_lag_ms / 1000)}",
+        ]
+    return ("\n".join(lines) + "\n").encode()
+
+
+async def _handle(reader, writer):
+    try:
+        request = await reader.readuntil(b"\r\n\r\n")
+        target = request.split(b" ", 2)[1] if request.count(b" ") >= 2 else b""
+        if target.split(b"?", 1)[0] == b"/metrics":
+            status, ctype, body = b"200 OK", CONTENT_TYPE, render()
+        else:
+            status, ctype, body = b"404 Not Found", b"text/plain", b"not found\n"
+        writer.write(b"HTTP/1.1 " + status + b"\r\nContent-Type: " + ctype + b"\r\nContent-Length: "
+                     + str(len(body)).encode() + b"\r\nConnection: close\r\n\r\n" + body)
+        await writer.drain()
+    except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def ensure_server(host, port):
+    """Start the endpoint on this process' event loop unless it is already serving there."""
+    global _server
+    loop = asyncio.get_running_loop()
+    if _server is not None and _server[0] is loop:
+        return
+    server = await asyncio.start_server(_handle, host, port)
+    _server = (loop, server)
+    print(f"[METRICS] Serving OpenMetrics on http://{host}:{port}/metrics")
@@ -0,0 +1,104 @@
+"""
+Buffered and offline OsmAnd devices (--batch-size, --offline-fraction).
+
+Positions are still produced on every device's normal --interval schedule,
+but instead of one GET each they go into a per-device backlog that is
+uploaded as JSON POSTs (osmand_request.batch_body):
+
+  --batch-size N       a device uploads once it holds N positions
+  --offline-fraction   share of devices that lose coverage once per level
+                       and keep buffering until it returns
+  --offline-window S   mean length of that outage; --backlog-dist picks how
+                       outage lengths spread around it (fixed, uniform over
+                       [0, 2S], exponential)
+
+An outage starts at a random point of the level and ends at least one
+--interval before the level does (shortened if needed; a device first seen
+later than that stays online), so the device's next report after it still
+falls within the level and flushes the backlog. A device coming back
+uploads its whole backlog at once, in POSTs of up to --batch-size positions
+(one POST for all of it when --batch-size is 1). A --continuous ramp keeps
+one Backlog for the warm fleet and calls new_level() at every level, so
+the running devices draw their outage again along with the new ones.
+"""
+
+import random
+import time
+
+import osmand_request
+
+BACKLOG_DISTS = ("fixed", "uniform", "exponential")
+
+
+def enabled(args):
+    return getattr(args, "batch_size", 1) > 1 or getattr(args, "offline_fraction", 0.0) > 0
+
+
+class Backlog:
+    """Positions held per device until its next upload, and each device's outage."""
+
+    def __init__(self, batch_size=1, offline_fraction=0.0, offline_window=0.0, dist="fixed", end=0.0, interval=0.0,
+                 seed=None):
+        """end: time.monotonic() of the level end (see new_level())."""
+        self.batch_size = max(1, batch_size)
+        self.offline_fraction = offline_fraction
+        self.offline_window = offline_window
+        self.dist = dist
+        self.end = end
+        self.interval = interval
+        self.rng = random.Random(seed)
+        self.pending = {}
+        self.outages = {}  # dev_id -> (start, end) monotonic, or None when the device stays online
+
+    @classmethod
+    def from_args(cls, args, end):
+        return cls(args.batch_size, args.offline_fraction, args.offline_window, args.backlog_dist, end,
+                   args.interval, args.seed)
+
+    @property
+    def buffered(self):
+        """Positions recorded but not uploaded yet."""
+        return sum(len(locations) for locations in self.pending.values())
+
+    def new_level(self, end):
+        """Start a level ending at `end`: every device draws its outage again on its next report.
+
+        Earlier outages ended a send before the previous level did, so none is cut short.
+        """
+        self.end = end
+        self.outages.clear()
+
+    def _outage_length(self):
+        if self.dist == "uniform":
+            return self.rng.uniform(0, 2 * self.offline_window)
+        if self.dist == "exponential":
+            return self.rng.expovariate(1 / self.offline_window) if self.offline_window > 0 else 0.0
+        return self.offline_window
+
+    def _outage(self, dev_id, now):
+        if dev_id not in self.outages:
+            outage = None
+            latest = self.end - self.interval - now  # latest outage end that still leaves a send to flush
+            if latest > 0 and self.offline_fraction and self.rng.random() < self.offline_fraction:
+                length = min(self._outage_length(), latest)
+                start = now + self.rng.uniform(0, latest - length)
+                outage = (start, start + length)
+            self.outages[dev_id] = outage
+        return self.outages[dev_id]
+
+    def add(self, dev_id, vals, now=None):
+        """Buffer one position (osmand_request.values()); returns the upload bodies due now as (body, positions)."""
+        now = time.monotonic() if now is None else now
+        locations = self.pending.get(dev_id)
+        if locations is None:
+            locations = self.pending[dev_id] = []
+        locations.append(osmand_request.location_json(vals))
+        outage = self._outage(dev_id, now)
+        if outage is not None and outage[0] <= now < outage[1]:
+            return ()
+        if len(locations) < self.batch_size:
+            return ()
+        del self.pending[dev_id]
+        size = self.batch_size if self.batch_size > 1 else len(locations)
+        return [(osmand_request.batch_body(dev_id, locations[i:i + size]), len(locations[i:i + size]))
+                for i in range(0, len(locations), size)]
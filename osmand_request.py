@@ -0,0 +1,82 @@
+"""
+Pre-rendered OsmAnd requests for the simulators' send path.
+
+Everything constant about a position report (base URL or request line
+prefix, query keys, headers) is rendered once per session into a %-format
+string; a send only formats its six numbers into it with fixed precision.
+This replaces a params dict, five f-strings, urlencode() and
+base_url.rstrip('/') per message. Device ids are the integers FleetState
+hands out, so they need no URL quoting and %d covers them.
+
+With --transport raw the template is the whole HTTP request as bytes
+(raw_http.RawHttpSession.template()), so a send is a single bytes %-format
+and one transport write; with aiohttp it is the URL string.
+
+Buffered positions (osmand_backlog.py) are uploaded as one JSON POST per
+batch, in the layout of the background-geolocation based Traccar Client
+with batch sync: {"device_id": ..., "location": [{"timestamp", "coords":
+{...}}, ...]}, each location keeping the time it was recorded.
+"""
+
+import time
+from urllib.parse import urlsplit
+
+import aiohttp
+
+import raw_http
+
+# Same fields, order and precision the OsmAnd app (and the previous urlencode path) uses
+QUERY = "id=%d&lat=%.6f&lon=%.6f&timestamp=%d&speed=%.2f&bearing=%.1f"
+SEND_TIMEOUT_S = 30
+_SEND_TIMEOUT = aiohttp.ClientTimeout(total=SEND_TIMEOUT_S)
+_KMH_TO_MS = 0.2778
+LOCATION_JSON = ('{"timestamp":"%s","coords":{"latitude":%.6f,"longitude":%.6f,"speed":%.2f,"heading":%.1f},'
+                 '"is_moving":true}')
+JSON_CONTENT_TYPE = "application/json"
+_JSON_HEADERS = {"Content-Type": JSON_CONTENT_TYPE}
+
+
+def values(dev_id, lat, lon, speed_kmh, bearing, ts=None):
+    """The numbers of one report in QUERY order (speed converted to m/s)."""
+    return dev_id, lat, lon, int(ts or time.time()), speed_kmh * _KMH_TO_MS, bearing
+
+
+def location_json(vals):
+    """One buffered position (values() tuple) as a JSON location object."""
+    dev_id, lat, lon, ts, speed, bearing = vals
+    return LOCATION_JSON % (time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(ts)), lat, lon, speed, bearing)
+
+
+def batch_body(dev_id, locations):
+    """JSON upload body for a list of location_json() strings."""
+    return ('{"device_id":"%d","location":[%s]}' % (dev_id, ",".join(locations))).encode()
+
+
+class OsmandTemplate:
+    """OsmAnd GETs and batch POSTs to `base_url` through `session` (aiohttp.ClientSession or raw_http.RawHttpSession)."""
+
+    def __init__(self, base_url, session=None):
+        base = base_url.rstrip("/")
+        self.session = session
+        self.url_format = base.replace("%", "%%") + "/?" + QUERY
+        self.post_url = base + "/"
+        self.request_format = self.post_format = None
+        if isinstance(session, raw_http.RawHttpSession):
+            path = urlsplit(base).path.replace("%", "%%")
+            self.request_format = session.template(path + "/?" + QUERY)
+            self.post_format = session.template(path + "/", "POST", JSON_CONTENT_TYPE)
+
+    def url(self, vals):
+        return self.url_format % vals
+
+    def get(self, vals):
+        """Async context manager for the response to the report `vals` (see values())."""
+        if self.request_format is not None:
+            return self.session.request(self.request_format % vals, SEND_TIMEOUT_S, vals[0])
+        return self.session.get(self.url_format % vals, timeout=_SEND_TIMEOUT)
+
+    def post(self, body, dev_id=None):
+        """Async context manager for the response to a batch_body() upload of device `dev_id`."""
+        if self.post_format is not None:
+            return self.session.request(self.post_format % len(body) + body, SEND_TIMEOUT_S, dev_id)
+        return self.session.post(self.post_url, data=body, headers=_JSON_HEADERS, timeout=_SEND_TIMEOUT)
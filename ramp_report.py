@@ -0,0 +1,53 @@
+"""
+Per-level CSV report shared by the ramp and steady simulators.
+
+Columns are append-only so older reports stay readable by
+generate_metrics_summary.py; a report file whose header differs from the
+current columns is never appended to, because the rows would no longer line
+up with its header.
+"""
+
+import csv
+import os
+import sys
+
+REPORT_COLUMNS = [
+    "timestamp", "level", "devices", "concurrency", "duration", "ok", "fail", "fail_ratio",
+    "rps_avg", "rps_ok_avg", "p50_ms", "p90_ms", "p99_ms",
+    "bandwidth_pub_out_kbps", "bandwidth_pub_in_kbps", "cpu_percent", "memory_usage",
+    "load_1m", "load_5m", "load_15m", "disk_usage_percent",
+    "max_ms",
+    "gen_lag_p99_ms", "gen_lag_max_ms", "gen_cpu_percent", "gen_rss_mb", "gen_overloaded",
+    "p50_co_ms", "p90_co_ms", "p99_co_ms", "max_co_ms", "late_sends", "late_p99_ms", "late_max_ms",
+    # Droplet metrics: the columns above hold the mean over the level, these its max and last sample
+    "bandwidth_pub_out_kbps_max", "bandwidth_pub_out_kbps_last", "bandwidth_pub_in_kbps_max", "bandwidth_pub_in_kbps_last",
+    "cpu_percent_max", "cpu_percent_last", "memory_usage_max", "memory_usage_last",
+    "load_1m_max", "load_1m_last", "load_5m_max", "load_5m_last", "load_15m_max", "load_15m_last",
+    "disk_usage_percent_max", "disk_usage_percent_last",
+    "protocol",
+    # Positions delivered (ok requests times positions per request) and their rate; differ from ok/rps_ok_avg with --batch-size
+    "positions_ok", "positions_per_sec",
+    # Reconnect storms (--storm, see reconnect_storm.py); recovery is inf when the level ended before it
+    "storm_devices", "storm_recovery_s", "storm_peak_inflight", "storm_p99_ms", "storm_max_ms",
+    # Connection lifecycle (--connection-model): sockets opened, their rate and setup time apart from request latency
+    "connection_model", "connections_opened", "connections_per_sec", "connect_p50_ms", "connect_p99_ms",
+    # Reconnect storms: outage end to the last device reconnection (the jitter spread; storm_recovery_s excludes it)
+    "storm_reconnect_s",
+]
+
+
+def open_report(csv_path):
+    """Open csv_path for appending and return (file, writer); writes the header for new files."""
+    write_header = not os.path.exists(csv_path) or os.path.getsize(csv_path) == 0
+    if not write_header:
+        with open(csv_path, newline="") as existing:
+            header = next(csv.reader(existing), [])
+        if header != REPORT_COLUMNS:
+            print(f"CSV {csv_path} has a different column layout than this simulator writes; "
+                  f"use a new --csv path", file=sys.stderr)
+            sys.exit(1)
+    f = open(csv_path, "a", newline="")
+    writer = csv.writer(f)
+    if write_header:
+        writer.writerow(REPORT_COLUMNS)
+    return f, writer
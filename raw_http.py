@@ -0,0 +1,286 @@
+"""
+Lean HTTP/1.1 client for the OsmAnd send path (--transport raw).
+
+RawHttpSession stands in for the aiohttp.ClientSession that send_update()
+uses: `async with session.get(url, timeout=...) as resp` gives an object
+with .status and `await resp.read()`, so requests land in the same stats
+(status codes, latency histograms, failure samples) either way.
+
+Underneath, each connection is a bare asyncio.Protocol on a keep-alive
+socket. A request is one pre-formatted GET written to the transport
+(template() and request() let callers render it themselves, see
+osmand_request.py); of the response only the status line and
+Content-Length are parsed (a response without Content-Length is read until
+the server closes the socket; chunked responses are not supported).
+Connections follow one of the MODELS (--connection-model, see
+connection_model.py):
+
+  pool     at most `limit` keep-alive connections shared by all devices, like
+           aiohttp.TCPConnector(limit=...); idle ones are reused newest first
+  device   one keep-alive connection per device (the request's `key`), held
+           open between its reports and reopened when it drops
+  request  a new connection for every request, sent with Connection: close
+"""
+
+import asyncio
+import ssl as ssl_module
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+CONNECT_TIMEOUT = 5
+MODELS = ("pool", "device", "request")
+DEFAULT_TIMEOUT = 15
+_HEADER_END = b"\r\n\r\n"
+
+
+class HttpConnection(asyncio.Protocol):
+    """One keep-alive socket carrying one request at a time."""
+
+    def __init__(self, on_lost):
+        self.transport = None
+        self.buf = bytearray()
+        self.waiter = None
+        self.status = None
+        self.length = None  # body bytes still expected (None: until close)
+        self.keep_alive = True
+        self.lost = False
+        self._on_lost = on_lost
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def request(self, data):
+        """Write `data` and return a future for (status, body)."""
+        self.buf.clear()
+        self.status = self.length = None
+        self.waiter = asyncio.get_running_loop().create_future()
+        self.transport.write(data)
+        return self.waiter
+
+    def data_received(self, data):
+        buf = self.buf
+        buf += data
+        if self.status is None:
+            end = buf.find(_HEADER_END)
+            if end < 0:
+                return
+            self._parse_head(bytes(buf[:end]))
+            del buf[:end + 4]
+        if self.length is not None and len(buf) >= self.length:
+            self._finish(bytes(buf[:self.length]))
+
+    def _parse_head(self, head):
+        lines = head.split(b"\r\n")
+        try:
+            self.status = int(lines[0].split(b" ", 2)[1])
+        except (IndexError, ValueError):
+            self._fail(ConnectionError(f"bad status line {lines[0][:80]!r}"))
+            return
+        self.length = None
+        self.keep_alive = not lines[0].startswith(b"HTTP/1.0")
+        for line in lines[1:]:
+            name, _, value = line.partition(b":")
+            name = name.strip().lower()
+            if name == b"content-length":
+                try:
+                    self.length = int(value)
+                except ValueError:
+                    self._fail(ConnectionError(f"bad content-length {value.strip()[:40]!r}"))
+                    return
+            elif name == b"connection":
+                self.keep_alive = value.strip().lower() != b"close"
+            elif name == b"transfer-encoding" and value.strip().lower() != b"identity":
+                self._fail(ConnectionError("chunked responses are not supported by --transport raw"))
+                return
+        if self.length is None:
+            self.keep_alive = False
+
+    def _finish(self, body):
+        waiter, self.waiter = self.waiter, None
+        if waiter is not None and not waiter.done():
+            waiter.set_result((self.status, body))
+
+    def _fail(self, exc):
+        self.keep_alive = False
+        waiter, self.waiter = self.waiter, None
+        if waiter is not None and not waiter.done():
+            waiter.set_exception(exc)
+        if self.transport is not None:
+            self.transport.abort()
+
+    def timed_out(self):
+        self._fail(asyncio.TimeoutError())
+
+    def connection_lost(self, exc):
+        self.lost = True
+        self.transport = None
+        if self.waiter is not None and self.status is not None and self.length is None:
+            self._finish(bytes(self.buf))  # body delimited by the close
+        self._fail(ConnectionResetError("connection closed by server"))
+        self._on_lost(self)
+
+
+class RawResponse:
+    __slots__ = ("status", "body")
+
+    def __init__(self, status, body):
+        self.status = status
+        self.body = body
+
+    async def read(self):
+        return self.body
+
+
+class _Get:
+    """Awaitable context manager returned by RawHttpSession.get()."""
+    __slots__ = ("session", "data", "timeout", "key")
+
+    def __init__(self, session, data, timeout, key=None):
+        self.session = session
+        self.data = data
+        self.timeout = timeout
+        self.key = key
+
+    async def __aenter__(self):
+        return await self.session._request(self.data, self.timeout, self.key)
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class RawHttpSession:
+    """Drop-in for the aiohttp session in send_update(): requests over bare sockets, per connection model.
+
+    on_connect(ms): optional, called with the setup time of every connection opened.
+    """
+
+    def __init__(self, base_url, limit=100, insecure=False, headers=None, timeout=DEFAULT_TIMEOUT, model="pool",
+                 on_connect=None):
+        if model not in MODELS:
+            raise ValueError(f"connection model must be one of {', '.join(MODELS)}")
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == "https" else 80)
+        self.ssl = None
+        if parts.scheme == "https":
+            self.ssl = ssl_module.create_default_context()
+            if insecure:
+                self.ssl.check_hostname = False
+                self.ssl.verify_mode = ssl_module.CERT_NONE
+        self.origin = f"{parts.scheme}://{parts.netloc}"
+        self.timeout = timeout
+        self.model = model
+        self.on_connect = on_connect
+        headers = dict(headers or {})
+        if model == "request":
+            headers["Connection"] = "close"
+        head = f"Host: {parts.netloc}\r\n" + "".join(f"{k}: {v}\r\n" for k, v in headers.items())
+        self._tail = (" HTTP/1.1\r\n" + head + "\r\n").encode()
+        self._slots = asyncio.Semaphore(limit)
+        self._idle = deque()
+        self._conns = set()
+        self._by_key = {}
+
+    @property
+    def open_connections(self):
+        return len(self._conns)
+
+    def get(self, url, timeout=None, key=None):
+        if url.startswith(self.origin):
+            target = url[len(self.origin):] or "/"
+        else:
+            parts = urlsplit(url)
+            target = parts.path + ("?" + parts.query if parts.query else "")
+        total = getattr(timeout, "total", timeout) or self.timeout
+        return _Get(self, b"GET " + target.encode() + self._tail, total, key)
+
+    def template(self, target_format, method="GET", content_type=None):
+        """Bytes %-format of a whole request for a %-format request target (e.g. "/?id=%d").
+
+        With a content_type the format ends in a Content-Length: %d header and the
+        blank line; the caller appends the body.
+        """
+        tail = self._tail.replace(b"%", b"%%")
+        if content_type:
+            tail = tail[:-2] + f"Content-Type: {content_type}\r\nContent-Length: %d\r\n\r\n".encode()
+        return method.encode() + b" " + target_format.encode() + tail
+
+    def request(self, data, timeout=None, key=None):
+        """Like get(), for a request already rendered from template(); `key` picks the device's connection."""
+        return _Get(self, data, timeout or self.timeout, key)
+
+    def drop(self, keys):
+        """Cut the dedicated connections of `keys` (device model; reconnect storms)."""
+        for key in keys:
+            conn = self._by_key.pop(key, None)
+            if conn is not None and conn.transport is not None:
+                conn.transport.abort()
+
+    async def _connect(self):
+        loop = asyncio.get_running_loop()
+        t0 = time.perf_counter()
+        _, conn = await asyncio.wait_for(
+            loop.create_connection(lambda: HttpConnection(self._conns.discard), self.host, self.port, ssl=self.ssl),
+            CONNECT_TIMEOUT)
+        if self.on_connect is not None:
+            self.on_connect((time.perf_counter() - t0) * 1000)
+        self._conns.add(conn)
+        return conn
+
+    async def _request(self, data, total, key=None):
+        if self.model == "pool":
+            async with self._slots:
+                conn = None
+                while self._idle:
+                    conn = self._idle.pop()
+                    if not conn.lost:
+                        break
+                    conn = None
+                return await self._exchange(conn or await self._connect(), data, total, key)
+        if self.model == "device":
+            conn = self._by_key.get(key)
+            if conn is None or conn.lost:
+                conn = self._by_key[key] = await self._connect()
+            elif conn.waiter is not None:
+                # The device's previous report is still in flight: this one gets a connection of its own
+                conn = await self._connect()
+            return await self._exchange(conn, data, total, key)
+        return await self._exchange(await self._connect(), data, total, key)
+
+    async def _exchange(self, conn, data, total, key):
+        waiter = conn.request(data)
+        timer = asyncio.get_running_loop().call_later(total, conn.timed_out)
+        try:
+            status, body = await waiter
+        except BaseException:
+            if conn.transport is not None:
+                conn.transport.abort()
+            raise
+        finally:
+            timer.cancel()
+        if conn.keep_alive and not conn.lost and self.model == "pool":
+            self._idle.append(conn)
+        elif conn.keep_alive and not conn.lost and self.model == "device" and self._by_key.get(key) is conn:
+            pass  # stays open, idle until the device's next report
+        else:
+            if self._by_key.get(key) is conn:
+                del self._by_key[key]
+            if conn.transport is not None:
+                conn.transport.close()
+        return RawResponse(status, body)
+
+    async def close(self):
+        for conn in list(self._conns):
+            if conn.transport is not None:
+                conn.transport.close()
+        self._idle.clear()
+        self._by_key.clear()
+        await asyncio.sleep(0)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+        return False
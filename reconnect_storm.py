@@ -0,0 +1,226 @@
+"""
+Reconnect storms: mid-level outages of part of the fleet (--storm).
+
+Each --storm AT:FRACTION:OUTAGE[:JITTER[:DIST]] event takes FRACTION of the
+devices launched so far offline AT seconds into the level, for OUTAGE
+seconds, like a cell-network outage. Their sockets are cut (TCP protocols),
+the sends that fall due during the outage are skipped, and when it ends
+every device reconnects after its own jitter: uniform over [0, JITTER] or
+exponential with mean JITTER (DIST, default exponential). The first report
+after reconnecting starts the device's new send phase, so OUTAGE 0 with
+JITTER 0 is a synchronized burst of the whole fraction.
+
+Each event is measured against the level before it (baseline p99 and fail
+ratio), one second at a time from the reconnection on; the first second
+also holds everything completed during the outage. A second is unhealthy
+when its p99 exceeds RECOVERY_P99_FACTOR x the baseline p99 (at least
+RECOVERY_MIN_P99_MS), its fail ratio exceeds twice the baseline (at least
+RECOVERY_MIN_FAIL_RATIO), or nothing completed while requests were in
+flight. Only those server-side signals count: devices still waiting out
+their jitter do not make a second unhealthy. The report keys are:
+
+  storm_devices        devices taken offline
+  storm_recovery_s     outage end -> end of the last unhealthy second (0: no
+                       unhealthy second; inf: still unhealthy when the level
+                       ended; nan: no storm)
+  storm_reconnect_s    outage end -> last device reconnection, the spread
+                       the jitter gave the reconnects (nan: no storm)
+  storm_peak_inflight  most requests in flight from the outage start on
+  storm_hist           latencies from the outage start until recovery, and
+                       at least until the last device has reconnected, for
+                       storm_p99_ms / storm_max_ms
+
+With several events the devices add up, the peak, recovery and reconnect
+spread are the largest and the histograms are merged.
+"""
+
+import argparse
+import asyncio
+import math
+import random
+import time
+from collections import namedtuple
+
+from latency_histogram import LatencyHistogram
+
+STORM_DISTS = ("uniform", "exponential")
+RECOVERY_P99_FACTOR = 2.0
+RECOVERY_MIN_P99_MS = 20.0
+RECOVERY_MIN_FAIL_RATIO = 0.01
+SAMPLE_S = 0.05
+
+StormEvent = namedtuple("StormEvent", "at fraction outage jitter dist")
+
+
+def parse_storm(text):
+    """argparse type for --storm AT:FRACTION:OUTAGE[:JITTER[:DIST]]."""
+    parts = text.split(":")
+    try:
+        if not 3 <= len(parts) <= 5:
+            raise ValueError
+        at, fraction, outage = float(parts[0]), float(parts[1]), float(parts[2])
+        jitter = float(parts[3]) if len(parts) > 3 else 0.0
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected AT:FRACTION:OUTAGE[:JITTER[:DIST]] in seconds, got {text!r}")
+    dist = parts[4] if len(parts) > 4 else "exponential"
+    if dist not in STORM_DISTS:
+        raise argparse.ArgumentTypeError(f"storm jitter distribution must be one of {', '.join(STORM_DISTS)}")
+    if not 0 < fraction <= 1 or at < 0 or outage < 0 or jitter < 0:
+        raise argparse.ArgumentTypeError(f"storm needs AT, OUTAGE, JITTER >= 0 and 0 < FRACTION <= 1, got {text!r}")
+    return StormEvent(at, fraction, outage, jitter, dist)
+
+
+def empty(hist_digits=3):
+    """Storm report keys for a level without storms."""
+    return {"storm_devices": 0, "storm_recovery_s": float("nan"), "storm_reconnect_s": float("nan"),
+            "storm_peak_inflight": 0, "storm_hist": LatencyHistogram(significant_digits=hist_digits)}
+
+
+def summary_line(stats):
+    """One-line storm summary for the level, or None when no device went offline."""
+    if not stats.get("storm_devices"):
+        return None
+    hist = stats["storm_hist"]
+    recovery = stats["storm_recovery_s"]
+    return (f"Storm: {stats['storm_devices']} devices offline, recovery "
+            f"{'not reached' if math.isinf(recovery) else f'{recovery:.1f} s'}, "
+            f"reconnects over {stats['storm_reconnect_s']:.1f} s, peak in-flight {stats['storm_peak_inflight']}, "
+            f"P99 {hist.percentile(99):.1f} ms, max {hist.max:.1f} ms")
+
+
+def report_values(stats):
+    hist = stats["storm_hist"]
+    return [stats["storm_devices"], f"{stats['storm_recovery_s']:.1f}", stats["storm_peak_inflight"],
+            f"{hist.percentile(99):.1f}", f"{hist.max:.1f}"]
+
+
+class Storms:
+    """Runs the level's storm events against a SendScheduler and measures them into `stats`."""
+
+    def __init__(self, events, stats, scheduler, launched, start=None, on_drop=None, seed=None):
+        """
+        launched(): number of devices launched so far (slots 0..n-1).
+        on_drop(slots): optional, called at an outage start to cut the devices' connections.
+        start: time.monotonic() of the level start (default: now).
+        """
+        self.events = sorted(events)
+        self.stats = stats
+        self.scheduler = scheduler
+        self.launched = launched
+        self.start_time = time.monotonic() if start is None else start
+        self.on_drop = on_drop
+        self.rng = random.Random(seed)
+        self.offline = {}  # slot -> [reconnect time or None once reconnected, stale schedule entries to drop]
+        self._results = []
+        self._tasks = []
+
+    def route(self, slot, due):
+        """False when this schedule entry is dropped (device offline or rescheduled), else None to send it."""
+        state = self.offline.get(slot)
+        if state is None:
+            return None
+        if due == state[0]:
+            state[0] = None  # the reconnection send; the device continues from this phase
+            if not state[1]:
+                del self.offline[slot]
+            return None
+        if state[1] <= 0:
+            return None
+        state[1] -= 1
+        if not state[1] and state[0] is None:
+            del self.offline[slot]
+        return False
+
+    def _jitter(self, event):
+        if event.dist == "uniform":
+            return self.rng.uniform(0, event.jitter)
+        return self.rng.expovariate(1 / event.jitter) if event.jitter > 0 else 0.0
+
+    def _take_offline(self, event, now):
+        slots = [slot for slot in range(self.launched()) if self.rng.random() < event.fraction]
+        up = now + event.outage
+        last = up
+        for slot in slots:
+            back = up + self._jitter(event)
+            last = max(last, back)
+            state = self.offline.get(slot)
+            if state is None:
+                self.offline[slot] = [back, 1]
+            else:
+                # Offline again before the previous reconnection: that entry is stale too
+                state[1] += state[0] is not None
+                state[0] = back
+            self.scheduler.add(slot, back)
+        if self.on_drop is not None and slots:
+            self.on_drop(slots)
+        return slots, up, last
+
+    def _healthy(self, window, completed, failed, baseline_p99, baseline_fail):
+        if not completed:
+            return self.stats.get("inflight", 0) <= 0
+        if failed / completed > max(2 * baseline_fail, RECOVERY_MIN_FAIL_RATIO):
+            return False
+        return window.percentile(99) <= max(RECOVERY_P99_FACTOR * baseline_p99, RECOVERY_MIN_P99_MS)
+
+    async def _run_event(self, event):
+        stats = self.stats
+        await asyncio.sleep(max(0.0, self.start_time + event.at - time.monotonic()))
+        hist = stats["latency_hist"]
+        baseline_p99 = hist.percentile(99)
+        baseline_p99 = 0.0 if math.isnan(baseline_p99) else baseline_p99
+        baseline_fail = stats["fail"] / stats["count"] if stats["count"] else 0.0
+        slots, up, last = self._take_offline(event, time.monotonic())
+        result = {"devices": len(slots), "peak": stats.get("inflight", 0), "recovery": 0.0, "recovered": False,
+                  "spread": last - up, "hist": LatencyHistogram(significant_digits=hist.significant_digits)}
+        self._results.append(result)
+        print(f"[STORM] {len(slots)} devices offline for {event.outage:g}s, "
+              f"reconnecting with {event.dist} jitter {event.jitter:g}s")
+        # Sample until stopped: the peak every SAMPLE_S, health and the storm tail every second after `up`.
+        # The baseline is taken now, so a synchronized burst (OUTAGE and JITTER 0) is in the first second.
+        pending = LatencyHistogram(significant_digits=hist.significant_digits)
+        snap, prev = hist.snapshot(), (stats["ok"], stats["fail"])
+        second_end = up + 1
+        while True:
+            await asyncio.sleep(SAMPLE_S)
+            now = time.monotonic()
+            result["peak"] = max(result["peak"], stats.get("inflight", 0))
+            if now < second_end:
+                continue
+            window = hist.since(snap)
+            snap = hist.snapshot()
+            counters = (stats["ok"], stats["fail"])
+            completed = counters[0] - prev[0] + counters[1] - prev[1]
+            failed = counters[1] - prev[1]
+            prev = counters
+            pending.merge(window)
+            healthy = self._healthy(window, completed, failed, baseline_p99, baseline_fail)
+            if not healthy or second_end - 1 < last:
+                # Still part of the storm tail: everything since the last unhealthy second counts
+                result["hist"].merge(pending)
+                pending = LatencyHistogram(significant_digits=hist.significant_digits)
+            if not healthy:
+                result["recovery"] = second_end - up
+            result["recovered"] = healthy
+            second_end += 1
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._run_event(event)) for event in self.events]
+        return self
+
+    async def stop(self):
+        """Stop measuring and return the storm report keys (see the module docstring)."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        report = empty(self.stats["latency_hist"].significant_digits)
+        recoveries = []
+        for result in self._results:
+            report["storm_devices"] += result["devices"]
+            report["storm_peak_inflight"] = max(report["storm_peak_inflight"], result["peak"])
+            spread = report["storm_reconnect_s"]
+            report["storm_reconnect_s"] = result["spread"] if math.isnan(spread) else max(spread, result["spread"])
+            report["storm_hist"].merge(result["hist"])
+            recoveries.append(result["recovery"] if result["recovered"] else math.inf)
+        if recoveries:
+            report["storm_recovery_s"] = max(recoveries)
+        return report
@@ -0,0 +1,116 @@
+"""
+Central send scheduler for the simulators.
+
+Instead of one sleeping coroutine per device, every device's next send time
+lives in a hashed timer wheel keyed by tick number. A single loop wakes once
+per tick, collects the devices that are due, lets the caller prepare them as
+one batch (e.g. a vectorized fleet step) and hands the sends to a bounded
+pool of worker coroutines. Idle cost therefore scales with the tick rate and
+CPU cost with the message rate, not with the number of devices.
+"""
+
+import asyncio
+import time
+from collections import defaultdict
+
+
+class SendScheduler:
+    def __init__(self, send, workers, interval, stop_time, prepare=None, tick=0.01):
+        """
+        send(slot, due, payload): coroutine performing one send for `slot`; `due` is its scheduled time.
+            Returning False ends this schedule entry instead of repeating it after `interval`
+            (the caller has rescheduled the slot itself, e.g. reconnect_storm.py). An exception is
+            logged (the first one) and counted in `errors`; the slot keeps its schedule.
+        prepare(slots): optional, called once per tick with all due slots; returns one payload per slot.
+        workers: number of concurrent sends in flight at most.
+        interval: seconds between sends of the same device; stop_time: time.monotonic() deadline
+        (float('inf') to run until stop() is called).
+        """
+        self.send = send
+        self.prepare = prepare
+        self.workers = max(1, workers)
+        self.interval = interval
+        self.stop_time = stop_time
+        self.tick = tick
+        self._wheel = defaultdict(list)
+        self._next_tick = int(time.monotonic() / tick)
+        self._queue = asyncio.Queue()
+        self._closed = False
+        self._workers = []
+        self.scheduled = 0
+        self.errors = 0
+
+    def add(self, slot, at):
+        """Schedule a send for `slot` at monotonic time `at`; ignored at or after stop_time."""
+        if self._closed or at >= self.stop_time:
+            return
+        self._wheel[max(int(at / self.tick), self._next_tick)].append((slot, at))
+        self.scheduled += 1
+
+    def set_workers(self, workers):
+        """Grow the worker pool of a running scheduler to `workers` (it never shrinks)."""
+        self.workers = max(self.workers, workers)
+        while self._workers and len(self._workers) < self.workers:
+            self._workers.append(asyncio.create_task(self._worker()))
+
+    def stop(self):
+        """End a running scheduler now: due sends are dispatched, nothing new is scheduled."""
+        self.stop_time = min(self.stop_time, time.monotonic())
+
+    def _collect(self, upto_tick):
+        due = []
+        wheel = self._wheel
+        while self._next_tick <= upto_tick:
+            bucket = wheel.pop(self._next_tick, None)
+            if bucket:
+                due.extend(bucket)
+            self._next_tick += 1
+        return due
+
+    def _dispatch(self, due):
+        self.scheduled -= len(due)
+        slots = [slot for slot, _ in due]
+        payloads = self.prepare(slots) if self.prepare else [None] * len(slots)
+        put = self._queue.put_nowait
+        for (slot, at), payload in zip(due, payloads):
+            put((slot, at, payload))
+
+    async def _worker(self):
+        queue = self._queue
+        while True:
+            slot, at, payload = await queue.get()
+            try:
+                repeat = await self.send(slot, at, payload) is not False
+            except Exception as e:
+                # Keep the worker alive and the slot scheduled; a dead worker would shrink the pool for the run
+                self.errors += 1
+                if self.errors == 1:
+                    print(f"[SCHED] send for slot {slot} raised {type(e).__name__}: {e} (further errors only counted)")
+                repeat = True
+            finally:
+                queue.task_done()
+            if repeat:
+                self.add(slot, at + self.interval)
+
+    async def run(self):
+        """Dispatch due sends until stop_time, then wait for the in-flight ones to finish."""
+        workers = self._workers = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        try:
+            while True:
+                now = time.monotonic()
+                if now >= self.stop_time:
+                    break
+                due = self._collect(int(now / self.tick))
+                if due:
+                    self._dispatch(due)
+                await asyncio.sleep(min(self.tick, self.stop_time - now))
+            # Sends that fell due before the deadline but inside the last partial tick
+            self._closed = True
+            due = [(slot, at) for slot, at in self._collect(int(self.stop_time / self.tick)) if at < self.stop_time]
+            if due:
+                self._dispatch(due)
+            await self._queue.join()
+        finally:
+            for w in workers:
+                w.cancel()
+            self._wheel.clear()
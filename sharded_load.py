@@ -0,0 +1,89 @@
+"""
+Multi-process load generation for the simulators (--workers N).
+
+The SIM device IDs are split round-robin across N processes. Each process
+runs the simulator's own load function with its own aiohttp session and
+connector, and all of them start at a shared wall-clock instant. The parent
+merges the per-process counters and latency histograms back into a single
+stats dict, so ramp_runner writes the same per-level CSV row as a
+single-process run.
+"""
+
+import argparse
+import asyncio
+import math
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from latency_histogram import LatencyHistogram
+
+# Time given to worker processes to start before the shared level start
+STARTUP_GRACE = 1.0
+MAX_FAILURE_SAMPLES = 50
+# Numeric stats summed across processes; every LatencyHistogram value is merged.
+# Memory is the whole generator's; CPU% is the busiest process's. Storm peaks add up
+# across processes (an upper bound of the fleet-wide peak); recovery and reconnect spread are the slowest.
+SUM_KEYS = ("ok", "fail", "count", "late", "positions", "buffered", "storm_devices", "storm_peak_inflight",
+            "connections", "gen_rss_mb")
+MAX_KEYS = ("gen_cpu_percent", "storm_recovery_s", "storm_reconnect_s")
+
+
+def shard_ids(device_ids, shards):
+    """Split device_ids round-robin into `shards` lists (empty shards dropped)."""
+    return [s for s in (list(device_ids[i::shards]) for i in range(shards)) if s]
+
+
+def _run_shard(load_fn, args, base_url, device_ids, start_at):
+    stats = asyncio.run(load_fn(args, base_url, device_ids, start_at))
+    stats["statuses"] = dict(stats["statuses"])
+    return stats
+
+
+async def wait_until(start_at):
+    """Sleep until wall-clock time start_at (no-op when None or already past)."""
+    if start_at is not None:
+        delay = start_at - time.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+def merge_stats(parts):
+    """Merge stats dicts produced by separate load processes into one."""
+    merged = dict(parts[0])
+    merged["statuses"] = defaultdict(int, parts[0]["statuses"])
+    merged["failure_samples"] = list(parts[0]["failure_samples"])
+    for part in parts[1:]:
+        for key in SUM_KEYS:
+            if key in part:
+                merged[key] += part[key]
+        for key in MAX_KEYS:
+            if key in part:
+                merged[key] = max(merged[key], part[key])
+        for key, value in part.items():
+            if isinstance(value, LatencyHistogram):
+                merged[key].merge(value)
+        for status, n in part["statuses"].items():
+            merged["statuses"][status] += n
+        merged["failure_samples"].extend(part["failure_samples"])
+    del merged["failure_samples"][MAX_FAILURE_SAMPLES:]
+    return merged
+
+
+async def run_sharded(load_fn, args, base_url, device_ids, workers):
+    """Run load_fn(args, base_url, ids, start_at) in `workers` processes and merge the results."""
+    shards = shard_ids(device_ids, workers)
+    start_at = time.time() + STARTUP_GRACE
+    loop = asyncio.get_running_loop()
+    print(f"[WORKERS] Splitting {len(device_ids)} devices across {len(shards)} processes")
+    with ProcessPoolExecutor(max_workers=len(shards)) as pool:
+        futures = []
+        for index, ids in enumerate(shards):
+            shard_args = argparse.Namespace(**vars(args))
+            shard_args.devices = len(ids)
+            # Each process gets its share of the socket budget
+            shard_args.concurrency = max(1, math.ceil(args.concurrency / len(shards)))
+            shard_args.worker_index = index
+            futures.append(loop.run_in_executor(pool, _run_shard, load_fn, shard_args, base_url, ids, start_at))
+        parts = await asyncio.gather(*futures)
+    return merge_stats(parts)
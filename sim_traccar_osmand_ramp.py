@@ -1,49 +1,39 @@
 import asyncio
-import random
 import time
 import argparse
-from collections import deque, defaultdict
-from urllib.parse import urlencode, urljoin
+from collections import defaultdict
+from urllib.parse import urljoin
 import statistics
 from dotenv import load_dotenv
 import sys
 import os
-import requests
 
 import aiohttp
 
+import device_registry
+from fleet_state import FleetState
+from send_scheduler import SendScheduler
+from latency_histogram import LatencyHistogram
+from ramp_report import open_report
+from sharded_load import run_sharded, wait_until
+from loadgen_cluster import LoadCoordinator, parse_host_port, run_agent
+from loop_monitor import LoopMonitor, generator_overloaded
+import timeseries
+import metrics_endpoint
+import droplet_metrics
+import host_sampler
+import tcp_fleet
+import raw_http
+import osmand_request
+import osmand_backlog
+import reconnect_storm
+import connection_model
+
 # Cache for simulation device IDs fetched from Traccar (lazy filled)
 global_taken_ids = None
 
-def seeded_rng(seed):
-    rnd = random.Random()
-    rnd.seed(seed)
-    return rnd
-
-def make_device_state(dev_id, rng):
-    # Seed each device around a center (Cebu example) with slight offsets
-    lat = 10.3157 + rng.uniform(-0.05, 0.05)
-    lon = 123.8854 + rng.uniform(-0.05, 0.05)
-    bearing = rng.uniform(0, 360)
-    speed_kmh = rng.uniform(5, 40)  # moving-ish
-    return {"id": dev_id, "lat": lat, "lon": lon, "bearing": bearing, "speed_kmh": speed_kmh}
-
-def step_device(state, rng, dt_seconds):
-    # Random walk with mild drift; wrap bearing 0..360
-    turn = rng.uniform(-6, 6)
-    state["bearing"] = (state["bearing"] + turn) % 360
-    # Convert km/h to deg/sec approx (rough near equator; fine for load)
-    # 1 km ~ 0.009 deg lat; scale lon by cos(lat).
-    kmps = state["speed_kmh"] / 3600.0
-    dlat = kmps * 0.009 * dt_seconds
-    dlon = dlat * max(0.2, abs(math.cos(math.radians(state["lat"]))))
-    # Move along bearing
-    rad = math.radians(state["bearing"])
-    state["lat"] += dlat * math.cos(rad)
-    state["lon"] += dlon * math.sin(rad)
-    # occasional stop/start
-    if rng.random() < 0.02:
-        state["speed_kmh"] = 0 if state["speed_kmh"] > 1 else rng.uniform(10, 40)
+# Set when running as a coordinator; levels are then executed by the connected agents
+cluster_coordinator = None
 
 import math
 
@@ -64,95 +54,172 @@ class RateLimiter:
             return True
         return False
 
-async def device_task(dev_id, session, base_url, interval, stop_time, stats, rng, args):
-    state = make_device_state(dev_id, rng)
-    next_send = time.monotonic()
-    while time.monotonic() < stop_time:
-        now = time.monotonic()
-        if now < next_send:
-            await asyncio.sleep(min(0.05, next_send - now))
-            continue
-        # step sim by 'interval'
-        step_device(state, rng, interval)
-        ts = int(time.time())
-        params = {
-            "id": f"{dev_id}",
-            "lat": f"{state['lat']:.6f}",
-            "lon": f"{state['lon']:.6f}",
-            "timestamp": ts,
-            "speed": f"{state['speed_kmh']*0.2778:.2f}",  # m/s
-            "bearing": f"{state['bearing']:.1f}",
-            # add anything else you’d like (hdop, altitude, input1, etc.)
-        }
-        url = f"{base_url.rstrip('/')}/?{urlencode(params)}"
-
-        t0 = time.perf_counter()
+async def send_update(dev_id, lat, lon, speed_kmh, bearing, due, template, stats, args, backlog=None):
+    vals = osmand_request.values(dev_id, lat, lon, speed_kmh, bearing)
+    if backlog is None:
+        await send_request(dev_id, 1, template.get(vals), lambda: f"url={template.url(vals)}", due, stats, args)
+        return
+    # Batch mode: buffer the position; upload whatever the device's backlog releases now
+    for body, positions in backlog.add(dev_id, vals):
+        await send_request(dev_id, positions, template.post(body, dev_id),
+                           lambda: f"batch={positions} url={template.post_url}", due, stats, args)
+
+async def send_request(dev_id, positions, request, describe, due, stats, args):
+    """Await one OsmandTemplate request carrying `positions` positions and record its outcome in stats."""
+    # How far behind its schedule this send is; adding it to the response time gives the
+    # latency against the intended send time, so server stalls that delay later sends
+    # show up in the corrected percentiles instead of being hidden (coordinated omission)
+    late_ms = max(0.0, (time.monotonic() - due) * 1000)
+    if late_ms > args.late_threshold_ms:
+        stats["late"] += 1
+        stats["late_hist"].record(late_ms)
+    stats["inflight"] += 1
+    t0 = time.perf_counter()
+    ok = False
+    try:
+        async with request as resp:
+            body = await resp.read()  # small; ensures connection reuse
+            status = resp.status
+            ok = (200 <= status < 300)
+            if not ok:
+                stats["statuses"][status] += 1
+                if args.print_failures and len(stats["failure_samples"]) < args.print_failures:
+                    stats["failure_samples"].append(
+                        f"dev={dev_id} status={status} body={body[:120]!r} {describe()}"
+                    )
+            else:
+                stats["statuses"][status] += 1
+        
+    except Exception as e:
+        stats["statuses"]["exception"] += 1
+        if args.print_failures and len(stats["failure_samples"]) < args.print_failures:
+            stats["failure_samples"].append(f"dev={dev_id} exception={type(e).__name__}:{e} {describe()}")
         ok = False
-        try:
-            async with session.get(url, timeout=aiohttp.ClientTimeout(total=30)) as resp:
-                body = await resp.read()  # small; ensures connection reuse
-                status = resp.status
-                ok = (200 <= status < 300)
-                if not ok:
-                    stats["statuses"][status] += 1
-                    if args.print_failures and len(stats["failure_samples"]) < args.print_failures:
-                        stats["failure_samples"].append(
-                            f"dev={dev_id} status={status} body={body[:120]!r} url={url}"
-                        )
-                else:
-                    stats["statuses"][status] += 1
-            
-        except Exception as e:
-            stats["statuses"]["exception"] += 1
-            if args.print_failures and len(stats["failure_samples"]) < args.print_failures:
-                stats["failure_samples"].append(f"dev={dev_id} exception={type(e).__name__}:{e} url={url}")
-            ok = False
-        dt = (time.perf_counter() - t0) * 1000
-        stats["latencies"].append(dt)
-        if ok:
-            stats["ok"] += 1
-        else:
-            stats["fail"] += 1
-        stats["count"] += 1
-        next_send += interval
-
-async def runner(args, base_url:str):
-    timeout = aiohttp.ClientTimeout(total=15, connect=5)
-    connector = aiohttp.TCPConnector(limit=args.concurrency, ssl=False if args.insecure else None)
-    headers = {"User-Agent": "osmand-sim/1.0"}
-
-    stats = {
+    dt = (time.perf_counter() - t0) * 1000
+    stats["inflight"] -= 1
+    stats["latency_hist"].record(dt)
+    stats["latency_hist_co"].record(dt + late_ms)
+    if ok:
+        stats["ok"] += 1
+        stats["positions"] += positions
+    else:
+        stats["fail"] += 1
+    stats["count"] += 1
+
+def new_stats(args):
+    return {
         "ok": 0, "fail": 0, "count": 0,
-        "latencies": deque(maxlen=200000),  # keep a big rolling window
+        "positions": 0,  # positions delivered by successful requests (more than ok with --batch-size)
+        "buffered": 0,  # positions still held by offline/batching devices at the end of the level
+        "inflight": 0,  # requests started but not finished
+        "latency_hist": LatencyHistogram(significant_digits=args.hist_digits),
+        "latency_hist_co": LatencyHistogram(significant_digits=args.hist_digits),  # from scheduled send time
+        "late": 0,  # sends that started more than --late-threshold-ms after schedule
+        "late_hist": LatencyHistogram(significant_digits=args.hist_digits),
         "statuses": defaultdict(int),
         "failure_samples": [],
-        "bandwidth_pub_out": float('nan'),  # will be populated once per run
-        "bandwidth_pub_in": float('nan'),  # will be populated once per run
-        "cpu_percent": float('nan'),  # will be populated once per run
-        "memory_usage": float('nan'),  # will be populated once per run
-        "load_1m": float('nan'),  # will be populated once per run
-        "load_5m": float('nan'),  # will be populated once per run
-        "load_15m": float('nan'),  # will be populated once per run
-        "disk_usage_percent": float('nan')
+        **droplet_metrics.empty(),  # droplet mean/_max/_last over the level, filled by runner
+        **reconnect_storm.empty(args.hist_digits),  # filled by reconnect_storm.Storms with --storm
+        **connection_model.empty(args.hist_digits),  # connections opened and their setup time
+        "gen_lag_hist": LatencyHistogram(significant_digits=args.hist_digits),
+        "gen_cpu_percent": float('nan'),  # load generator process, filled by LoopMonitor
+        "gen_rss_mb": float('nan'),
     }
 
+async def run_load(args, base_url:str, device_ids, start_at=None, stats=None):
+    """Simulate `device_ids` for args.duration seconds in this process and return the raw stats.
+
+    device_ids: a list of IDs, or an async iterator of ID batches (stream_simulation_device_ids)
+    whose devices are launched as the batches arrive.
+
+    start_at: optional wall-clock start shared with other load processes.
+    stats: optional dict from new_stats() to fill, so callers can watch counters live.
+    """
+    timeout = aiohttp.ClientTimeout(total=15, connect=5)
+    model = getattr(args, "connection_model", "pool")
+    connector = connection_model.aiohttp_connector(model, args.concurrency, ssl=False if args.insecure else None)
+    headers = {"User-Agent": "osmand-sim/1.0"}
+    if stats is None:
+        stats = new_stats(args)
+    # TCP tracker protocols keep their own per-device connections; the HTTP session is then idle
+    tcp = tcp_fleet.TcpFleet(args, base_url, stats) if getattr(args, "protocol", "osmand") != "osmand" else None
+    # --transport raw: bare keep-alive sockets in place of aiohttp, same send_update() and stats
+    on_connect = connection_model.recorder(stats)
+    raw = None
+    if tcp is None and getattr(args, "transport", "aiohttp") == "raw":
+        raw = raw_http.RawHttpSession(base_url, limit=args.concurrency, insecure=args.insecure, headers=headers,
+                                      model=model, on_connect=on_connect)
+
+    label = f"[w{args.worker_index}] " if getattr(args, "worker_index", None) is not None else ""
+    await wait_until(start_at)
+    monitor = LoopMonitor(significant_digits=args.hist_digits)
+    monitor.start()
+    sampler = None
+    if getattr(args, "timeseries", None):
+        sampler = timeseries.SecondSampler(args.timeseries, stats, level=getattr(args, "level", 0),
+                                           worker=getattr(args, "worker_index", None) or 0,
+                                           connector=tcp or raw or connector, monitor=monitor).start()
     stop_time = time.monotonic() + args.duration
-    async with aiohttp.ClientSession(timeout=timeout, connector=connector, headers=headers) as session:
+    async with raw or aiohttp.ClientSession(timeout=timeout, connector=connector, headers=headers,
+                                            trace_configs=[connection_model.aiohttp_trace(on_connect)]) as session:
         # Launch devices in waves, using an effective launch rate automatically boosted
         # to at least 1.5x (devices / duration) so that all devices start early in the run.
-        tasks = []
-        sim_device_ids = get_simulation_device_ids(args.devices)
+        fleet = FleetState([], args.seed)
+        if getattr(args, "metrics_port", None):
+            index = getattr(args, "worker_index", None)
+            # Sharded processes serve on consecutive ports after the parent's
+            await metrics_endpoint.ensure_server(args.metrics_host, args.metrics_port + (0 if index is None else index + 1))
+            metrics_endpoint.publish(stats=stats, monitor=monitor, connector=tcp or raw or connector, launched=fleet.__len__,
+                                     level=getattr(args, "level", 0), worker=index or 0)
+
+        def prepare(slots):
+            # step sim by 'interval' for every device due in this tick
+            fleet.advance(slots, args.interval)
+            return zip(*fleet.snapshot(slots))
+
+        template = osmand_request.OsmandTemplate(base_url, session)
+        if tcp is not None:
+            async def send(slot, due, update):
+                await tcp.send(slot, due, *update)
+        else:
+            backlog = osmand_backlog.Backlog.from_args(args, stop_time) if osmand_backlog.enabled(args) else None
+
+            async def send(slot, due, update):
+                await send_update(*update, due, template, stats, args, backlog)
+
+        if getattr(args, "storm", None):
+            deliver = send
+
+            async def send(slot, due, update):
+                # Schedule entries of devices a storm took offline are dropped (reconnect_storm.py)
+                if storms.route(slot, due) is False:
+                    return False
+                await deliver(slot, due, update)
+
+        scheduler = SendScheduler(send, workers=args.concurrency, interval=args.interval,
+                                  stop_time=stop_time, prepare=prepare)
+        sched_task = asyncio.create_task(scheduler.run())
+        storms = None
+        if getattr(args, "storm", None):
+            storm_drop = None
+            if tcp is not None:
+                storm_drop = tcp.drop
+            elif raw is not None and model == "device":
+                storm_drop = lambda slots: raw.drop(fleet.ids[slots].tolist())
+            storms = reconnect_storm.Storms(args.storm, stats, scheduler, fleet.__len__, start=stop_time - args.duration,
+                                            on_drop=storm_drop, seed=args.seed).start()
+
         duration = max(1, args.duration)  # avoid div by zero
-        default_min_rate = args.devices / duration
+        expected = len(device_ids) if hasattr(device_ids, "__len__") else args.devices
+        default_min_rate = expected / duration
         adjusted_min_rate = default_min_rate * 1.1  # Add 10% headroom
-        print(f"[LAUNCH] Default min launch rate: {default_min_rate:.2f} devices/sec, adjusted to {adjusted_min_rate:.2f} devices/sec")
+        print(f"{label}[LAUNCH] Default min launch rate: {default_min_rate:.2f} devices/sec, adjusted to {adjusted_min_rate:.2f} devices/sec")
         launch_rate = RateLimiter(rate_per_sec=adjusted_min_rate)  # devices/sec
-        for id in sim_device_ids:
-            if not launch_rate.allow():
-                await asyncio.sleep(0.01)
-            dev_rng = seeded_rng(args.seed + id)
-            t = asyncio.create_task(device_task(id, session, base_url, args.interval, stop_time, stats, dev_rng, args))
-            tasks.append(t)
+        async for ids in device_registry.id_batches(device_ids):
+            for slot in fleet.extend(ids):
+                if not launch_rate.allow():
+                    await asyncio.sleep(0.01)
+                scheduler.add(slot, time.monotonic())
         
         # Progress logging
         async def progress():
@@ -163,7 +230,7 @@ async def runner(args, base_url:str):
                 now = time.time()
                 delta = stats["count"] - last
                 rps = delta / (now - last_ts)
-                line = f"[{time.strftime('%H:%M:%S')}] sent={stats['count']} ok={stats['ok']} fail={stats['fail']} rps={rps:.1f}"
+                line = f"{label}[{time.strftime('%H:%M:%S')}] sent={stats['count']} ok={stats['ok']} fail={stats['fail']} rps={rps:.1f}"
                 if args.status_summary:
                     # show top 3 statuses
                     top = sorted(stats["statuses"].items(), key=lambda x: (-x[1], str(x[0])))[:3]
@@ -178,28 +245,160 @@ async def runner(args, base_url:str):
                 last, last_ts = stats["count"], now
 
         pr = asyncio.create_task(progress())
-        await asyncio.gather(*tasks)
+        await sched_task
         pr.cancel()
+        if storms is not None:
+            stats.update(await storms.stop())
+        if tcp is not None:
+            await tcp.close()
+        elif backlog is not None:
+            stats["buffered"] = backlog.buffered
+    if sampler is not None:
+        sampler.stop()
+    stats.update(monitor.stop())
+    return stats
+
+WINDOW_COUNTERS = ("ok", "fail", "count", "late", "positions", "connections")
+WINDOW_HISTS = ("latency_hist", "latency_hist_co", "late_hist", "connect_hist")
 
-    # Fetch bandwidth once at end (still inside session for connection reuse)
-    stats["bandwidth_pub_out"] = await fetch_droplet_bandwidth_kbps(stats, "outbound")
-    stats["bandwidth_pub_in"] = await fetch_droplet_bandwidth_kbps(stats, "inbound")
-    stats["memory_usage"] = await fetch_droplet_memory_usage()
-    stats["load_1m"] = await fetch_droplet_load(1)
-    stats["load_5m"] = await fetch_droplet_load(5)
-    stats["load_15m"] = await fetch_droplet_load(15)
-    stats["disk_usage_percent"] = await fetch_droplet_disk_usage()
-    await fetch_droplet_cpu_usage(stats)
+class WarmFleet:
+    """Devices, connections and scheduler kept running across ramp levels (--continuous).
+
+    Each level only launches the devices added since the previous one; the
+    already running devices keep their connections, positions and send
+    schedule. Level stats are a window over the shared live counters: counter
+    and status deltas, plus latency histograms swapped in at the window start.
+    """
+
+    def __init__(self, args, base_url):
+        self.args = args
+        self.base_url = base_url
+        self.stats = new_stats(args)
+        self.fleet = FleetState([], args.seed)
+        self.session = None
+        self.scheduler = None
+        self.sampler = None
+        self.backlog = None
+        self._sched_task = None
+
+    async def start(self):
+        timeout = aiohttp.ClientTimeout(total=15, connect=5)
+        headers = {"User-Agent": "osmand-sim/1.0"}
+        model = self.args.connection_model
+        on_connect = connection_model.recorder(self.stats)
+        if self.args.transport == "raw":
+            connector = self.session = raw_http.RawHttpSession(self.base_url, limit=self.args.max_concurrency,
+                                                               insecure=self.args.insecure, headers=headers,
+                                                               model=model, on_connect=on_connect)
+        else:
+            connector = connection_model.aiohttp_connector(model, self.args.max_concurrency,
+                                                           ssl=False if self.args.insecure else None)
+            self.session = aiohttp.ClientSession(timeout=timeout, connector=connector, headers=headers,
+                                                 trace_configs=[connection_model.aiohttp_trace(on_connect)])
+        fleet, args = self.fleet, self.args
+        template = osmand_request.OsmandTemplate(self.base_url, self.session)
+        self.backlog = backlog = (osmand_backlog.Backlog.from_args(args, time.monotonic() + args.duration_per_level)
+                                  if osmand_backlog.enabled(args) else None)
+
+        def prepare(slots):
+            fleet.advance(slots, args.interval)
+            return zip(*fleet.snapshot(slots))
+
+        async def send(slot, due, update):
+            await send_update(*update, due, template, self.stats, args, backlog)
+
+        self.scheduler = SendScheduler(send, workers=args.concurrency_start or args.concurrency,
+                                       interval=args.interval, stop_time=float("inf"), prepare=prepare)
+        self._sched_task = asyncio.create_task(self.scheduler.run())
+        if args.timeseries:
+            self.sampler = timeseries.SecondSampler(args.timeseries, self.stats, connector=connector).start()
+        if args.metrics_port:
+            await metrics_endpoint.ensure_server(args.metrics_host, args.metrics_port)
+            metrics_endpoint.publish(stats=self.stats, connector=connector, launched=fleet.__len__)
+
+    async def close(self):
+        if self.sampler is not None:
+            self.sampler.stop()
+        if self.scheduler is not None:
+            self.scheduler.stop()
+            await self._sched_task
+        if self.session is not None:
+            await self.session.close()
+
+    async def _launch(self, device_ids, duration):
+        """Launch new devices at the same paced rate run_load uses for a fresh level."""
+        launch_rate = RateLimiter(rate_per_sec=max(1.0, len(device_ids) / max(1, duration) * 1.1))
+        for slot in self.fleet.extend(device_ids):
+            if not launch_rate.allow():
+                await asyncio.sleep(0.01)
+            self.scheduler.add(slot, time.monotonic())
+
+    async def run_level(self, args, device_ids):
+        """Grow the fleet to `device_ids` and return the stats of the next args.duration seconds."""
+        stats = self.stats
+        self.scheduler.set_workers(args.concurrency)
+        base = {key: stats[key] for key in WINDOW_COUNTERS}
+        base_statuses = dict(stats["statuses"])
+        for key in WINDOW_HISTS:
+            stats[key] = LatencyHistogram(significant_digits=args.hist_digits)
+        stats["failure_samples"] = []
+        new_ids = device_ids[len(self.fleet):]
+        print(f"[CONTINUOUS] {len(self.fleet)} devices running; launching {len(new_ids)} more")
+        monitor = LoopMonitor(significant_digits=args.hist_digits)
+        monitor.start()
+        if self.sampler is not None:
+            self.sampler.level, self.sampler.monitor = args.level, monitor
+        metrics_endpoint.publish(monitor=monitor, level=args.level)
+        if self.backlog is not None:
+            # Warm and new devices alike draw an outage that ends within this level
+            self.backlog.new_level(time.monotonic() + args.duration)
+        launch = asyncio.create_task(self._launch(new_ids, args.duration))
+        await asyncio.sleep(args.duration)
+        window = new_stats(args)
+        for key in WINDOW_COUNTERS:
+            window[key] = stats[key] - base[key]
+        for key in WINDOW_HISTS:
+            window[key] = stats[key]
+        for status, n in stats["statuses"].items():
+            if n - base_statuses.get(status, 0):
+                window["statuses"][status] = n - base_statuses.get(status, 0)
+        window["failure_samples"] = stats["failure_samples"]
+        if self.backlog is not None:
+            window["buffered"] = self.backlog.buffered
+        window.update(monitor.stop())
+        if not launch.done():
+            print("[CONTINUOUS] Launch of new devices still running at the end of the level")
+        return window
+
+async def runner(args, base_url:str, warm=None):
+    level_start = time.time()
+    host = host_sampler.start(args, getattr(args, "level", 0))
+    try:
+        if warm is not None:
+            stats = await warm.run_level(args, get_simulation_device_ids(args.devices, refresh=args.refresh_device_cache))
+        elif cluster_coordinator is None and args.workers <= 1:
+            # Single process: start launching while the device list is still downloading
+            stats = await run_load(args, base_url, stream_simulation_device_ids(args.devices, refresh=args.refresh_device_cache))
+        else:
+            sim_device_ids = get_simulation_device_ids(args.devices, refresh=args.refresh_device_cache)
+            if cluster_coordinator is not None:
+                stats = await cluster_coordinator.run_level(args, base_url, sim_device_ids)
+            else:
+                stats = await run_sharded(run_load, args, base_url, sim_device_ids, args.workers)
+    finally:
+        if host is not None:
+            await host.stop()
+
+    if host is not None and host.replaces_droplet_metrics:
+        # Host resources from the samples taken while the level ran
+        stats.update(host.level_metrics(level_start, time.time()))
+    else:
+        # Droplet metrics for exactly this level's window, all queries at once
+        stats.update(await droplet_metrics.collect(level_start, time.time(), stats["statuses"]))
 
     # Summarize
-    lats = list(stats["latencies"])
-    lats.sort()
-    def pct(p):
-        if not lats:
-            return float('nan')
-        k = int(len(lats)*p/100)
-        k = min(max(k, 0), len(lats)-1)
-        return lats[k]
+    hist = stats["latency_hist"]
+    pct = hist.percentile
     total = stats["count"]
     print("\n=== Summary ===")
     print(f"Devices: {args.devices}, Interval: {args.interval}s, Duration: {args.duration}s")
@@ -208,99 +407,255 @@ async def runner(args, base_url:str):
         total_rps = total / args.duration
         ok_rps = stats['ok'] / args.duration
         print(f"Average RPS over {args.duration}s: total={total_rps:.2f}, ok={ok_rps:.2f}")
+        print(f"Positions delivered: {stats['positions']} ({stats['positions'] / args.duration:.2f}/s)"
+              + (f", {stats['buffered']} still buffered" if stats['buffered'] else ""))
     if stats["statuses"]:
         print("Status breakdown:")
         for k, v in sorted(stats["statuses"].items(), key=lambda x: (-x[1], str(x[0]))):
             print(f"  {k}: {v}")
     if total > 0:
-        print(f"P50: {pct(50):.1f} ms, P90: {pct(90):.1f} ms, P99: {pct(99):.1f} ms")
-    if not math.isnan(stats.get("bandwidth", float('nan'))):
-        print(f"Outbound bandwidth (latest 1m sample): {stats['bandwidth']:.2f} kbps")
+        print(f"P50: {pct(50):.1f} ms, P90: {pct(90):.1f} ms, P99: {pct(99):.1f} ms, Max: {hist.max:.1f} ms")
+        co = stats["latency_hist_co"]
+        print(f"Corrected from schedule: P50: {co.percentile(50):.1f} ms, P90: {co.percentile(90):.1f} ms, "
+              f"P99: {co.percentile(99):.1f} ms, Max: {co.max:.1f} ms")
+        late = stats["late_hist"]
+        print(f"Late sends (> {args.late_threshold_ms} ms behind schedule): {stats['late']}"
+              + (f", P99 lateness {late.percentile(99):.1f} ms, max {late.max:.1f} ms" if stats['late'] else ""))
+    lag = stats["gen_lag_hist"]
+    print(f"Generator: loop lag p99 {lag.percentile(99):.1f} ms, max {lag.max:.1f} ms, "
+          f"CPU {stats['gen_cpu_percent']:.0f}%, RSS {stats['gen_rss_mb']:.0f} MB")
+    droplet = droplet_metrics.summary_line(stats)
+    if droplet:
+        print(droplet)
+    storm = reconnect_storm.summary_line(stats)
+    if storm:
+        print(storm)
+    conns = connection_model.summary_line(stats, args.duration)
+    if conns:
+        print(conns)
     # Attach percentile helper for reuse by ramp
-    stats["_latencies_sorted"] = lats
     stats["pct"] = pct
     return stats
 
+async def coordinated_ramp_runner(args, base_url):
+    """Run ramp_runner (or search_runner) with every level executed by remote agents."""
+    global cluster_coordinator
+    cluster_coordinator = LoadCoordinator(args.expect_agents)
+    await cluster_coordinator.start(*parse_host_port(args.coordinator))
+    try:
+        await (search_runner(args, base_url) if args.search else ramp_runner(args, base_url))
+    finally:
+        await cluster_coordinator.close()
+
+async def run_level(args, base_url, writer, level, devices, concurrency, warm=None):
+    """Run one level of `devices` at `concurrency`, append its CSV row and return the level result.
+
+    The result dict holds the raw stats plus fail_ratio, p99, overloaded and
+    expected_total/observed_total (messages every device should have sent vs. sent; positions
+    produced vs. delivered or still buffered with --batch-size/--offline-fraction).
+    warm: optional WarmFleet (--continuous) that runs the level on the already running fleet.
+    CSV columns: see ramp_report.REPORT_COLUMNS
+    """
+    import json
+
+    print(f"\n=== Level {level}: devices={devices} concurrency={concurrency} duration={args.duration_per_level}s ===")
+    # Build a lightweight args clone for single run
+    single = argparse.Namespace(**vars(args))
+    single.devices = devices
+    single.concurrency = concurrency
+    single.duration = args.duration_per_level
+    single.level = level
+    stats = await runner(single, base_url, warm)
+    total = stats['count'] or 1
+    fail_ratio = stats['fail']/total
+    p50 = stats['pct'](50)
+    p90 = stats['pct'](90)
+    p99 = stats['pct'](99)
+    max_ms = stats['latency_hist'].max
+    gen_lag = stats['gen_lag_hist']
+    co = stats['latency_hist_co']
+    late = stats['late_hist']
+    overloaded = generator_overloaded(stats, args.max_loop_lag_ms)
+    # average rps across run (total) and successful-only (ok)
+    rps_avg = total / single.duration if single.duration > 0 else 0
+    rps_ok_avg = stats['ok'] / single.duration if single.duration > 0 else 0
+    statuses_json = json.dumps(dict(stats['statuses']))
+    statuses = stats['statuses']
+    timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())
+    bandwith_pub_out = stats["bandwidth_pub_out"]
+    bandwith_pub_in = stats["bandwidth_pub_in"]
+    cpu_usage = stats.get("cpu_percent", float('nan'))
+    memory_usage = stats.get("memory_usage", float('nan'))
+    load_1m = stats.get("load_1m", float('nan'))
+    load_5m = stats.get("load_5m", float('nan'))
+    load_15m = stats.get("load_15m", float('nan'))
+    disk_usage_percent = stats.get("disk_usage_percent", float('nan'))
+    writer.writerow([timestamp,level, devices, concurrency, single.duration, stats['ok'], stats['fail'], 
+                     f"{fail_ratio:.4f}", f"{rps_avg:.2f}", f"{rps_ok_avg:.2f}", f"{p50:.1f}", f"{p90:.1f}", f"{p99:.1f}", 
+                     f"{bandwith_pub_out:.1f}", f"{bandwith_pub_in:.1f}", f"{cpu_usage:.1f}", 
+                     f"{memory_usage:.1f}", f"{load_1m:.2f}", f"{load_5m:.2f}", f"{load_15m:.2f}", f"{disk_usage_percent:.2f}",
+                     f"{max_ms:.1f}", f"{gen_lag.percentile(99):.1f}", f"{gen_lag.max:.1f}",
+                     f"{stats['gen_cpu_percent']:.1f}", f"{stats['gen_rss_mb']:.1f}", int(overloaded),
+                     f"{co.percentile(50):.1f}", f"{co.percentile(90):.1f}", f"{co.percentile(99):.1f}", f"{co.max:.1f}",
+                     stats['late'], f"{late.percentile(99):.1f}", f"{late.max:.1f}",
+                     *droplet_metrics.report_values(stats), args.protocol,
+                     stats['positions'], f"{stats['positions'] / single.duration if single.duration > 0 else 0:.2f}",
+                     *reconnect_storm.report_values(stats),
+                     *connection_model.report_values(stats, args, single.duration),
+                     f"{stats['storm_reconnect_s']:.1f}"])
+    print(f"Level {level} summary: ok={stats['ok']} fail={stats['fail']} fail_ratio={fail_ratio:.3f} rps_avg={rps_avg:.2f} rps_ok_avg={rps_ok_avg:.2f}")
+    if overloaded:
+        print(f"Generator overloaded: loop lag p99 {gen_lag.percentile(99):.1f} ms > {args.max_loop_lag_ms} ms "
+              f"(CPU {stats['gen_cpu_percent']:.0f}%); level {level} measures the client, not Traccar.")
+    # Strict expected message count: each device should send ceil(duration/interval) messages
+    expected_per_device = max(1, math.ceil(single.duration / single.interval)) if single.interval > 0 else 1
+    observed_total = stats['count']
+    if osmand_backlog.enabled(single):
+        # Uploads carry several positions each: every position is either delivered or still buffered
+        observed_total = stats['positions'] + stats['buffered']
+    return {"stats": stats, "fail_ratio": fail_ratio, "p99": p99, "overloaded": overloaded,
+            "expected_per_device": expected_per_device,
+            "expected_total": single.devices * expected_per_device, "observed_total": observed_total}
+
+def slo_breach(args, result):
+    """Return why a level breaks the failure/latency SLO, or None if it passed."""
+    if result["fail_ratio"] > args.failure_threshold:
+        return f"fail_ratio {result['fail_ratio']:.3f} exceeded threshold {args.failure_threshold}"
+    if result["stats"]['ok'] < args.min_ok:
+        return f"ok responses {result['stats']['ok']} < min_ok {args.min_ok}"
+    if args.slo_p99_ms is not None and result["p99"] > args.slo_p99_ms:
+        return f"p99 {result['p99']:.1f} ms exceeded SLO {args.slo_p99_ms} ms"
+    return None
+
 async def ramp_runner(args, base_url):
     """Incrementally increase devices/concurrency until failure threshold reached.
 
     Failure criteria:
       - fail_ratio > args.failure_threshold
       - ok < args.min_ok
-    CSV columns: timestamp,level,devices,concurrency,duration,ok,fail,fail_ratio,rps_avg,rps_ok_avg,p50_ms,p90_ms,p99_ms,bandwidth_pub_out_kbps,bandwidth_pub_in_kbps,cpu_percent,memory_usage,load_1m,load_5m,load_15m,disk_usage_percent
+      - p99 > args.slo_p99_ms (when set)
+    A level where the generator's own event loop lagged more than
+    args.max_loop_lag_ms (p99) is flagged gen_overloaded=1, retried up to
+    args.overload_retries times and never used to stop or score the ramp.
+    With args.continuous the fleet stays up between levels (see WarmFleet)
+    and the exact message count check is skipped, since windows do not line
+    up with every device's send phase; likewise with args.storm, whose
+    outages skip sends and restart devices on a new phase.
+    CSV columns: see ramp_report.REPORT_COLUMNS
     """
-    import json, csv, os
-
     csv_path = args.csv or "ramp_report.csv"
-    write_header = not os.path.exists(csv_path)
-    levels = []
     devices = args.devices_start or args.devices
     concurrency = args.concurrency_start or args.concurrency or devices
     level = 0
-    stop = False
-    with open(csv_path, "a", newline="") as f:
-        writer = csv.writer(f)
-        if write_header:
-            writer.writerow(["timestamp","level","devices","concurrency","duration","ok","fail","fail_ratio","rps_avg","rps_ok_avg","p50_ms","p90_ms","p99_ms","bandwidth_pub_out_kbps","bandwidth_pub_in_kbps","cpu_percent","memory_usage","load_1m","load_5m","load_15m","disk_usage_percent"])
-        while not stop and devices <= args.max_devices and concurrency <= args.max_concurrency:
+    overload_retries = 0
+    f, writer = open_report(csv_path)
+    timeseries.configure(args, csv_path)
+    host_sampler.configure(args, csv_path)
+    warm = None
+    if args.continuous:
+        warm = WarmFleet(args, base_url)
+        await warm.start()
+    try:
+        while devices <= args.max_devices and concurrency <= args.max_concurrency:
             level += 1
-            print(f"\n=== Level {level}: devices={devices} concurrency={concurrency} duration={args.duration_per_level}s ===")
-            # Build a lightweight args clone for single run
-            single = argparse.Namespace(**vars(args))
-            single.devices = devices
-            single.concurrency = concurrency
-            single.duration = args.duration_per_level
-            stats = await runner(single, base_url)
-            total = stats['count'] or 1
-            fail_ratio = stats['fail']/total
-            p50 = stats['pct'](50)
-            p90 = stats['pct'](90)
-            p99 = stats['pct'](99)
-            # average rps across run (total) and successful-only (ok)
-            rps_avg = total / single.duration if single.duration > 0 else 0
-            rps_ok_avg = stats['ok'] / single.duration if single.duration > 0 else 0
-            statuses_json = json.dumps(dict(stats['statuses']))
-            statuses = stats['statuses']
-            timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime())
-            bandwith_pub_out = stats["bandwidth_pub_out"]
-            bandwith_pub_in = stats["bandwidth_pub_in"]
-            cpu_usage = stats.get("cpu_percent", float('nan'))
-            memory_usage = stats.get("memory_usage", float('nan'))
-            load_1m = stats.get("load_1m", float('nan'))
-            load_5m = stats.get("load_5m", float('nan'))
-            load_15m = stats.get("load_15m", float('nan'))
-            disk_usage_percent = stats.get("disk_usage_percent", float('nan'))
-            writer.writerow([timestamp,level, devices, concurrency, single.duration, stats['ok'], stats['fail'], 
-                             f"{fail_ratio:.4f}", f"{rps_avg:.2f}", f"{rps_ok_avg:.2f}", f"{p50:.1f}", f"{p90:.1f}", f"{p99:.1f}", 
-                             f"{bandwith_pub_out:.1f}", f"{bandwith_pub_in:.1f}", f"{cpu_usage:.1f}", 
-                             f"{memory_usage:.1f}", f"{load_1m:.2f}", f"{load_5m:.2f}", f"{load_15m:.2f}", f"{disk_usage_percent:.2f}"])
+            result = await run_level(args, base_url, writer, level, devices, concurrency, warm)
             f.flush()
-            print(f"Level {level} summary: ok={stats['ok']} fail={stats['fail']} fail_ratio={fail_ratio:.3f} rps_avg={rps_avg:.2f} rps_ok_avg={rps_ok_avg:.2f}")
-            # Strict expected message count: each device should send ceil(duration/interval) messages
-            expected_per_device = max(1, math.ceil(single.duration / single.interval)) if single.interval > 0 else 1
-            expected_total = single.devices * expected_per_device
-            observed_total = stats['count']
-            if observed_total != expected_total:
-                print(f"Stopping: expected {expected_total} messages (devices={single.devices} * {expected_per_device}) but observed {observed_total}.")
+            if result["overloaded"]:
+                if overload_retries < args.overload_retries:
+                    overload_retries += 1
+                    print("Retrying level")
+                    continue
+                print("Stopping: load generator is the bottleneck; add --workers or agents to go further.")
+                break
+            overload_retries = 0
+            if warm is None and not args.storm and result["observed_total"] != result["expected_total"]:
+                print(f"Stopping: expected {result['expected_total']} messages (devices={devices} * {result['expected_per_device']}) but observed {result['observed_total']}.")
                 print("Hint: increase --launch-rate, increase per-level duration, or use burst mode for exact single update per device.")
                 break
-            if fail_ratio > args.failure_threshold:
-                print(f"Stopping: fail_ratio {fail_ratio:.3f} exceeded threshold {args.failure_threshold}")
-                stop = True
-            elif stats['ok'] < args.min_ok:
-                print(f"Stopping: ok responses {stats['ok']} < min_ok {args.min_ok}")
-                stop = True
-            else:
-                devices += args.devices_step
-                concurrency += args.concurrency_step
-                if concurrency > 5000:
-                    print("Capping concurrency at 5000 to avoid aiohttp connector overload")
-                    concurrency = 5000
+            breach = slo_breach(args, result)
+            if breach:
+                print(f"Stopping: {breach}")
+                break
+            devices += args.devices_step
+            concurrency += args.concurrency_step
+            if concurrency > 5000:
+                print("Capping concurrency at 5000 to avoid aiohttp connector overload")
+                concurrency = 5000
+    finally:
+        f.close()
+        if warm is not None:
+            await warm.close()
     print(f"\nRamp complete. Report written to {csv_path}")
 
-def get_simulation_device_ids(take: int) -> list[int]:
+def search_concurrency(args, devices):
+    """Concurrency for a search probe: --concurrency-start scaled with the device count, capped like the ramp."""
+    start_devices = args.devices_start or args.devices
+    start_concurrency = args.concurrency_start or args.concurrency or start_devices
+    return max(1, min(args.max_concurrency, 5000, round(start_concurrency * devices / start_devices)))
+
+async def search_runner(args, base_url):
+    """Find the capacity knee with exponential growth followed by bisection.
+
+    Probes start at --devices-start and grow by --search-growth until a level
+    breaks the SLO (see slo_breach), then the gap between the last good and
+    the first bad level is bisected until it is at most --search-resolution
+    devices. Every probe is written to the CSV exactly like a ramp level, and
+    client-bound probes are retried like in ramp_runner.
+    """
+    csv_path = args.csv or "ramp_report.csv"
+    good, bad = 0, None
+    devices = args.devices_start or args.devices
+    level = 0
+    overload_retries = 0
+    f, writer = open_report(csv_path)
+    timeseries.configure(args, csv_path)
+    host_sampler.configure(args, csv_path)
+    with f:
+        while True:
+            level += 1
+            concurrency = search_concurrency(args, devices)
+            result = await run_level(args, base_url, writer, level, devices, concurrency)
+            f.flush()
+            if result["overloaded"]:
+                if overload_retries < args.overload_retries:
+                    overload_retries += 1
+                    print("Retrying probe")
+                    continue
+                print("Stopping search: load generator is the bottleneck; add --workers or agents to go further.")
+                break
+            overload_retries = 0
+            breach = slo_breach(args, result)
+            if breach is None and not args.storm and result["observed_total"] != result["expected_total"]:
+                breach = f"expected {result['expected_total']} messages but observed {result['observed_total']}"
+            if breach:
+                print(f"[SEARCH] {devices} devices: bad ({breach})")
+                bad = devices
+            else:
+                print(f"[SEARCH] {devices} devices: good")
+                good = devices
+            if bad is None:
+                if devices >= args.max_devices:
+                    break
+                devices = min(args.max_devices, max(devices + 1, int(devices * args.search_growth)))
+                continue
+            if bad - good <= args.search_resolution:
+                break
+            devices = (good + bad) // 2
+    if bad is None:
+        print(f"\nSearch complete: no SLO breach up to {good} devices (--max-devices {args.max_devices}).")
+    elif good:
+        print(f"\nSearch complete: capacity is between {good} (good) and {bad} (bad) devices.")
+    else:
+        print(f"\nSearch complete: even {bad} devices broke the SLO.")
+    print(f"Report written to {csv_path}")
+
+def get_simulation_device_ids(take: int, refresh: bool = False) -> list[int]:
     """Return up to 'take' device IDs whose uniqueId starts with 'SIM'. Cached after first fetch.
 
+    Across runs the IDs come from the on-disk device registry (see device_registry.py),
+    which is validated against the server instead of re-downloading /api/devices;
+    refresh=True forces the download (once per process).
+
     Environment variables required:
       TRACCAR_API_KEY, TRACCAR_BASE_URL
     """
@@ -315,326 +670,55 @@ def get_simulation_device_ids(take: int) -> list[int]:
         print("Environment variables TRACCAR_API_KEY and TRACCAR_BASE_URL are required", file=sys.stderr)
         sys.exit(1)
 
-    headers = {
-        "Accept": "application/json",
-        "Authorization": f"Bearer {api_key}"
-    }
-
-    url = f"{base_url.rstrip('/')}/api/devices"
     try:
-        resp = requests.get(url, headers=headers, timeout=60)
-        resp.raise_for_status()
+        sim_devices = device_registry.get_sim_devices(base_url, api_key, refresh=refresh)
     except Exception as e:
         print(f"Error fetching devices: {e}", file=sys.stderr)
         sys.exit(1)
 
-    devices = resp.json()
-    print(f"Fetched {len(devices)} devices from Traccar")
-    sim_devices = [d for d in devices if d.get('uniqueId', '').startswith('SIM')]
     if not sim_devices:
         print("No devices with 'SIM' prefix found", file=sys.stderr)
         sys.exit(1)
-    global_taken_ids = [d['id'] for d in sim_devices]
+    global_taken_ids = [device_id for device_id, _ in sim_devices]
     print(f"Caching {len(global_taken_ids)} SIM devices; returning first {take}")
     return global_taken_ids[:take]
 
-async def fetch_droplet_bandwidth_kbps(stats, direction:str) -> float:
-    """Fetch latest outbound public interface bandwidth sample (last 1 minute) in kbps.
-
-    - Uses DigitalOcean Monitoring metrics endpoint.
-    - Returns float('nan') if API key or droplet id missing, on HTTP error, or no samples.
-    - Updates stats['statuses'] with outcome for visibility (bw_skipped, bw_http_<code>, bw_ok, bw_empty, bw_error).
-    """
-    api_key = os.getenv("DO_API_KEY")
-    droplet_id = os.getenv("DO_DROPLET_ID")
-    if not api_key or not droplet_id:
-        raise RuntimeError("Missing DO_API_KEY or DO_DROPLET_ID")
-    end_time = int(time.time())
-    start_time = end_time - 60  # last minute window
-    print(f"start={start_time}&end={end_time}")
-    url = (
-        "https://api.digitalocean.com/v2/monitoring/metrics/droplet/bandwidth"
-        f"?host_id={droplet_id}&interface=public&direction={direction}&start={start_time}&end={end_time}"
-    )
-    headers = {
-        "Authorization": f"Bearer {api_key}", 
-        "Accept": "application/json"
-    }
-    try:
-        resp = requests.get(url, headers=headers, timeout=20)
-        resp.raise_for_status()
-        stats["statuses"][f"bw_http_{resp.status_code}"] += 1
-    except Exception as e:
-        print(f"Error fetching devices: {e}", file=sys.stderr)
-        stats["statuses"]["bw_error"] += 1
-        return float('nan')
-    json_response = resp.json()
+async def stream_simulation_device_ids(take: int, refresh: bool = False):
+    """Async variant of get_simulation_device_ids that yields ID batches while /api/devices downloads.
 
-    # Extract latest numeric sample; API usually returns data.result[0].values = [[ts, value], ...]
-    try:
-        results = (json_response or {}).get("data", {}).get("result", [])
-        if len(results) == 0:
-            stats["statuses"]["bw_empty"] += 1
-            return float('nan')
-        result = results[0] if isinstance(results, list) else None
-        if not result:
-            stats["statuses"]["bw_empty"] += 1
-            return float('nan')
-        values = result.get("values", [])
-        if not values:
-            stats["statuses"]["bw_empty"] += 1
-            return float('nan')
-        # Get the last value from values list
-        last_value = values[-1] if isinstance(values, list) else None
-        if not last_value or len(last_value) < 2:
-            stats["statuses"]["bw_empty"] += 1
-            return float('nan')
-        latest_val_str = last_value[1]
-        # DigitalOcean metric value is megabytes per second. Convert to kbps (1 MBps = 1000 kbps)
-        latest_val_int = float(latest_val_str)
-        latest_val = latest_val_int if not math.isnan(latest_val_int) else 0
-        kbps = latest_val * 1000  # convert to kbps
-        stats["statuses"]["bw_ok"] += 1
-        return round(kbps, 1)
-    except Exception:
-        stats["statuses"]["bw_parse_error"] += 1
-        return float('nan')
-
-async def fetch_droplet_cpu_usage(stats):
-    """Fetch latest CPU usage sample (last 1 minute) as percentage.
-
-    - Uses DigitalOcean Monitoring metrics endpoint.
-    - Returns float('nan') if API key or droplet id missing, on HTTP error, or no samples.
-    - Updates stats['statuses'] with outcome for visibility (cpu_skipped, cpu_http_<code>, cpu_ok, cpu_empty, cpu_error).
+    Yields at most 'take' IDs in total but reads the list to the end, so the
+    full set is cached for later levels just like get_simulation_device_ids.
     """
-    api_key = os.getenv("DO_API_KEY")
-    droplet_id = os.getenv("DO_DROPLET_ID")
-    try:
-        if not api_key or not droplet_id:
-            raise RuntimeError("Missing DO_API_KEY or DO_DROPLET_ID")
-        end_time = int(time.time())
-        start_time = end_time - 120  # last minute window
-        url = (
-            "https://api.digitalocean.com/v2/monitoring/metrics/droplet/cpu"
-            f"?host_id={droplet_id}&start={start_time}&end={end_time}"
-        )
-        headers = {
-            "Authorization": f"Bearer {api_key}", 
-            "Accept": "application/json"
-        }
-        resp = requests.get(url, headers=headers, timeout=20)
-        resp.raise_for_status()
-    except Exception as e:
-        print(f"Error fetching CPU usage: {e}", file=sys.stderr)
-        stats["cpu_percent"] = float('nan')
+    global global_taken_ids
+    if global_taken_ids is not None and len(global_taken_ids) >= take:
+        print(f"Reusing {len(global_taken_ids)} previously fetched device IDs")
+        yield global_taken_ids[:take]
         return
 
-    json_response = resp.json()
-
-    # Extract latest numeric sample; API usually returns data.result[0].values = [[ts, value], ...]
-    try:
-        results = (json_response or {}).get("data", {}).get("result", [])
-        if len(results) == 0:
-            raise RuntimeError("No CPU metrics returned from DigitalOcean (last 1m window)")
-        idle_diff = 0
-        cpu_diff = 0
-        for result in results:
-            metric = result.get("metric", {})
-            values = result.get("values", [])
-            if not values or len(values) < 2:
-                continue
-
-            if metric.get("mode") == "idle":
-                idle_cpu_b = values[-1] if isinstance(values, list) else None
-                idle_cpu_a = values[-2] if isinstance(values, list) else None
-                if not idle_cpu_b or len(idle_cpu_b) < 2 or not idle_cpu_a or len(idle_cpu_a) < 2:
-                    continue
-                idle_diff = abs(float(idle_cpu_b[1]) - float(idle_cpu_a[1]))
-                cpu_diff += idle_diff
-            else:
-                cpu_b = values[-1] if isinstance(values, list) else None
-                cpu_a = values[-2] if isinstance(values, list) else None
-                if not cpu_b or len(cpu_b) < 2 or not cpu_a or len(cpu_a) < 2:
-                    continue
-                cpu_diff += abs(float(cpu_b[1]) - float(cpu_a[1]))
-        if cpu_diff <= 0:
-            raise RuntimeError("No CPU usage delta found in DigitalOcean metrics")
-        cpu_usage = (1 - (idle_diff / cpu_diff)) * 100
-        stats["cpu_percent"] = round(cpu_usage, 2)
-    except Exception as e:
-        print("Error parsing CPU usage from DigitalOcean metrics: {e}", file=sys.stderr)
-        stats["cpu_percent"] = float('nan')
-
-async def fetch_droplet_load(load_minute) -> float:
-    """
-    Fetch latest load average sample (last 1 minute, 5 minute, or 15 minute) as float.
-    """
-    api_key = os.getenv("DO_API_KEY")
-    droplet_id = os.getenv("DO_DROPLET_ID")
-    if not api_key or not droplet_id:
-        return float('nan')
-    if load_minute not in (1, 5, 15):
-        raise ValueError("load_minute must be 1, 5, or 15")
-    end_time = int(time.time())
-    start_time = end_time - 60  # last minute window
-    url = (
-        f"https://api.digitalocean.com/v2/monitoring/metrics/droplet/load_{load_minute}"
-        f"?host_id={droplet_id}&start={start_time}&end={end_time}"
-    )
-    headers = {
-        "Authorization": f"Bearer {api_key}", 
-        "Accept": "application/json"
-    }
-    try:
-        resp = requests.get(url, headers=headers, timeout=20)
-        resp.raise_for_status()
-    except Exception as e:
-        return float('nan')
-    
-    json_response = resp.json()
-
-    # Extract latest numeric sample; API usually returns data.result[0].values = [[ts, value], ...]
-    try:
-        results = (json_response or {}).get("data", {}).get("result", [])
-        if len(results) == 0:
-            return float('nan')
-        result = results[0] if isinstance(results, list) else None
-        if not result:
-            return float('nan')
-        values = result.get("values", [])
-        if not values:
-            return float('nan')
-        # Get the last value from values list
-        last_value = values[-1] if isinstance(values, list) else None
-        if not last_value or len(last_value) < 2:
-            return float('nan')
-        return round(float(last_value[1]), 2)
-    except Exception:
-        return float('nan')
-    
-async def fetch_droplet_memory_usage() -> float:
-    """
-    Total memory: https://api.digitalocean.com/v2/monitoring/metrics/droplet/memory_total
-    Available memory: https://api.digitalocean.com/v2/monitoring/metrics/droplet/memory_available 
-    Both endpoints will return a JSON object with a data field. The data is an array of datapoint objects, each containing a value (in bytes) and a timestamp. 
-    """
-    api_key = os.getenv("DO_API_KEY")
-    droplet_id = os.getenv("DO_DROPLET_ID")
-    if not api_key or not droplet_id:
-        return float('nan')
-    end_time = int(time.time())
-    start_time = end_time - 60  # last minute window
-    url_total = (
-        f"https://api.digitalocean.com/v2/monitoring/metrics/droplet/memory_total"
-        f"?host_id={droplet_id}&start={start_time}&end={end_time}"
-    )
-    url_available = (
-        f"https://api.digitalocean.com/v2/monitoring/metrics/droplet/memory_available"
-        f"?host_id={droplet_id}&start={start_time}&end={end_time}"
-    )
-    headers = {
-        "Authorization": f"Bearer {api_key}", 
-        "Accept": "application/json"
-    }
-    try:
-        resp_total = requests.get(url_total, headers=headers, timeout=20)
-        resp_total.raise_for_status()
-        resp_available = requests.get(url_available, headers=headers, timeout=20)
-        resp_available.raise_for_status()
-    except Exception as e:
-        return float('nan')
-    
-    json_total = resp_total.json()
-    json_available = resp_available.json()
+    api_key = os.getenv("TRACCAR_API_KEY")
+    base_url = os.getenv("TRACCAR_BASE_URL")
+    if not api_key or not base_url:
+        print("Environment variables TRACCAR_API_KEY and TRACCAR_BASE_URL are required", file=sys.stderr)
+        sys.exit(1)
 
+    ids = []
     try:
-        results_total = (json_total or {}).get("data", {}).get("result", [])
-        results_available = (json_available or {}).get("data", {}).get("result", [])
-        if len(results_total) == 0 or len(results_available) == 0:
-            return float('nan')
-        result_total = results_total[0] if isinstance(results_total, list) else None
-        result_available = results_available[0] if isinstance(results_available, list) else None
-        if not result_total or not result_available:
-            return float('nan')
-        values_total = result_total.get("values", [])
-        values_available = result_available.get("values", [])
-        if not values_total or not values_available:
-            return float('nan')
-        last_value_total = values_total[-1] if isinstance(values_total, list) else None
-        last_value_available = values_available[-1] if isinstance(values_available, list) else None
-        if not last_value_total or len(last_value_total) < 2 or not last_value_available or len(last_value_available) < 2:
-            return float('nan')
-        total_mem = float(last_value_total[1])
-        available_mem = float(last_value_available[1])
-        used_mem = total_mem - available_mem
-        mem_percent = (used_mem / total_mem) * 100 if total_mem > 0 else float('nan')
-        return round(mem_percent, 2)
-    except Exception:
-        return float('nan')
-    
-async def fetch_droplet_disk_usage() -> float:
-    """
-    Total disk: https://api.digitalocean.com/v2/monitoring/metrics/droplet/filesystem_free
-    Used disk: https://api.digitalocean.com/v2/monitoring/metrics/droplet/filesystem_size 
-    Both endpoints will return a JSON object with a data field. The data is an array of datapoint objects, each containing a value (in bytes) and a timestamp. 
-    """
-    api_key = os.getenv("DO_API_KEY")
-    droplet_id = os.getenv("DO_DROPLET_ID")
-    if not api_key or not droplet_id:
-        return float("nan")
-    end_time = int(time.time())
-    start_time = end_time - 100  # last minute window
-    url_free = (
-        f"https://api.digitalocean.com/v2/monitoring/metrics/droplet/filesystem_free"
-        f"?host_id={droplet_id}&start={start_time}&end={end_time}"
-    )
-    url_size = (
-        f"https://api.digitalocean.com/v2/monitoring/metrics/droplet/filesystem_size"
-        f"?host_id={droplet_id}&start={start_time}&end={end_time}"
-    )
-    headers = {
-        "Authorization": f"Bearer {api_key}", 
-        "Accept": "application/json"
-    }
-    try:
-        resp_free = requests.get(url_free, headers=headers, timeout=20)
-        resp_free.raise_for_status()
-        resp_size = requests.get(url_size, headers=headers, timeout=20)
-        resp_size.raise_for_status()
+        async for batch in device_registry.stream_sim_devices(base_url, api_key, refresh=refresh):
+            given = len(ids)
+            ids.extend(device_id for device_id, _ in batch)
+            if given < take:
+                yield ids[given:take]
     except Exception as e:
-        return float("nan")
-    
-    json_free = resp_free.json()
-    json_size = resp_size.json()
+        print(f"Error fetching devices: {e}", file=sys.stderr)
+        sys.exit(1)
 
-    try:
-        results_free = (json_free or {}).get("data", {}).get("result", [])
-        results_size = (json_size or {}).get("data", {}).get("result", [])
-        if len(results_free) == 0 or len(results_size) == 0:
-            return float("nan")
-        result_free = results_free[-1] if isinstance(results_free, list) else None
-        result_size = results_size[-1] if isinstance(results_size, list) else None
-        if not result_free or not result_size:
-            return float("nan")
-        values_free = result_free.get("values", [])
-        values_size = result_size.get("values", [])
-        if not values_free or not values_size:
-            return float("nan")
-        value_free = values_free[-1] if isinstance(values_free, list) else None
-        value_size = values_size[-1] if isinstance(values_size, list) else None
-        if not value_free or not value_size:
-            raise "Invalid value"
-        value_size_fl = float(value_size[-1])
-        value_free_fl = float(value_free[-1])
-
-        disk_usage_diff = value_size_fl - value_free_fl
-        disk_usage_percent = disk_usage_diff / value_size_fl * 100
-        return round(disk_usage_percent, 2)
-    except Exception as e:
-        print("Disk usage error: ", file=sys.stderr)
-        return float("nan")
+    if not ids:
+        print("No devices with 'SIM' prefix found", file=sys.stderr)
+        sys.exit(1)
+    global_taken_ids = sorted(ids)
+    print(f"Caching {len(global_taken_ids)} SIM devices; returned first {min(take, len(ids))}")
 
-def parse_args():
+def parse_args(argv=None):
     base_url = os.getenv("TRACCAR_BASE_URL")
     ap = argparse.ArgumentParser()
     ap.add_argument("--devices", type=int, default=30000)
@@ -658,18 +742,88 @@ def parse_args():
     ap.add_argument("--duration-per-level", type=int, default=30, help="Duration seconds per level")
     ap.add_argument("--failure-threshold", type=float, default=0.5, help="Fail ratio > threshold stops ramp")
     ap.add_argument("--min-ok", type=int, default=10, help="Minimum OK responses required to continue ramp")
+    ap.add_argument("--slo-p99-ms", type=float, default=None, help="Also treat a level whose p99 latency exceeds this as failed")
+    ap.add_argument("--continuous", action="store_true", help="Keep the fleet and its connections running across levels; each level only adds the new devices")
+    ap.add_argument("--search", action="store_true", help="Find the capacity knee by exponential growth then bisection instead of linear steps")
+    ap.add_argument("--search-growth", type=float, default=2.0, help="Device multiplier per probe until the first failed level (--search)")
+    ap.add_argument("--search-resolution", type=int, default=500, help="Stop bisecting once good and bad levels are this many devices apart (--search)")
     ap.add_argument("--csv", help="CSV report output path (default ramp_report.csv)")
-    return ap.parse_args()
+    ap.add_argument("--workers", type=int, default=1, help="Load generator processes; devices and concurrency are split across them")
+    ap.add_argument("--coordinator", metavar="HOST:PORT", help="Listen for load agents and run every level through them")
+    ap.add_argument("--expect-agents", type=int, default=1, help="Agents to wait for before the first level (coordinator mode)")
+    ap.add_argument("--agent", metavar="HOST:PORT", help="Run as a load agent for the coordinator at HOST:PORT")
+    ap.add_argument("--max-loop-lag-ms", type=float, default=100, help="Generator event-loop lag (p99) above which a level is flagged as client-bound")
+    ap.add_argument("--overload-retries", type=int, default=1, help="Times to rerun a level flagged as client-bound before stopping")
+    ap.add_argument("--late-threshold-ms", type=float, default=20, help="A send starting this far behind its schedule counts as late")
+    ap.add_argument("--refresh-device-cache", action="store_true", help="Re-download the SIM device list instead of using the validated on-disk cache")
+    ap.add_argument("--hist-digits", type=int, default=3, help="Significant digits kept by the latency histogram (1-5)")
+    ap.add_argument("--metrics-port", type=int, default=None, help="Serve live OpenMetrics at http://HOST:PORT/metrics (workers use PORT+1..N)")
+    ap.add_argument("--metrics-host", default="127.0.0.1", help="Bind address for --metrics-port")
+    ap.add_argument("--timeseries", metavar="PATH", default=None,
+                    help="Per-second binary metrics stream (default: next to --csv as <name>.timeseries.bin; '' disables)")
+    ap.add_argument("--host-source", choices=host_sampler.SOURCES, default="do",
+                    help="Where to sample Traccar host resources during each level (see host_sampler.py)")
+    ap.add_argument("--host-target", help="user@host for --host-source ssh, http://HOST:PORT of host_agent.py for http")
+    ap.add_argument("--host-interval", type=int, default=5, help="Seconds between host samples (do: at least 30)")
+    ap.add_argument("--host-series", metavar="PATH", default=None,
+                    help="Host sample stream (default: next to --csv as <name>.host.bin; '' disables)")
+    ap.add_argument("--protocol", choices=("osmand",) + tuple(tcp_fleet.PROTOCOLS), default="osmand",
+                    help="Device protocol: OsmAnd over HTTP, or a tracker protocol over one persistent TCP connection per device")
+    ap.add_argument("--tcp-host", help="Traccar host for TCP protocols (default: host of TRACCAR_BASE_URL)")
+    ap.add_argument("--tcp-port", type=int, help="Traccar port for TCP protocols (default: the protocol's standard port, 5013 for h02, 5064 for eelink)")
+    ap.add_argument("--tcp-ack", action="store_true",
+                    help="Wait for and time the server's answer to every position (Traccar needs e.g. h02.ack=true)")
+    ap.add_argument("--transport", choices=("aiohttp", "raw"), default="aiohttp",
+                    help="OsmAnd HTTP client: aiohttp, or raw keep-alive sockets with minimal response parsing (raw_http.py)")
+    ap.add_argument("--batch-size", type=int, default=1,
+                    help="OsmAnd: buffer this many positions per device and upload them as one JSON POST (1: a GET per position)")
+    ap.add_argument("--offline-fraction", type=float, default=0.0,
+                    help="OsmAnd: share of devices that lose coverage once per level and flush their backlog on reconnect")
+    ap.add_argument("--offline-window", type=float, default=60, help="Mean outage length in seconds for --offline-fraction")
+    ap.add_argument("--backlog-dist", choices=osmand_backlog.BACKLOG_DISTS, default="fixed",
+                    help="Outage length distribution around --offline-window (see osmand_backlog.py)")
+    ap.add_argument("--storm", action="append", type=reconnect_storm.parse_storm, metavar="AT:FRACTION:OUTAGE[:JITTER[:DIST]]",
+                    help="Take FRACTION of the devices offline AT seconds into each level for OUTAGE seconds, then reconnect them "
+                         "with JITTER seconds of uniform/exponential jitter (repeatable; see reconnect_storm.py)")
+    ap.add_argument("--connection-model", choices=connection_model.MODELS, default="pool",
+                    help="OsmAnd sockets: shared keep-alive pool, one idle keep-alive socket per device (--transport raw), "
+                         "or connect-send-close per report (see connection_model.py)")
+    ap.add_argument("--heartbeat-interval", type=float, default=60, help="Seconds between heartbeat frames per TCP device (0 disables)")
+    return ap.parse_args(argv)
 
 if __name__ == "__main__":
     load_dotenv()
     args = parse_args()
+    if args.agent:
+        # Agents receive the target URL and shard from the coordinator
+        asyncio.run(run_agent(args.agent, run_load, new_stats))
+        sys.exit(0)
     base_url = os.getenv("TRACCAR_BASE_URL")
     if not base_url:
         print("Environment variable TRACCAR_BASE_URL is required", file=sys.stderr)
         sys.exit(1)
     
-    asyncio.run(ramp_runner(args, base_url))
+    if args.host_source == "do" and not droplet_metrics.configured():
+        print("DO_API_KEY and DO_DROPLET_ID are required for the droplet columns of the ramp report "
+              "(set DO_API_BASE_URL to a fake_traccar_server.py for offline runs, or use --host-source)", file=sys.stderr)
+        sys.exit(1)
+    problem = connection_model.check(args)
+    if problem:
+        print(problem, file=sys.stderr)
+        sys.exit(1)
+    if args.continuous and args.storm:
+        print("--storm schedules outages relative to a fresh level; it cannot be combined with --continuous", file=sys.stderr)
+        sys.exit(1)
+    if args.continuous and args.protocol != "osmand":
+        print("--continuous keeps an HTTP fleet warm; it supports only --protocol osmand", file=sys.stderr)
+        sys.exit(1)
+    if args.continuous and (args.search or args.coordinator or args.workers > 1):
+        print("--continuous runs a single in-process fleet; it cannot be combined with --search, --coordinator or --workers", file=sys.stderr)
+        sys.exit(1)
+    if args.coordinator:
+        asyncio.run(coordinated_ramp_runner(args, base_url))
+    else:
+        asyncio.run(search_runner(args, base_url) if args.search else ramp_runner(args, base_url))
 
 ### test command:
 # python3 ./sim_traccar_osmand_ramp.py --failure-threshold 1 --status-summary --csv reports/droplet_24USD_reports/report_4Gbmem_2vCPU_25Gbssd_4TB_24USD_4.csv
\ No newline at end of file
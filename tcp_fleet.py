@@ -0,0 +1,237 @@
+"""
+Persistent-TCP tracker devices for the simulators (--protocol h02, ...).
+
+Every simulated device owns one long-lived connection to Traccar's port for
+its protocol, opened on its first send and reopened on the next send after
+it drops, like a real tracker. Frames come from a protocol module
+(h02_protocol.py, eelink_protocol.py): device_ident() and split_frames(),
+plus a Device class per device that builds its login (if the protocol has
+one), position and heartbeat frames. A login is answered by the server
+before the device sends anything else.
+
+Connections are bare asyncio.Protocol objects, so there is no reader task
+per device. When --tcp-ack is set, each position waits for the server's
+answer, and its latency is measured from the write to that answer. Answers
+are matched to requests in order per connection. Otherwise a position
+counts as delivered once it has been handed to the socket, and its latency
+is the write (plus any back-pressure wait). A device's first send, and the
+first send after a reconnect, also include the TCP connect.
+
+Outcomes go into the level's statuses (ack, sent, connect, connect_error,
+login, heartbeat, ack_timeout, closed, exception), so sharded workers and agents
+merge them like HTTP status codes.
+"""
+
+import asyncio
+import resource
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+import eelink_protocol
+import h02_protocol
+
+PROTOCOLS = {"h02": h02_protocol, "eelink": eelink_protocol}
+CONNECT_TIMEOUT = 5
+ACK_TIMEOUT = 30
+
+
+def raise_fd_limit():
+    """Lift the soft open-files limit to the hard limit (one socket per device); returns the new soft limit."""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+            soft = hard
+        except (ValueError, OSError):
+            pass
+    return soft
+
+
+class DeviceConnection(asyncio.Protocol):
+    """One device's socket: queue of answers awaited, and flow control for fire-and-forget writes."""
+
+    def __init__(self, codec):
+        self.codec = codec
+        self.transport = None
+        self.buf = bytearray()
+        self.pending = deque()  # futures (or None for answers to discard), oldest first
+        self._drain = None
+        self.lost = False
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def data_received(self, data):
+        buf = self.buf
+        buf += data
+        frames, used = self.codec.split_frames(buf)
+        if used:
+            del buf[:used]
+        for _ in frames:
+            if not self.pending:
+                continue  # unsolicited (or answer to a write we stopped waiting for)
+            waiter = self.pending.popleft()
+            if waiter is not None and not waiter.done():
+                waiter.set_result(time.perf_counter())
+
+    def connection_lost(self, exc):
+        self.lost = True
+        self.transport = None
+        while self.pending:
+            waiter = self.pending.popleft()
+            if waiter is not None and not waiter.done():
+                waiter.set_exception(ConnectionResetError("connection closed by server"))
+        if self._drain is not None and not self._drain.done():
+            self._drain.set_result(None)
+
+    def pause_writing(self):
+        self._drain = asyncio.get_running_loop().create_future()
+
+    def resume_writing(self):
+        if self._drain is not None and not self._drain.done():
+            self._drain.set_result(None)
+        self._drain = None
+
+    async def drain(self):
+        if self._drain is not None:
+            await self._drain
+
+
+class TcpFleet:
+    """Per-device persistent connections and the send path used by run_load for TCP protocols."""
+
+    def __init__(self, args, base_url, stats):
+        self.codec = PROTOCOLS[args.protocol]
+        self.host = args.tcp_host or urlsplit(base_url).hostname
+        self.port = args.tcp_port or self.codec.DEFAULT_PORT
+        self.ack = args.tcp_ack
+        self.heartbeat = args.heartbeat_interval
+        self.prefix = args.id_prefix
+        self.stats = stats
+        self.args = args
+        self.conns = {}
+        self.devices = {}
+        self.last_heartbeat = {}
+        limit = raise_fd_limit()
+        if limit != resource.RLIM_INFINITY and args.devices > limit - 100:
+            print(f"[TCP] {args.devices} devices need as many sockets but the open-files limit is {limit}; "
+                  f"raise it (ulimit -n) or use --workers")
+
+    @property
+    def open_connections(self):
+        return sum(1 for conn in self.conns.values() if not conn.lost)
+
+    async def _connection(self, slot, device):
+        conn = self.conns.get(slot)
+        if conn is not None and not conn.lost:
+            return conn
+        loop = asyncio.get_running_loop()
+        t0 = time.perf_counter()
+        _, conn = await asyncio.wait_for(
+            loop.create_connection(lambda: DeviceConnection(self.codec), self.host, self.port), CONNECT_TIMEOUT)
+        self.stats["statuses"]["connect"] += 1
+        self.stats["connections"] += 1
+        self.stats["connect_hist"].record((time.perf_counter() - t0) * 1000)
+        login = device.login()
+        if login is not None:
+            waiter = loop.create_future()
+            conn.pending.append(waiter)
+            conn.transport.write(login)
+            try:
+                await asyncio.wait_for(waiter, CONNECT_TIMEOUT)
+            except BaseException:
+                if conn.transport is not None:
+                    conn.transport.abort()
+                raise
+            self.stats["statuses"]["login"] += 1
+        self.conns[slot] = conn
+        return conn
+
+    async def send(self, slot, due, dev_id, lat, lon, speed_kmh, bearing):
+        stats = self.stats
+        args = self.args
+        # Same schedule accounting as send_update in the simulators (coordinated omission)
+        late_ms = max(0.0, (time.monotonic() - due) * 1000)
+        if late_ms > args.late_threshold_ms:
+            stats["late"] += 1
+            stats["late_hist"].record(late_ms)
+        device = self.devices.get(slot)
+        if device is None:
+            device = self.devices[slot] = self.codec.Device(self.codec.device_ident(dev_id, self.prefix))
+        stats["inflight"] += 1
+        t0 = time.perf_counter()
+        done_at = None
+        ok = False
+        status = "exception"
+        try:
+            try:
+                conn = await self._connection(slot, device)
+            except (OSError, asyncio.TimeoutError):
+                status = "connect_error"
+                raise
+            now = time.time()
+            transport = conn.transport
+            if self.heartbeat and now - self.last_heartbeat.get(slot, 0) >= self.heartbeat:
+                self.last_heartbeat[slot] = now
+                if self.ack and self.codec.HEARTBEAT_ACKED:
+                    conn.pending.append(None)
+                transport.write(device.heartbeat(now, transport.get_write_buffer_size() == 0))
+                stats["statuses"]["heartbeat"] += 1
+            # A frame buffer is only rewritten while the transport holds nothing of it
+            data = device.position(lat, lon, speed_kmh, bearing, now, transport.get_write_buffer_size() == 0)
+            if self.ack:
+                waiter = asyncio.get_running_loop().create_future()
+                conn.pending.append(waiter)
+                transport.write(data)
+                try:
+                    done_at = await asyncio.wait_for(waiter, ACK_TIMEOUT)
+                except asyncio.TimeoutError:
+                    status = "ack_timeout"
+                    transport.abort()  # later answers could no longer be matched in order
+                    raise
+                status = "ack"
+            else:
+                transport.write(data)
+                await conn.drain()
+                if conn.lost:
+                    raise ConnectionResetError("connection closed by server")
+                status = "sent"
+            ok = True
+        except ConnectionResetError as e:
+            status = "closed"
+            self._failure(dev_id, status, e)
+        except Exception as e:
+            self._failure(dev_id, status, e)
+        dt = ((done_at or time.perf_counter()) - t0) * 1000
+        stats["inflight"] -= 1
+        stats["statuses"][status] += 1
+        stats["latency_hist"].record(dt)
+        stats["latency_hist_co"].record(dt + late_ms)
+        if ok:
+            stats["ok"] += 1
+            stats["positions"] += 1
+        else:
+            stats["fail"] += 1
+        stats["count"] += 1
+
+    def _failure(self, dev_id, status, e):
+        args = self.args
+        if args.print_failures and len(self.stats["failure_samples"]) < args.print_failures:
+            self.stats["failure_samples"].append(
+                f"dev={dev_id} {status} {type(e).__name__}:{e} {self.codec.NAME}://{self.host}:{self.port}")
+
+    def drop(self, slots):
+        """Cut the connections of `slots` (reconnect storms); each reconnects on its next send."""
+        for slot in slots:
+            conn = self.conns.pop(slot, None)
+            if conn is not None and conn.transport is not None:
+                conn.transport.abort()
+
+    async def close(self):
+        for conn in self.conns.values():
+            if conn.transport is not None:
+                conn.transport.close()
+        self.conns.clear()
+        self.devices.clear()
+        await asyncio.sleep(0)
@@ -13,6 +13,8 @@ import os
 import sys
 import requests
 
+from json_stream import CHUNK_SIZE, iter_items
+
 global_taken_ids = None
 
 def send_message(conn: http.client.HTTPConnection, uid: str):
@@ -58,20 +60,25 @@ def get_simulation_device_ids(take: int) -> list[int]:
         "Authorization": f"Bearer {api_key}"
     }
     url = f"{base_url.rstrip('/')}/api/devices"
+    total = 0
+    sim_ids = []
     try:
-        resp = requests.get(url, headers=headers, timeout=60)
-        resp.raise_for_status()
+        with requests.get(url, headers=headers, timeout=60, stream=True) as resp:
+            resp.raise_for_status()
+            # Parse incrementally and keep only the ids of SIM devices
+            for d in iter_items(resp.iter_content(CHUNK_SIZE)):
+                total += 1
+                if d.get('uniqueId', '').startswith('SIM'):
+                    sim_ids.append(d['id'])
     except Exception as e:
         print(f"Error fetching devices: {e}", file=sys.stderr)
         sys.exit(1)
 
-    devices = resp.json()
-    print(f"Fetched {len(devices)} devices from Traccar")
-    sim_devices = [d for d in devices if d.get('uniqueId', '').startswith('SIM')]
-    if not sim_devices:
+    print(f"Fetched {total} devices from Traccar")
+    if not sim_ids:
         print("No devices with 'SIM' prefix found", file=sys.stderr)
         sys.exit(1)
-    global_taken_ids = [d['id'] for d in sim_devices]
+    global_taken_ids = sim_ids
     print(f"Caching {len(global_taken_ids)} SIM devices; returning first {take}")
     return global_taken_ids[:take]
 
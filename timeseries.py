@@ -0,0 +1,177 @@
+"""
+Per-second metrics stream for simulator runs.
+
+Once per wall-clock second a sampler turns the live stats dict into one
+fixed-size binary record: requests started, ok/fail, status classes,
+p50/p99/max latency of the responses completed in that second, in-flight
+requests, open connections and the worst event-loop lag. Nothing is added to
+the send hot path except the in-flight counter; the per-second latency
+percentiles come from differencing the level histogram's bucket counts.
+
+File layout: MAGIC, a 2-byte length, a JSON header {"format", "fields"},
+then back-to-back records of that struct format. Records are written with a
+single unbuffered append each, so several load processes can share a file.
+read_records() maps the file into a NumPy structured array. host_sampler.py
+writes its host metrics in the same layout with its own fields.
+"""
+
+import asyncio
+import json
+import math
+import os
+import struct
+import time
+
+import numpy as np
+
+MAGIC = b"SIMTS\x01"
+FIELDS = (
+    ("ts", "d"),            # end of the one-second window, epoch seconds
+    ("level", "H"),
+    ("worker", "H"),        # load process index within the level (0 when not sharded)
+    ("sent", "I"),          # requests started
+    ("ok", "I"),
+    ("fail", "I"),
+    ("s2xx", "I"),
+    ("s4xx", "I"),
+    ("s5xx", "I"),
+    ("exceptions", "I"),
+    ("inflight", "I"),      # at the end of the window
+    ("open_conns", "i"),    # -1 when the connector does not expose its pool
+    ("p50_ms", "f"),
+    ("p99_ms", "f"),
+    ("max_ms", "f"),
+    ("loop_lag_max_ms", "f"),
+)
+RECORD = struct.Struct("<" + "".join(fmt for _, fmt in FIELDS))
+NUMPY_DTYPE = np.dtype([(name, "<" + fmt) for name, fmt in FIELDS])
+
+
+def default_path(csv_path):
+    """Time-series file next to the CSV report: ramp_report.csv -> ramp_report.timeseries.bin."""
+    return os.path.splitext(csv_path)[0] + ".timeseries.bin"
+
+
+def configure(args, csv_path):
+    """Resolve args.timeseries (None: next to csv_path, '': disabled) and create the file."""
+    if args.timeseries is None:
+        args.timeseries = default_path(csv_path)
+    if args.timeseries:
+        ensure_file(args.timeseries)
+
+
+def ensure_file(path, record=RECORD, fields=FIELDS):
+    """Create `path` with its header unless it already exists; returns the header length."""
+    header = json.dumps({"format": record.format, "fields": [name for name, _ in fields]}).encode()
+    blob = MAGIC + struct.pack("<H", len(header)) + header
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+    except FileExistsError:
+        return len(blob)
+    try:
+        os.write(fd, blob)
+    finally:
+        os.close(fd)
+    return len(blob)
+
+
+def read_records(path):
+    """Return every record in `path` as a NumPy structured array, with the columns named in its header."""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a simulator time-series file")
+        (length,) = struct.unpack("<H", f.read(2))
+        header = json.loads(f.read(length))
+        data = f.read()
+    order, codes = header["format"][0], header["format"][1:]
+    if order != "<" or len(codes) != len(header["fields"]):
+        raise ValueError(f"{path} has an unsupported record format {header['format']}")
+    dtype = np.dtype([(name, "<" + code) for name, code in zip(header["fields"], codes)])
+    usable = len(data) - len(data) % dtype.itemsize  # ignore a torn final record
+    return np.frombuffer(data[:usable], dtype=dtype)
+
+
+def open_connections(connector):
+    """Open sockets in an aiohttp connector's pool (busy + idle) or a tcp_fleet.TcpFleet, or -1 if unknown."""
+    count = getattr(connector, "open_connections", None)
+    if count is not None:
+        return count
+    try:
+        return len(connector._acquired) + sum(len(conns) for conns in connector._conns.values())
+    except (AttributeError, TypeError):
+        return -1
+
+
+def _status_classes(statuses):
+    s2 = s4 = s5 = exc = 0
+    for status, n in statuses.items():
+        if status == "exception":
+            exc += n
+        elif isinstance(status, int):
+            if 200 <= status < 300:
+                s2 += n
+            elif 400 <= status < 500:
+                s4 += n
+            elif status >= 500:
+                s5 += n
+    return s2, s4, s5, exc
+
+
+class SecondSampler:
+    """Append one record per wall-clock second from a live stats dict (see new_stats in the simulators)."""
+
+    def __init__(self, path, stats, level=0, worker=0, connector=None, monitor=None):
+        ensure_file(path)
+        self.fd = os.open(path, os.O_WRONLY | os.O_APPEND)
+        self.stats = stats
+        self.level = level
+        self.worker = worker
+        self.connector = connector
+        self.monitor = monitor
+        self._task = None
+        self._prev = self._counters()
+        self._hist = stats["latency_hist"]
+        self._snap = self._hist.snapshot()
+
+    def _counters(self):
+        st = self.stats
+        return (st["count"] + st.get("inflight", 0), st["ok"], st["fail"]) + _status_classes(st["statuses"])
+
+    def sample(self, ts=None):
+        """Write the record for the window ending now (or at `ts`)."""
+        st = self.stats
+        counters = self._counters()
+        delta = [max(0, c - p) for c, p in zip(counters, self._prev)]
+        self._prev = counters
+        hist = st["latency_hist"]
+        if hist is not self._hist:
+            # Swapped for a new window (continuous ramp): everything in it is new
+            self._hist, self._snap = hist, None
+        window = hist.since(self._snap)
+        self._snap = hist.snapshot()
+        lag = self.monitor.take_window_max() if self.monitor is not None else float("nan")
+        conns = open_connections(self.connector) if self.connector is not None else -1
+        record = RECORD.pack(ts or time.time(), self.level & 0xFFFF, self.worker & 0xFFFF, *delta,
+                             max(0, st.get("inflight", 0)), conns,
+                             window.percentile(50), window.percentile(99), window.max, lag)
+        os.write(self.fd, record)
+
+    async def _run(self):
+        while True:
+            next_second = math.floor(time.time()) + 1
+            await asyncio.sleep(next_second - time.time())
+            self.sample(next_second)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+        return self
+
+    def stop(self):
+        """Write the final partial second and close the file."""
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        if self.fd is not None:
+            self.sample()
+            os.close(self.fd)
+            self.fd = None